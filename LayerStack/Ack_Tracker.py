@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''
+Ack Tracker object: per packet ack state so that each sender only wakes up for its own ack
+'''
+
+from threading import Event, Lock
+
+class Ack_Tracker():
+    def __init__(self):
+        '''
+        Object to track the outstanding acks of a layer, keyed by any hashable (ex: (destination, pktno))
+        '''
+        self.lock = Lock()
+        self.waiting = {}   # key -> Event
+
+        # Measurements
+        self.n_acked = 0
+        self.n_unmatched = 0    # acks for keys nobody is waiting on (late or duplicate)
+
+    def expect(self, key):
+        '''
+        Method to register a packet that will wait for an ack, must be called before the packet is sent
+        :param key: hashable key of the packet
+        '''
+        with self.lock:
+            self.waiting[key] = Event()
+
+    def ack(self, key):
+        '''
+        Method to signal the ack of a packet
+        :param key: hashable key of the packet
+        :return: bool for if a sender was waiting on the key
+        '''
+        with self.lock:
+            event = self.waiting.pop(key, None)
+            if event is None:
+                self.n_unmatched += 1
+                return False
+            self.n_acked += 1
+        event.set()
+        return True
+
+    def wait(self, key, timeout):
+        '''
+        Method to wait for the ack of a packet
+        :param key: hashable key of the packet
+        :param timeout: float for the max time in seconds to wait
+        :return: bool for if the packet was acked
+        '''
+        with self.lock:
+            event = self.waiting.get(key)
+        if event is None:   # acked (and removed) already
+            return True
+        return event.wait(timeout)
+
+    def discard(self, key):
+        '''
+        Method to stop tracking a packet (acked, or given up on)
+        :param key: hashable key of the packet
+        '''
+        with self.lock:
+            self.waiting.pop(key, None)
+
+    def keys(self):
+        '''
+        Method to get the keys currently waiting for an ack
+        :return: list of keys
+        '''
+        with self.lock:
+            return list(self.waiting)
+
+    def __len__(self):
+        return len(self.waiting)
+
+
+class Duplicate_Filter():
+    def __init__(self, window=65536):
+        '''
+        Object to detect repeated sequence numbers in O(1) with bounded memory: a ring of seen flags over the last window seqs
+        :param window: int for the number of seqs behind the highest seen seq that are remembered, older seqs count as duplicates
+        '''
+        self.window = window
+        self.seen = bytearray(window)
+        self.high = -1      # highest seq seen
+
+    def check(self, seq):
+        '''
+        Method to mark a seq as seen
+        :param seq: int for the sequence number
+        :return: bool for if the seq is new (False for duplicates)
+        '''
+        if seq > self.high:
+            n_new = seq - self.high
+            if n_new >= self.window:    # jumped past the whole ring
+                self.seen[:] = bytes(self.window)
+            else:       # forget the seqs the ring slides past
+                start = (self.high + 1) % self.window
+                end = start + n_new
+                if end <= self.window:
+                    self.seen[start:end] = bytes(n_new)
+                else:
+                    self.seen[start:] = bytes(self.window - start)
+                    self.seen[:end - self.window] = bytes(end - self.window)
+            self.high = seq
+
+        elif self.high - seq >= self.window or self.seen[seq % self.window]:
+            return False
+
+        self.seen[seq % self.window] = 1
+        return True
+
+    def is_seen(self, seq):
+        '''
+        Method to look up a seq without marking it
+        :param seq: int for the sequence number
+        :return: bool for if the seq was seen (seqs older than the window count as seen)
+        '''
+        if seq > self.high:
+            return False
+        return self.high - seq >= self.window or self.seen[seq % self.window] == 1
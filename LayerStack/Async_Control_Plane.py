@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+'''
+Async Control Plane object: serves all control plane udp sockets from one asyncio event loop
+'''
+
+import asyncio
+from collections import deque
+
+from LayerStack.Control_Plane import Control_Plane
+
+class CP_Protocol(asyncio.DatagramProtocol):
+    def __init__(self, handle_packet):
+        '''
+        Datagram protocol passing every received control plane message to a handler
+        :param handle_packet: method taking the (bytes packet, tuple addr) of a datagram
+        '''
+        self.handle_packet = handle_packet
+
+    def datagram_received(self, data, addr):
+        self.handle_packet(data, addr)
+
+    def error_received(self, exc):
+        pass
+
+
+class Async_Control_Plane(Control_Plane):
+    def __init__(self, ip, poll_interval=0.05, **kwargs):
+        '''
+        Control plane multiplexing the l2, l4 and state ports on a single event loop thread
+        :param ip: string for the wifi ip address
+        :param poll_interval: float for the time in seconds between checks of the stop function
+        :param kwargs: Control_Plane arguments
+        '''
+        Control_Plane.__init__(self, ip, **kwargs)
+        self.poll_interval = poll_interval
+
+        self.loop = None
+        self.closed = None
+        self.shut_down = False      # transports closed, later sends are dropped
+        self.send_transport = None
+        self.broadcast_transport = None
+
+        self.pending = deque()      # (msg, addr) waiting for the next flush, addr None for broadcasts
+        self.flush_scheduled = False
+
+        # Measurements
+        self.n_flushes = 0
+        self.n_flushed = 0
+        self.n_dropped = 0          # messages sent after the shutdown
+
+    def run(self, l2_recv_ack, l4_recv_ack, state_recv, handle_get_state, stop, l2_recv_acks=None, l4_recv_acks=None):
+        '''
+        Method to run the event loop until stop() is true (replaces the listen_l2, listen_l4, listen_cc and ack flush threads)
+        :param l2_recv_ack: l2 method for a recived packet ack, None if the stack is not running
+        :param l4_recv_ack: l4 method for a recived packet ack, None if the stack is not running
+        :param state_recv: method (or coroutine function) to handle state messages
+        :param handle_get_state: method (or coroutine function) to handle state prompt messages
+        :param stop: method returning true/false to stop the thread
+        :param l2_recv_acks: l2 method for a list of recived packet acks
+        :param l4_recv_acks: l4 method for a list of recived (pktno, time sent) acks
+        '''
+        asyncio.run(self.serve(l2_recv_ack, l4_recv_ack, state_recv, handle_get_state, stop, l2_recv_acks, l4_recv_acks))
+
+    async def serve(self, l2_recv_ack, l4_recv_ack, state_recv, handle_get_state, stop, l2_recv_acks=None, l4_recv_acks=None):
+        '''
+        Coroutine to open the datagram endpoints and serve them until stop() is true or close() is called
+        '''
+        self.loop = asyncio.get_running_loop()
+        self.closed = asyncio.Event()
+
+        def on_l2(packet, addr):
+            acks = self.parse_l2_acks(packet)
+            source = addr[0].encode('utf-8')    # wifi ip of the acking node
+            if len(acks) > 1 and l2_recv_acks is not None:
+                l2_recv_acks(acks, source)
+            else:
+                for ack in acks:
+                    l2_recv_ack(ack, source)    # releases a waiting frame, cheap enough to run on the loop
+
+        def on_l4(packet, addr):
+            acks = self.parse_l4_acks(packet)
+            if len(acks) == 1:
+                self.dispatcher.submit(l4_recv_ack, *acks[0])  # rtt and congestion updates, keep off the loop
+            elif acks:
+                self.dispatch_batch(l4_recv_ack, l4_recv_acks, acks)
+
+        def on_cc(packet, addr):
+            self.handle_cc(packet, lambda *args: self.call_hook(state_recv, *args), lambda: self.call_hook(handle_get_state))
+
+        endpoints = []
+        if self.cc_recv is not None:
+            endpoints.append((self.cc_recv, on_cc))
+        if l2_recv_ack is not None and self.l2_recv is not None:
+            endpoints.append((self.l2_recv, on_l2))
+        if l4_recv_ack is not None and self.l4_recv is not None:
+            endpoints.append((self.l4_recv, on_l4))
+
+        transports = []
+        for sock, handler in endpoints:
+            transport, _ = await self.loop.create_datagram_endpoint(lambda handler=handler: CP_Protocol(handler), sock=sock)
+            transports.append(transport)
+
+        self.send_transport, _ = await self.loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=self.send_sock)
+        self.broadcast_transport, _ = await self.loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=self.broadcast_socket)
+        transports += [self.send_transport, self.broadcast_transport]
+
+        if self.ack_interval > 0:
+            self.loop.call_later(self.ack_interval, self.flush_acks_periodic)
+
+        try:
+            while not stop() and not self.closed.is_set():
+                try:
+                    await asyncio.wait_for(self.closed.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.flush_acks()
+            self.flush()
+            self.loop = None    # later sends go directly to the sockets until they are closed
+            self.flush()        # messages queued before the loop was cleared
+            for transport in transports:
+                transport.close()
+            self.shut_down = True
+
+    def flush_acks_periodic(self):
+        '''
+        Method to send the coalesced acks and reschedule itself every ack_interval (runs on the loop)
+        '''
+        self.flush_acks()
+        self.flush()
+        if self.loop is not None and not self.closed.is_set():
+            self.loop.call_later(self.ack_interval, self.flush_acks_periodic)
+
+    def call_hook(self, hook, *args):
+        '''
+        Method to call a handler on the loop, scheduling it as a task if it is a coroutine function
+        :param hook: method or coroutine function
+        :param args: arguments for the hook
+        '''
+        if asyncio.iscoroutinefunction(hook):
+            self.loop.create_task(hook(*args))
+        else:
+            hook(*args)
+
+    def run_coroutine(self, coro):
+        '''
+        Method to run a coroutine on the control plane loop from another thread
+        :param coro: coroutine to run
+        :return: concurrent.futures.Future for the coroutine result
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        '''
+        Method to stop the event loop from another thread without waiting for the next poll
+        '''
+        loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.closed.set)
+
+    def send(self, msg, addr):
+        '''
+        Method to queue a control plane message, all messages queued during one loop iteration are sent together
+        :param msg: bytes for the message
+        :param addr: tuple of (string ip, int port) for the destination
+        '''
+        self.queue_send(msg, addr)
+
+    def broadcast(self, msg):
+        '''
+        Method to queue a broadcast message on the state port
+        :param msg: bytes for the message
+        '''
+        self.queue_send(msg, None)
+
+    def queue_send(self, msg, addr):
+        '''
+        Method to add a message to the pending sends and wake the loop to flush them
+        :param msg: bytes for the message
+        :param addr: tuple of (string ip, int port) for the destination, None to broadcast
+        '''
+        if self.shut_down:
+            self.n_dropped += 1
+            return
+
+        loop = self.loop
+        if loop is None:    # loop not running, send directly
+            self.send_direct(msg, addr)
+            return
+
+        item = (bytes(msg), addr)
+        self.pending.append(item)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            try:
+                loop.call_soon_threadsafe(self.flush)
+            except RuntimeError:    # loop closed while queueing, take the message back and send it directly
+                self.flush_scheduled = False
+                try:
+                    self.pending.remove(item)
+                except ValueError:  # already flushed
+                    return
+                self.send_direct(msg, addr)
+
+    def send_direct(self, msg, addr):
+        '''
+        Method to send a message on the control plane sockets without the loop, counted as dropped if they are closed
+        :param msg: bytes for the message
+        :param addr: tuple of (string ip, int port) for the destination, None to broadcast
+        '''
+        try:
+            if addr is None:
+                Control_Plane.broadcast(self, msg)
+            else:
+                Control_Plane.send(self, msg, addr)
+        except OSError:     # sockets closed by the shutdown
+            self.n_dropped += 1
+
+    def flush(self):
+        '''
+        Method to send every pending message (runs on the loop)
+        '''
+        self.flush_scheduled = False
+        if self.shut_down:      # scheduled after the transports closed
+            self.n_dropped += len(self.pending)
+            self.pending.clear()
+            return
+        n_sent = 0
+        while self.pending:
+            msg, addr = self.pending.popleft()
+            if addr is None:
+                for broadcast_ip in self.broadcast_ips:
+                    self.broadcast_transport.sendto(msg, (broadcast_ip, self.cc_port))
+            else:
+                self.send_transport.sendto(msg, addr)
+            n_sent += 1
+        if n_sent:
+            self.n_flushes += 1
+            self.n_flushed += n_sent
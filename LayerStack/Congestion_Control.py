@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+'''
+Congestion Control objects: l4 window controllers driven by ack rtts and losses, the window is turned into a pacing rate for layer 5
+'''
+
+from threading import Lock
+from time import time
+
+INITIAL_WINDOW = 4.0    # packets
+MIN_WINDOW = 1.0
+SRTT_GAIN = 0.125
+
+class Congestion_Controller():
+    def __init__(self, packet_size, initial_rtt=1.0, max_window=10000.0):
+        '''
+        Base controller: keeps the window (packets in flight per rtt), the smoothed and min rtt, and turns them into a rate
+        Child classes set the window in increase (per ack) and decrease (per loss event)
+        :param packet_size: int for the byte length of one l4 packet
+        :param initial_rtt: float for the rtt in seconds assumed before the first sample
+        :param max_window: float for the max window in packets
+        '''
+        self.packet_bits = 8.0*packet_size
+        self.max_window = max_window
+        self.lock = Lock()
+
+        self.window = INITIAL_WINDOW
+        self.ssthresh = max_window      # slow start until the first loss
+        self.srtt = initial_rtt
+        self.min_rtt = None
+        self.last_decrease = 0.0
+
+        # Measurements
+        self.n_acks = 0
+        self.n_losses = 0
+        self.n_decreases = 0
+
+    @property
+    def rate(self):
+        '''
+        Pacing rate in bps: one window per smoothed rtt
+        '''
+        return self.window*self.packet_bits/self.srtt
+
+    def update_rtt(self, rtt):
+        if self.min_rtt is None:
+            self.srtt = rtt
+            self.min_rtt = rtt
+        else:
+            self.srtt += SRTT_GAIN*(rtt - self.srtt)
+            self.min_rtt = min(self.min_rtt, rtt)
+
+    def on_ack(self, rtt):
+        '''
+        Method to feed the rtt of a packet acked on its first transmission
+        :param rtt: float for the rtt in seconds
+        '''
+        with self.lock:
+            self.n_acks += 1
+            self.update_rtt(rtt)
+            self.increase(rtt)
+            self.window = min(self.max_window, max(MIN_WINDOW, self.window))
+
+    def on_loss(self, now=None):
+        '''
+        Method to signal a lost packet (timeout or ack gap), the window is cut at most once per rtt
+        :param now: float for the current time, read if None
+        '''
+        if now is None:
+            now = time()
+        with self.lock:
+            self.n_losses += 1
+            if now - self.last_decrease < self.srtt:    # same congestion event
+                return
+            self.last_decrease = now
+            self.n_decreases += 1
+            self.decrease()
+            self.window = min(self.max_window, max(MIN_WINDOW, self.window))
+
+    def increase(self, rtt):
+        '''
+        Method to grow the window on an ack (lock held), to be overridden by child classes
+        :param rtt: float for the rtt in seconds
+        '''
+        return None
+
+    def decrease(self):
+        '''
+        Method to shrink the window on a loss (lock held), halves it
+        '''
+        self.window = self.window/2
+        self.ssthresh = self.window
+
+    def stats(self):
+        '''
+        Method to get the controller state
+        :return: dict of the window, rtts, rate and counters
+        '''
+        return {"window": round(self.window, 2), "srtt": round(self.srtt, 6), "min_rtt": None if self.min_rtt is None else round(self.min_rtt, 6),
+                "rate": round(self.rate), "acks": self.n_acks, "losses": self.n_losses, "decreases": self.n_decreases}
+
+
+class Aimd_Controller(Congestion_Controller):
+    def __init__(self, packet_size, initial_rtt=1.0, max_window=10000.0, increase=1.0, decrease=0.5):
+        '''
+        Loss based controller: slow start, then additive increase of increase packets per rtt and multiplicative decrease on loss
+        :param packet_size: int for the byte length of one l4 packet
+        :param initial_rtt: float for the rtt in seconds assumed before the first sample
+        :param max_window: float for the max window in packets
+        :param increase: float for the window growth in packets per rtt
+        :param decrease: float for the window factor kept on a loss
+        '''
+        Congestion_Controller.__init__(self, packet_size, initial_rtt, max_window)
+        self.increase_step = increase
+        self.decrease_factor = decrease
+
+    def increase(self, rtt):
+        if self.window < self.ssthresh:
+            self.window += 1.0
+        else:
+            self.window += self.increase_step/self.window
+
+    def decrease(self):
+        self.window = self.window*self.decrease_factor
+        self.ssthresh = self.window
+
+
+class Delay_Controller(Congestion_Controller):
+    def __init__(self, packet_size, initial_rtt=1.0, max_window=10000.0, alpha=2.0, beta=4.0):
+        '''
+        Delay based controller (Vegas): keeps between alpha and beta packets queued along the path, estimated from rtt - min rtt
+        Reacts to relay queues building up before they overflow, losses still halve the window
+        :param packet_size: int for the byte length of one l4 packet
+        :param initial_rtt: float for the rtt in seconds assumed before the first sample
+        :param max_window: float for the max window in packets
+        :param alpha: float for the queued packets below which the window grows
+        :param beta: float for the queued packets above which the window shrinks
+        '''
+        Congestion_Controller.__init__(self, packet_size, initial_rtt, max_window)
+        self.alpha = alpha
+        self.beta = beta
+        self.next_update = 0.0
+
+    def increase(self, rtt):
+        now = time()
+        if now < self.next_update:      # adjust once per rtt
+            return
+        self.next_update = now + self.srtt
+        queued = self.window*(1.0 - self.min_rtt/self.srtt)
+        if self.window < self.ssthresh and queued < self.alpha:
+            self.window *= 2
+        elif queued < self.alpha:
+            self.window += 1.0
+        elif queued > self.beta:
+            self.ssthresh = min(self.ssthresh, self.window)
+            self.window -= 1.0
+
+
+CONTROLLERS = {'aimd': Aimd_Controller, 'delay': Delay_Controller}
+
+def make_controller(name, packet_size, initial_rtt=1.0):
+    '''
+    Method to build a congestion controller by name
+    :param name: string for the controller ('aimd' or 'delay'), None for no congestion control
+    :param packet_size: int for the byte length of one l4 packet
+    :param initial_rtt: float for the rtt in seconds assumed before the first sample
+    :return: Congestion_Controller object or None
+    '''
+    if name is None or name == 'none':
+        return None
+    if not name in CONTROLLERS:
+        raise ValueError("unknown congestion controller " + str(name) + ", expected one of " + str(list(CONTROLLERS)))
+    return CONTROLLERS[name](packet_size, initial_rtt=initial_rtt)
@@ -3,8 +3,11 @@
 '''
 Control Plane object: Runs alongside layer stack to receive l2 and l4 acks and state commands
 '''
-from threading import Thread
+from LayerStack.Dispatcher import Dispatcher
+from LayerStack.Headers import ARQ_FRAG_BITS, ARQ_FRAG_MASK
 from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_REUSEADDR, SO_BROADCAST
+from threading import Lock
+from time import sleep
 from enum import Enum
 import struct
 
@@ -14,6 +17,17 @@ class CP_Codes(Enum):
  
     STATE=struct.pack('ss', b'-', b'3')         # application layer state message
     GET_STATE=struct.pack('ss', b'-', b'5')     # application layer state message prompt message
+
+    L2_ACK_BATCH=struct.pack('ss', b'-', b'6')  # several layer 2 acks [base arq seq, sack bitmap, frame index for each set bit]
+    L4_ACK_BATCH=struct.pack('ss', b'-', b'7')  # several layer 4 acks [base pktno, sack bitmap, time sent for each set bit]
+
+    NEIGHBOR_REPORT=struct.pack('ss', b'-', b'8')   # neighbor discovery report [probe delivery ratios, route costs]
+
+ACK_SPAN = 64                           # pktnos covered by one sack bitmap
+L2_BATCH = struct.Struct('=hQ')         # base arq seq, bitmap (bit ii acks seq base+ii)
+FRAME_INDEX = struct.Struct('B')
+L4_BATCH = struct.Struct('=QQ')
+TIME_SENT = struct.Struct('d')
     
 
 def get_post_ip(ip):
@@ -30,37 +44,162 @@ def get_post_ip(ip):
     return ip[index:]
 
 
+def encode_ack_batch(code, header, acks):
+    '''
+    Method to encode acks as [code, base pktno, sack bitmap, extra bytes of each acked pktno] messages
+    :param code: bytes for the control plane code
+    :param header: struct.Struct for the base pktno and bitmap
+    :param acks: dict of int pktno -> bytes extra data (b'' for none)
+    :return: list of bytes messages, one per ACK_SPAN pktnos
+    '''
+    msgs = []
+    pktnos = sorted(acks)
+    ii = 0
+    while ii < len(pktnos):
+        base = pktnos[ii]
+        bitmap = 0
+        extra = []
+        while ii < len(pktnos) and pktnos[ii] - base < ACK_SPAN:
+            bitmap |= 1 << (pktnos[ii] - base)
+            extra.append(acks[pktnos[ii]])
+            ii += 1
+        msgs.append(code + header.pack(base, bitmap) + b''.join(extra))
+    return msgs
+
+def decode_ack_batch(packet, header):
+    '''
+    Method to decode the pktnos of an ack batch message
+    :param packet: bytes for the message without the control code
+    :param header: struct.Struct for the base pktno and bitmap
+    :return: list of int acked pktnos in increasing order
+    '''
+    base, bitmap = header.unpack_from(packet)
+    pktnos = []
+    offset = 0
+    while bitmap:
+        if bitmap & 1:
+            pktnos.append(base + offset)
+        bitmap >>= 1
+        offset += 1
+    return pktnos
+
+
+def encode_l2_ack_batch(pktnos):
+    '''
+    Method to encode l2 acks with the sack bitmap over the arq seq of the mac pktno [seq | frame index], so consecutive selective
+    repeat frames take consecutive bits, and the frame index of each acked seq after the bitmap
+    :param pktnos: iterable of int acked mac pktnos
+    :return: list of bytes messages
+    '''
+    by_seq = {}
+    repeated = []   # stop-and-wait pktnos are frame indexes with seq 0, a second ack of the same seq goes in another batch
+    for pktno in pktnos:
+        seq = pktno >> ARQ_FRAG_BITS
+        if seq in by_seq:
+            repeated.append(pktno)
+        else:
+            by_seq[seq] = FRAME_INDEX.pack(pktno & ARQ_FRAG_MASK)
+    msgs = encode_ack_batch(CP_Codes.L2_ACK_BATCH.value, L2_BATCH, by_seq)
+    if repeated:
+        msgs += encode_l2_ack_batch(repeated)
+    return msgs
+
+def decode_l2_ack_batch(packet):
+    '''
+    Method to decode the mac pktnos of an l2 ack batch message
+    :param packet: bytes for the message without the control code
+    :return: list of int acked mac pktnos
+    '''
+    seqs = decode_ack_batch(packet, L2_BATCH)
+    return [(seq << ARQ_FRAG_BITS) | packet[L2_BATCH.size + ii] for ii, seq in enumerate(seqs)]
+
+
+class Ack_Aggregator():
+    def __init__(self):
+        '''
+        Object to collect acks per destination until the next flush
+        '''
+        self.lock = Lock()
+        self.pending = {}   # addr -> {pktno: extra bytes}
+
+    def add(self, addr, pktno, extra=b''):
+        '''
+        Method to add an ack to the pending batch of a destination (repeated pktnos are only sent once)
+        :param addr: tuple of (string ip, int port) for the destination
+        :param pktno: int for the acked pktno
+        :param extra: bytes to send along with the pktno
+        '''
+        with self.lock:
+            if not addr in self.pending:
+                self.pending[addr] = {}
+            self.pending[addr][pktno] = extra
+
+    def drain(self):
+        '''
+        Method to take all pending acks
+        :return: dict of addr -> {pktno: extra bytes}
+        '''
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        return pending
+
+
 class Control_Plane():
-    def __init__(self, ip, l2_port=55557, l4_port=55558, cc_port= 55559, wifi_ip_pre=b'192.168.10.', num_nodes=6):
+    def __init__(self, ip, l2_port=55557, l4_port=55558, cc_port= 55559, wifi_ip_pre=b'192.168.10.', num_nodes=6, dispatcher=None, ack_interval=0.0, listen=('l2', 'l4', 'cc'), bind_ip='', broadcast_ips=None):
         '''
         Object to send and recieve control plane messages (outside of layer stack)
         :param ip: string for the wifi ip address
         :param port_recv: int for the udp message listener port
         :param num_nodes: int for the number of nodes to wait for states from
+        :param dispatcher: Dispatcher object to run the ack callbacks on, a private one is created if None
+        :param ack_interval: float for the time in seconds to coalesce acks into one message per destination, 0 sends every ack immediately
+        :param listen: tuple of the ports to bind ('l2', 'l4', 'cc'), when the stack is split over processes each port is bound by one of them
+        :param bind_ip: string for the address to listen on, '' for all interfaces (several nodes on one machine need their own address)
+        :param broadcast_ips: list of strings for the addresses a broadcast is sent to one by one, None for the wifi broadcast address
         '''
+        self.ack_interval = ack_interval
+        self.l2_acks = Ack_Aggregator()
+        self.l4_acks = Ack_Aggregator()
+        self.neighbor_recv = None   # method to handle neighbor reports, they are ignored if None
+
+        # Measurements
+        self.n_acks = 0         # acks given to send_l2_ack/send_l4_ack
+        self.n_ack_msgs = 0     # ack messages sent
+
+        if dispatcher is None:
+            dispatcher = Dispatcher(name="control_plane", overflow='inline')
+        self.dispatcher = dispatcher
+
         # Setup Sockets
         self.send_sock = socket(AF_INET, SOCK_DGRAM)
+        if bind_ip:     # receivers tell the acking node apart by the source address
+            self.send_sock.bind((bind_ip, 0))
 
-        self.l2_recv = socket(AF_INET, SOCK_DGRAM)
-        self.l2_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.l2_recv = None
+        self.l4_recv = None
+        self.cc_recv = None
 
-        self.l4_recv = socket(AF_INET, SOCK_DGRAM)
-        self.l4_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-
-        self.cc_recv = socket(AF_INET, SOCK_DGRAM)
-        self.cc_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-        self.cc_recv.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
+        if 'l2' in listen:
+            self.l2_recv = socket(AF_INET, SOCK_DGRAM)
+            self.l2_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self.l2_recv.bind((bind_ip, l2_port))
 
+        if 'l4' in listen:
+            self.l4_recv = socket(AF_INET, SOCK_DGRAM)
+            self.l4_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self.l4_recv.bind((bind_ip, l4_port))
 
+        if 'cc' in listen:
+            self.cc_recv = socket(AF_INET, SOCK_DGRAM)
+            self.cc_recv.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self.cc_recv.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
+            self.cc_recv.bind((bind_ip, cc_port))
 
         self.broadcast_socket = socket(AF_INET, SOCK_DGRAM)
         self.broadcast_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
         self.broadcast_socket.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
 
-        self.l2_recv.bind(('', l2_port))
-        self.l4_recv.bind(('', l4_port))
-        self.cc_recv.bind(('', cc_port))
-
 
         self.ip = ip
         self.l2_port = l2_port
@@ -68,53 +207,74 @@ class Control_Plane():
         self.cc_port = cc_port
 
         self.wifi_ip_pre = wifi_ip_pre
+        self.broadcast_ips = ['255.255.255.255'] if broadcast_ips is None else list(broadcast_ips)
 
     def broadcast_state(self, message):
         '''
         Method to broadcast message to all nodes
         :param message: string or convertable to string to broadcast
         '''
-        self.broadcast_socket.sendto((CP_Codes.STATE.value + str(message).encode('utf-8')), ('255.255.255.255', self.cc_port))
+        self.broadcast(CP_Codes.STATE.value + str(message).encode('utf-8'))
+
+    def broadcast_neighbors(self, report):
+        '''
+        Method to broadcast the neighbor discovery report of this node
+        :param report: bytes for the report (see Neighbor_Table.build_report)
+        '''
+        self.broadcast(CP_Codes.NEIGHBOR_REPORT.value + report)
 
     def get_state_msgs(self):
         '''
         Method to propmt other nodes to send state messages
         '''
-        self.broadcast_socket.sendto((CP_Codes.GET_STATE.value), ('255.255.255.255', self.cc_port))              
+        self.broadcast(CP_Codes.GET_STATE.value)
+
+    def broadcast(self, msg):
+        '''
+        Method to broadcast a control plane message on the state port
+        :param msg: bytes for the message
+        '''
+        for broadcast_ip in self.broadcast_ips:
+            self.broadcast_socket.sendto(msg, (broadcast_ip, self.cc_port))
+
+    def send(self, msg, addr):
+        '''
+        Method to send a control plane message to one node
+        :param msg: bytes for the message
+        :param addr: tuple of (string ip, int port) for the destination
+        '''
+        self.send_sock.sendto(msg, addr)
 
-    def listen_l2(self, l2_recv_ack, stop):
+    def listen_l2(self, l2_recv_ack, stop, l2_recv_acks=None):
         '''
         Method to listen for l2 acks
         :param l2_recv_ack: l2 method for a recived packet ack
         :param stop: method returning true/false to stop the thread
+        :param l2_recv_acks: l2 method for a list of recived packet acks, l2_recv_ack is called per ack if None
         '''
         while not stop():
             packet, addr = self.l2_recv.recvfrom(1024)
-            control_code = packet[0:2] 
-            # print(packet, control_code == CP_Codes.STATE.value)
-            packet = packet[2:]
-            if control_code == CP_Codes.L2_ACK.value:
-                (ack,) = struct.unpack('h', packet[0:2])
-                a = Thread(target=l2_recv_ack, args=(ack,))
-                a.start()
+            acks = self.parse_l2_acks(packet)
+            source = addr[0].encode('utf-8')    # wifi ip of the acking node
+            if len(acks) == 1:
+                self.dispatcher.submit(l2_recv_ack, acks[0], source)
+            elif acks:
+                self.dispatch_batch(l2_recv_ack, l2_recv_acks, acks, source)
 
-    def listen_l4(self, l4_recv_ack, stop):
+    def listen_l4(self, l4_recv_ack, stop, l4_recv_acks=None):
         '''
         Method to listen for l4 acks
         :param l4_recv_ack: l4 method for a recived packet ack
         :param stop: method returning true/false to stop the thread
+        :param l4_recv_acks: l4 method for a list of recived (pktno, time sent) acks, l4_recv_ack is called per ack if None
         '''
         while not stop():
             packet, addr = self.l4_recv.recvfrom(1024)
-            control_code = packet[0:2] 
-            # print(packet, control_code == CP_Codes.STATE.value)
-            packet = packet[2:]
-
-            if control_code == CP_Codes.L4_ACK.value:
-                (ack,)=struct.unpack('L', packet[0:8])
-                (time_sent,) = struct.unpack('d', packet[8:16])
-                a = Thread(target=l4_recv_ack, args=(ack,time_sent, ))  # create thread to handle the recv funciton
-                a.start()
+            acks = self.parse_l4_acks(packet)
+            if len(acks) == 1:
+                self.dispatcher.submit(l4_recv_ack, *acks[0])    # handle the recv function on the dispatcher
+            elif acks:
+                self.dispatch_batch(l4_recv_ack, l4_recv_acks, acks)
 
     def listen_cc(self, state_recv, handle_get_state, stop):
         '''
@@ -124,17 +284,84 @@ class Control_Plane():
         '''
         while not stop():
             packet, addr = self.cc_recv.recvfrom(1024)
-            control_code = packet[0:2] 
-            # print(packet, control_code == CP_Codes.STATE.value)
-            packet = packet[2:]
-
-            if control_code == CP_Codes.STATE.value:
-                # [node index #],[location index #],[power index #]
-                msg = packet.decode('utf-8').split(',')
-                # print('RCVD STATE:', int(msg[0]), int(msg[1]), int(msg[2]))
-                state_recv(int(msg[0]), int(msg[1]), int(msg[2]))
-            elif control_code == CP_Codes.GET_STATE.value:
-                handle_get_state()
+            self.handle_cc(packet, state_recv, handle_get_state)
+
+    def dispatch_batch(self, recv_ack, recv_acks, acks, source=None):
+        '''
+        Method to hand a batch of acks to the layer on the dispatcher
+        :param recv_ack: layer method for one ack
+        :param recv_acks: layer method for a list of acks, or None
+        :param acks: list of acks (ints for l2, (pktno, time sent) tuples for l4)
+        :param source: bytes for the wifi ip of the acking node, passed to the l2 methods
+        '''
+        if recv_acks is not None:
+            if source is None:
+                self.dispatcher.submit(recv_acks, acks)
+            else:
+                self.dispatcher.submit(recv_acks, acks, source)
+        else:
+            for ack in acks:
+                if isinstance(ack, tuple):
+                    self.dispatcher.submit(recv_ack, *ack)
+                else:
+                    self.dispatcher.submit(recv_ack, ack, source)
+
+    def parse_l2_acks(self, packet):
+        '''
+        Method to decode an l2 ack or l2 ack batch message
+        :param packet: bytes for the received control plane message
+        :return: list of int acked l2 pktnos, empty if not an l2 ack
+        '''
+        control_code = packet[0:2] 
+        if control_code == CP_Codes.L2_ACK.value:
+            (ack,) = struct.unpack('h', packet[2:4])
+            return [ack]
+        elif control_code == CP_Codes.L2_ACK_BATCH.value:
+            return decode_l2_ack_batch(packet[2:])
+        return []
+
+    def parse_l4_acks(self, packet):
+        '''
+        Method to decode an l4 ack or l4 ack batch message
+        :param packet: bytes for the received control plane message
+        :return: list of (int acked l4 pktno, float time sent) tuples, empty if not an l4 ack
+        '''
+        control_code = packet[0:2] 
+        if control_code == CP_Codes.L4_ACK.value:
+            (ack,)=struct.unpack('L', packet[2:10])
+            (time_sent,) = struct.unpack('d', packet[10:18])
+            return [(ack, time_sent)]
+        elif control_code == CP_Codes.L4_ACK_BATCH.value:
+            pktnos = decode_ack_batch(packet[2:], L4_BATCH)
+            offset = 2 + L4_BATCH.size
+            acks = []
+            for pktno in pktnos:
+                (time_sent,) = TIME_SENT.unpack_from(packet, offset)
+                acks.append((pktno, time_sent))
+                offset += TIME_SENT.size
+            return acks
+        return []
+
+    def handle_cc(self, packet, state_recv, handle_get_state):
+        '''
+        Method to decode a state message and call the matching handler
+        :param packet: bytes for the received control plane message
+        :param state_recv: method to handle state messages
+        :param handle_get_state: method to handle state prompt messages
+        '''
+        control_code = packet[0:2] 
+        # print(packet, control_code == CP_Codes.STATE.value)
+        packet = packet[2:]
+
+        if control_code == CP_Codes.STATE.value:
+            # [node index #],[location index #],[power index #]
+            msg = packet.decode('utf-8').split(',')
+            # print('RCVD STATE:', int(msg[0]), int(msg[1]), int(msg[2]))
+            state_recv(int(msg[0]), int(msg[1]), int(msg[2]))
+        elif control_code == CP_Codes.GET_STATE.value:
+            handle_get_state()
+        elif control_code == CP_Codes.NEIGHBOR_REPORT.value and self.neighbor_recv is not None:
+            self.neighbor_recv(packet)
 
     def send_l2_ack(self, pktno, mac_ip):
         '''
@@ -143,8 +370,14 @@ class Control_Plane():
         :param mac_ip: bytes for the destination mac ip
         '''
         pc_ip = self.wifi_ip_pre + get_post_ip(mac_ip)
+        self.n_acks += 1
+        if self.ack_interval > 0:     # coalesce until the next flush
+            (ack,) = struct.unpack('h', pktno)
+            self.l2_acks.add((pc_ip.decode('utf-8'), self.l2_port), ack)
+            return
         ack_msg = CP_Codes.L2_ACK.value + pktno
-        self.send_sock.sendto(ack_msg, (pc_ip.decode('utf-8'), self.l2_port))
+        self.send(ack_msg, (pc_ip.decode('utf-8'), self.l2_port))
+        self.n_ack_msgs += 1
         # print('L2 ACK', pc_ip.decode('utf-8'), self.port, ack_msg)
 
     def send_l4_ack(self, pktno, pc_ip, time_sent):
@@ -154,7 +387,44 @@ class Control_Plane():
         :param pc_ip: bytes for the destination wifi ip
         :param time_sent: bytes for the tagged time sent on the l4 packet originating from this node
         '''
+        self.n_acks += 1
+        if self.ack_interval > 0:     # coalesce until the next flush
+            (ack,) = struct.unpack('L', pktno)
+            self.l4_acks.add((pc_ip.decode('utf-8'), self.l4_port), ack, bytes(time_sent))
+            return
         ack_msg = CP_Codes.L4_ACK.value + pktno + time_sent
-        self.send_sock.sendto(ack_msg, (pc_ip.decode('utf-8'), self.l4_port))
+        self.send(ack_msg, (pc_ip.decode('utf-8'), self.l4_port))
+        self.n_ack_msgs += 1
 
+    def flush_acks(self):
+        '''
+        Method to send the coalesced acks, one message per destination per ACK_SPAN pktnos (arq seqs for l2)
+        '''
+        for addr, acks in self.l2_acks.drain().items():
+            if len(acks) == 1:  # plain ack message
+                (pktno,) = acks
+                msgs = [CP_Codes.L2_ACK.value + struct.pack('h', pktno)]
+            else:
+                msgs = encode_l2_ack_batch(acks)
+            for msg in msgs:
+                self.send(msg, addr)
+                self.n_ack_msgs += 1
 
+        for addr, acks in self.l4_acks.drain().items():
+            if len(acks) == 1:
+                ((pktno, time_sent),) = acks.items()
+                msgs = [CP_Codes.L4_ACK.value + struct.pack('L', pktno) + time_sent]
+            else:
+                msgs = encode_ack_batch(CP_Codes.L4_ACK_BATCH.value, L4_BATCH, acks)
+            for msg in msgs:
+                self.send(msg, addr)
+                self.n_ack_msgs += 1
+
+    def ack_flush_loop(self, stop):
+        '''
+        Method to flush the coalesced acks every ack_interval
+        :param stop: method returning true/false to stop the thread
+        '''
+        while not stop():
+            sleep(self.ack_interval)
+            self.flush_acks()
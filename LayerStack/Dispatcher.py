@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+'''
+Dispatcher object: bounded worker pool for ack and logging callbacks (instead of a thread per call)
+'''
+
+import traceback
+from threading import Thread, Lock
+from queue import Queue, Empty, Full
+
+class Dispatcher():
+    def __init__(self, num_workers=1, max_queue=4096, name="dispatcher", overflow='drop', debug=False):
+        '''
+        Object to run short callbacks on a fixed set of worker threads
+        :param num_workers: int for the number of worker threads (1 keeps callbacks in submission order)
+        :param max_queue: int for the max number of pending callbacks
+        :param name: string for the dispatcher name used in the thread names
+        :param overflow: string for what to do with callbacks submitted to a full queue, 'drop' them or run them 'inline' on the
+            submitting thread (for ack callbacks, where a dropped ack turns into a retransmission)
+        :param debug: bool for printing the traceback of every callback exception (only the first one is printed otherwise)
+        '''
+        if overflow not in ('drop', 'inline'):
+            raise ValueError("overflow must be 'drop' or 'inline', not " + str(overflow))
+        self.name = name
+        self.overflow = overflow
+        self.debug = debug
+        self.tasks = Queue(max_queue)
+        self.stopped = False
+
+        # Measurements
+        self.stats_lock = Lock()
+        self.n_submitted = 0
+        self.n_dropped = 0
+        self.n_inline = 0
+        self.n_errors = 0
+        self.max_depth = 0
+
+        self.workers = []
+        for ii in range(num_workers):
+            worker = Thread(target=self.work, name=name+"_"+str(ii), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, callback, *args):
+        '''
+        Method to queue a callback to run on a worker thread
+        :param callback: function to call
+        :param args: arguments to pass to the callback
+        :return: bool for if the callback was queued or run inline (False if the queue is full and it was dropped)
+        '''
+        try:
+            self.tasks.put_nowait((callback, args))
+        except Full:
+            if self.overflow == 'inline':
+                with self.stats_lock:
+                    self.n_inline += 1
+                self.run(callback, args)
+                return True
+            with self.stats_lock:
+                self.n_dropped += 1
+            return False
+
+        depth = self.tasks.qsize()
+        with self.stats_lock:
+            self.n_submitted += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def work(self):
+        '''
+        Worker loop, runs queued callbacks until stopped
+        '''
+        while not self.stopped:
+            try:
+                callback, args = self.tasks.get(True, 0.1)
+            except Empty:
+                continue
+            self.run(callback, args)
+
+    def run(self, callback, args):
+        '''
+        Method to run one callback, counting its exceptions instead of raising them (the traceback of the first one is printed)
+        :param callback: function to call
+        :param args: tuple of arguments to pass to the callback
+        '''
+        try:
+            callback(*args)
+        except Exception:
+            with self.stats_lock:
+                self.n_errors += 1
+                first = self.n_errors == 1
+            if first or self.debug:
+                print(self.name, "dispatcher: exception in", getattr(callback, "__name__", callback))
+                traceback.print_exc()
+
+    def stats(self):
+        '''
+        Method to get the dispatcher queue metrics
+        :return: dict of the current queue depth, high watermark, and callback counters (inline: run on the submitting thread when full)
+        '''
+        with self.stats_lock:
+            return {"depth": self.tasks.qsize(), "max_depth": self.max_depth, "submitted": self.n_submitted, "dropped": self.n_dropped, "inline": self.n_inline, "errors": self.n_errors}
+
+    def stop(self):
+        '''
+        Method to stop the worker threads
+        '''
+        self.stopped = True
+        for worker in self.workers:
+            worker.join(0.2)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+'''
+Forwarding Table object: layer 3 routes keyed by the padded destination pc address as it appears in the header
+'''
+
+from LayerStack.Network_Layer import address_table
+
+class Forwarding_Table():
+    def __init__(self):
+        '''
+        Table of destination pc -> next hop usrp, one dict lookup per packet with the header field as the key
+        '''
+        self.routes = {}    # padded destination pc -> [next hop usrp, n packets, n bytes]
+
+        # Measurements
+        self.n_no_route = 0
+
+    def add_route(self, destination, next_hop):
+        '''
+        Method to add or replace a route, can be called while the layer is running
+        :param destination: bytes or string for the destination pc address
+        :param next_hop: bytes or string for the next hop usrp address
+        '''
+        if isinstance(destination, str):
+            destination = bytes(destination, "utf-8")
+        if isinstance(next_hop, str):
+            next_hop = bytes(next_hop, "utf-8")
+        key = address_table.pad(destination)
+        old = self.routes.get(key)
+        self.routes[key] = [next_hop, 0, 0] if old is None else [next_hop, old[1], old[2]]    # single assignment, readers see the old or the new route
+
+    def remove_route(self, destination):
+        '''
+        Method to remove the route to a destination
+        :param destination: bytes or string for the destination pc address
+        '''
+        if isinstance(destination, str):
+            destination = bytes(destination, "utf-8")
+        self.routes.pop(address_table.pad(destination), None)
+
+    def next_hop(self, destination):
+        '''
+        Method to get the next hop of a destination without counting a packet
+        :param destination: bytes for the (unpadded) destination pc address
+        :return: bytes for the next hop usrp address, None if there is no route
+        '''
+        route = self.routes.get(address_table.pad(destination))
+        return None if route is None else route[0]
+
+    def destinations(self):
+        '''
+        Method to list the destinations with a route
+        :return: list of bytes destination pc addresses
+        '''
+        return [address_table.unpad(key) for key in list(self.routes)]
+
+    def load(self, my_config):
+        '''
+        Method to add the routes of a node config
+        :param my_config: Node_Config object with its routes set (configure_hops/add_route)
+        '''
+        for destination, next_hop in my_config.routes:
+            if next_hop.usrp_ip:
+                self.add_route(destination.pc_ip, next_hop.usrp_ip)
+
+    def lookup(self, padded_destination, length=0):
+        '''
+        Method to get the next hop of a packet and count it on its route
+        :param padded_destination: bytes for the padded destination pc address from the header
+        :param length: int for the packet byte length
+        :return: bytes for the next hop usrp address, None if there is no route
+        '''
+        route = self.routes.get(padded_destination)
+        if route is None:
+            self.n_no_route += 1
+            return None
+        route[1] += 1
+        route[2] += length
+        return route[0]
+
+    def stats(self):
+        '''
+        Method to get the per route counters
+        :return: dict of destination -> dict of next hop, packets and bytes
+        '''
+        stats = {address_table.unpad(key): {"next_hop": route[0], "packets": route[1], "bytes": route[2]} for key, route in list(self.routes.items())}
+        stats["no_route"] = self.n_no_route
+        return stats
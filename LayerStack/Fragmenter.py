@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+'''
+Fragmenter and Reassembler objects: split l4 packets into l2 frames and rebuild them in preallocated per source buffers
+'''
+
+from LayerStack.Headers import L2_HEADER, L2_HEADER_LEN
+from time import time
+
+class Fragmenter():
+    def __init__(self, num_frames=1, chunk_size=158):
+        '''
+        Splits an l4 packet into num_frames l2 frames, frame indexes start at 1
+        :param num_frames: int for the number of l2 frames in one l4 packet
+        :param chunk_size: int for the byte length of the l4 data in one l2 frame
+        '''
+        self.num_frames = num_frames
+        self.chunk_size = chunk_size
+        self.max_size = num_frames*chunk_size
+
+    def fragment(self, l4_view, source, destination):
+        '''
+        Method to build the l2 frames of an l4 packet, each frame is one allocation and one copy of its chunk
+        :param l4_view: memoryview of the l4 packet
+        :param source: bytes for the padded packet source
+        :param destination: bytes for the padded packet destination
+        :return: list of bytearray l2 frames
+        '''
+        length = len(l4_view)
+        if length > self.max_size:
+            raise ValueError("l4 packet of " + str(length) + " bytes does not fit in " + str(self.num_frames) + " frames of " + str(self.chunk_size) + " bytes")
+        frames = []
+        start = 0
+        for frame_index in range(1, self.num_frames+1):
+            end = min(start + self.chunk_size, length)
+            frame = bytearray(L2_HEADER_LEN + end - start)
+            L2_HEADER.pack_into(frame, 0, frame_index, source, destination)
+            frame[L2_HEADER_LEN:] = l4_view[start:end]
+            frames.append(frame)
+            start = end
+        return frames
+
+
+class Reassembler():
+    def __init__(self, num_frames=1, chunk_size=158, timeout=1.0):
+        '''
+        Rebuilds l4 packets from l2 frames arriving in any order, one packet in progress per source.
+        A repeated frame index with new data starts the next packet, the incomplete one is dropped.
+        Each chunk is copied once to its offset in the source's buffer, a complete buffer is handed up and replaced.
+        :param num_frames: int for the number of l2 frames in one l4 packet
+        :param chunk_size: int for the byte length of the l4 data in one l2 frame
+        :param timeout: float for the time in seconds before an incomplete packet is dropped
+        '''
+        self.num_frames = num_frames
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.flows = {}     # source -> [buffer, memoryview of it, received flags, n received, length of the last frame, time of the first frame]
+
+        # Measurements
+        self.n_complete = 0
+        self.n_duplicate = 0
+        self.n_invalid = 0
+        self.n_expired = 0      # incomplete packets dropped on timeout
+        self.n_dropped = 0      # incomplete packets dropped for a new packet or by the caller
+
+    def new_flow(self, now):
+        buffer = bytearray(self.num_frames*self.chunk_size)
+        return [buffer, memoryview(buffer), bytearray(self.num_frames), 0, 0, now]
+
+    def add(self, source, frame_index, chunk, now=None):
+        '''
+        Method to add one frame to the packet of a source
+        :param source: bytes for the source address
+        :param frame_index: int for the frame index in the l4 packet (1 to num_frames)
+        :param chunk: bytes-like frame payload
+        :param now: float for the current time, read if None
+        :return: the complete l4 packet (bytes-like), None while it is incomplete
+        '''
+        num_frames = self.num_frames
+        length = len(chunk)
+        if frame_index < 1 or frame_index > num_frames or length > self.chunk_size:
+            self.n_invalid += 1
+            return None
+        if num_frames == 1:   # nothing to rebuild, pass the chunk up without copying
+            self.n_complete += 1
+            return chunk
+
+        if now is None:
+            now = time()
+        flow = self.flows.get(source)
+        if flow is None:
+            flow = self.new_flow(now)
+            self.flows[source] = flow
+        elif flow[3] == 0:
+            flow[5] = now
+        elif now - flow[5] > self.timeout:
+            self.n_expired += 1
+            self.reset(flow, now)
+        elif flow[2][frame_index-1]:
+            start = (frame_index-1)*self.chunk_size
+            if flow[1][start:start+length] == chunk:    # retransmitted copy
+                self.n_duplicate += 1
+                return None
+            self.n_dropped += 1     # frame of the next packet, the current one lost a frame
+            self.reset(flow, now)
+
+        start = (frame_index-1)*self.chunk_size
+        flow[1][start:start+length] = chunk     # memoryview slice assignment, about half the cost of the bytearray one
+        flow[2][frame_index-1] = 1
+        flow[3] += 1
+        if frame_index == num_frames:
+            flow[4] = length
+        if flow[3] < num_frames:
+            return None
+
+        packet = flow[0]
+        length = (num_frames-1)*self.chunk_size + flow[4]
+        self.flows[source] = self.new_flow(now)     # the complete buffer now belongs to the upper layer
+        self.n_complete += 1
+        return packet if length == len(packet) else memoryview(packet)[:length]
+
+    def reset(self, flow, now):
+        '''
+        Method to clear the frames of a flow, keeping its buffer
+        :param flow: list state of a source
+        :param now: float for the time of the first frame of the new packet
+        '''
+        flow[2][:] = bytes(self.num_frames)
+        flow[3] = 0
+        flow[5] = now
+
+    def drop(self, source):
+        '''
+        Method to drop the incomplete packet of a source (a frame of it will not arrive)
+        :param source: bytes for the source address
+        '''
+        flow = self.flows.get(source)
+        if flow is not None and flow[3] > 0:
+            self.n_dropped += 1
+            self.reset(flow, flow[5])
+
+    def expire(self, now=None):
+        '''
+        Method to drop the incomplete packets older than timeout
+        :param now: float for the current time, read if None
+        :return: int for the number of packets dropped
+        '''
+        if now is None:
+            now = time()
+        n_expired = 0
+        for flow in self.flows.values():
+            if flow[3] > 0 and now - flow[5] > self.timeout:
+                self.reset(flow, now)
+                n_expired += 1
+        self.n_expired += n_expired
+        return n_expired
+
+    def stats(self):
+        '''
+        Method to get the reassembly metrics
+        :return: dict of the packet and frame counters
+        '''
+        return {"complete": self.n_complete, "in_progress": sum(1 for flow in self.flows.values() if flow[3] > 0), "duplicate": self.n_duplicate,
+                "invalid": self.n_invalid, "expired": self.n_expired, "dropped": self.n_dropped}
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+'''
+Packet header definitions: precompiled structs to parse headers once and rewrite them in place
+l2 frame:  [mac pktno (2) | mac source (20) | mac destination (20) | chunk]
+l4 packet: [l4 pktno (8) | pc source (20) | pc destination (20) | time sent (8) | payload]
+'''
+
+import struct
+
+L2_HEADER = struct.Struct('h20s20s')     # mac pktno, mac source, mac destination
+L4_HEADER = struct.Struct('L20s20sd')    # l4 pktno, pc source, pc destination, time sent
+L2_PKTNO = struct.Struct('h')
+L4_PKTNO = struct.Struct('L')
+ADDRESSES = struct.Struct('20s20s')      # source, destination (20s packs with NUL padding)
+TIME_SENT = struct.Struct('d')
+
+L2_HEADER_LEN = L2_HEADER.size
+L4_HEADER_LEN = L4_HEADER.size
+
+# arq: the mac pktno field of data frames carries [per destination seq (11 bits) | frame index in the l4 packet (4 bits)]
+ARQ_FRAG_BITS = 4
+ARQ_FRAG_MASK = (1 << ARQ_FRAG_BITS) - 1
+ARQ_SEQ_SPACE = 1 << (15 - ARQ_FRAG_BITS)
+
+
+def build_l2(pktno, source, destination, chunk):
+    '''
+    Method to build an l2 frame in a single preallocated buffer
+    :param pktno: int for the mac pktno
+    :param source: bytes for the (padded or unpadded) source address
+    :param destination: bytes for the (padded or unpadded) destination address
+    :param chunk: bytes-like chunk of the l4 packet
+    :return: bytearray for the l2 frame
+    '''
+    frame = bytearray(L2_HEADER_LEN + len(chunk))
+    L2_HEADER.pack_into(frame, 0, pktno, source, destination)
+    frame[L2_HEADER_LEN:] = chunk
+    return frame
+
+def rewrite_addresses(frame, source, destination):
+    '''
+    Method to overwrite the l2 source and destination addresses of a frame in place
+    :param frame: bytearray l2 frame
+    :param source: bytes for the new source address
+    :param destination: bytes for the new destination address
+    '''
+    ADDRESSES.pack_into(frame, L2_PKTNO.size, source, destination)
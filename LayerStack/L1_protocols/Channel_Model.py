@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''
+Channel Model object: frame loss of an emulated radio link from the node locations and the tx gain
+log distance path loss + log normal fading per frame + logistic packet error rate curve of the snr
+'''
+
+from math import log10, exp, pi, hypot
+from statistics import NormalDist
+from Utils.Transforms import global_to_NED
+
+LIGHT_SPEED = 3.0e8
+THERMAL_NOISE = -174.0      # dBm/Hz
+N_FADING_POINTS = 16        # fading quantiles averaged by delivery_ratio
+
+class Channel_Model():
+    def __init__(self, exponent=3.5, ref_distance=1.0, fading=4.0, noise_figure=8.0, snr_50=6.0, slope=1.5, tx_dbm_at_zero=-45.0, tx_db_per_gain=50.0, scalar=2.0):
+        '''
+        Channel of the emulated radios, defaults are a starting point to calibrate against field logs
+        The tx power follows the DQN power states: normalized gain 0.5, 0.6, 0.7 -> -20, -15, -10 dBm
+        :param exponent: float for the path loss exponent (2 for free space)
+        :param ref_distance: float for the distance in meters of the free space reference loss, closer nodes are clamped to it
+        :param fading: float for the standard deviation in dB of the per frame fading
+        :param noise_figure: float for the receiver noise figure in dB
+        :param snr_50: float for the snr in dB at which half of the frames are lost
+        :param slope: float for the steepness of the packet error rate curve in 1/dB
+        :param tx_dbm_at_zero: float for the tx power in dBm at normalized gain 0.0
+        :param tx_db_per_gain: float for the tx power increase in dB per unit of normalized gain
+        :param scalar: float for the distance in meters between grid points (see global_to_NED)
+        '''
+        self.exponent = exponent
+        self.ref_distance = ref_distance
+        self.fading = fading
+        self.noise_figure = noise_figure
+        self.snr_50 = snr_50
+        self.slope = slope
+        self.tx_dbm_at_zero = tx_dbm_at_zero
+        self.tx_db_per_gain = tx_db_per_gain
+        self.scalar = scalar
+        self.fading_points = [NormalDist(0.0, fading).inv_cdf((ii + 0.5)/N_FADING_POINTS) for ii in range(N_FADING_POINTS)] if fading > 0 else [0.0]
+
+    def position(self, global_index):
+        '''
+        Method to get the position of a grid location
+        :param global_index: int for the global location index
+        :return: list of floats for [meters north, meters east]
+        '''
+        return global_to_NED(global_index, self.scalar)
+
+    def tx_power(self, tx_gain):
+        '''
+        Method to get the tx power of a normalized gain
+        :param tx_gain: float for the normalized tx gain (0.0-1.0)
+        :return: float for the tx power in dBm
+        '''
+        return self.tx_dbm_at_zero + self.tx_db_per_gain*tx_gain
+
+    def path_loss(self, distance, freq):
+        '''
+        Method to get the mean path loss of a link
+        :param distance: float for the link distance in meters
+        :param freq: float for the carrier frequency in Hz
+        :return: float for the path loss in dB
+        '''
+        distance = max(distance, self.ref_distance)
+        ref_loss = 20*log10(4*pi*self.ref_distance*freq/LIGHT_SPEED)
+        return ref_loss + 10*self.exponent*log10(distance/self.ref_distance)
+
+    def snr(self, tx_position, rx_position, tx_gain, freq, bw):
+        '''
+        Method to get the mean snr of a link
+        :param tx_position: list of floats for the transmitter [meters north, meters east]
+        :param rx_position: list of floats for the receiver [meters north, meters east]
+        :param tx_gain: float for the normalized tx gain
+        :param freq: float for the carrier frequency in Hz
+        :param bw: float for the bandwidth in Hz
+        :return: float for the snr in dB
+        '''
+        distance = hypot(tx_position[0] - rx_position[0], tx_position[1] - rx_position[1])
+        noise = THERMAL_NOISE + 10*log10(bw) + self.noise_figure
+        return self.tx_power(tx_gain) - self.path_loss(distance, freq) - noise
+
+    def per(self, snr):
+        '''
+        Method to get the packet error rate of a frame received at an snr
+        :param snr: float for the snr in dB
+        :return: float for the probability that the frame is lost (0.0-1.0)
+        '''
+        x = self.slope*(snr - self.snr_50)
+        if x > 50:
+            return 0.0
+        return 1.0/(1.0 + exp(x))
+
+    def frame_lost(self, tx_position, rx_position, tx_gain, freq, bw, random):
+        '''
+        Method to draw the fading and the loss of one frame
+        :param tx_position: list of floats for the transmitter [meters north, meters east]
+        :param rx_position: list of floats for the receiver [meters north, meters east]
+        :param tx_gain: float for the normalized tx gain
+        :param freq: float for the carrier frequency in Hz
+        :param bw: float for the bandwidth in Hz
+        :param random: Random object of the receiving radio
+        :return: bool, True if the frame is lost
+        '''
+        snr = self.snr(tx_position, rx_position, tx_gain, freq, bw)
+        if self.fading > 0:
+            snr += random.gauss(0.0, self.fading)
+        return random.random() < self.per(snr)
+
+    def delivery_ratio(self, tx_index, rx_index, tx_gain, freq, bw=500e3):
+        '''
+        Method to get the expected fraction of frames delivered on a link, averaged over the fading without running the radios
+        :param tx_index: int for the global location index of the transmitter
+        :param rx_index: int for the global location index of the receiver
+        :param tx_gain: float for the normalized tx gain
+        :param freq: float for the carrier frequency in Hz
+        :param bw: float for the bandwidth in Hz
+        :return: float for the delivery ratio (0.0-1.0)
+        '''
+        snr = self.snr(self.position(tx_index), self.position(rx_index), tx_gain, freq, bw)
+        return 1.0 - sum(self.per(snr + point) for point in self.fading_points)/len(self.fading_points)
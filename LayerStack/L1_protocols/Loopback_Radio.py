@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+
+'''
+Loopback Radio objects: emulated usrp for running the stack without radios
+Each node's Loopback_Radio speaks the same zmq ports to Layer1 as TRX_ODFM_USRP, and publishes its frames on a shared
+Loopback_Medium tagged with its tx frequency. A radio hears the frames sent on its rx frequency, after the configured
+delay, loss (fixed, and from a Channel_Model of the node locations and tx gain), rate limit and duplication.
+Run this file to start a standalone medium for nodes in separate processes.
+'''
+
+from threading import Thread, Condition
+from collections import deque
+from argparse import ArgumentParser
+from random import Random
+from time import time, sleep
+import struct
+import zmq
+
+MEDIUM_IN_PORT = 55570      # radios publish here
+MEDIUM_OUT_PORT = 55571     # radios subscribe here
+TX_INFO = struct.Struct('ddd')    # tx gain, meters north, meters east of the transmitter
+
+def freq_topic(freq):
+    '''
+    Method to get the medium topic of a frequency, terminated so one frequency is not a prefix of another
+    :param freq: int for the frequency in Hz
+    :return: bytes for the topic
+    '''
+    return bytes(str(int(freq)), "utf-8") + b';'
+
+
+class Loopback_Medium():
+    def __init__(self, in_port=MEDIUM_IN_PORT, out_port=MEDIUM_OUT_PORT, host='127.0.0.1'):
+        '''
+        Shared medium: forwards every frame published by a radio to the radios subscribed to its frequency
+        :param in_port: int for the port the radios publish to
+        :param out_port: int for the port the radios subscribe to
+        :param host: string for the address to bind
+        '''
+        self.context = zmq.Context()
+        self.in_socket = self.context.socket(zmq.XSUB)
+        self.in_socket.bind("tcp://"+host+":"+str(in_port))
+        self.out_socket = self.context.socket(zmq.XPUB)
+        self.out_socket.bind("tcp://"+host+":"+str(out_port))
+        self.stopped = False
+        self.thread = None
+
+        # Measurements
+        self.n_forwarded = 0
+
+    def run(self, stop):
+        '''
+        Method to forward frames and subscriptions between the radios
+        :param stop: function returning true/false to stop the thread
+        '''
+        poller = zmq.Poller()
+        poller.register(self.in_socket, zmq.POLLIN)
+        poller.register(self.out_socket, zmq.POLLIN)
+        while not stop():
+            for socket, _ in poller.poll(10):
+                if socket is self.in_socket:
+                    self.out_socket.send_multipart(self.in_socket.recv_multipart())
+                    self.n_forwarded += 1
+                else:   # (un)subscription of a radio
+                    self.in_socket.send_multipart(self.out_socket.recv_multipart())
+
+    def start(self):
+        '''
+        Method to run the medium in a thread
+        '''
+        self.thread = Thread(target=self.run, args=(lambda : self.stopped, ), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        '''
+        Method to stop the medium and close its sockets
+        '''
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join(1.0)
+        self.in_socket.close(0)
+        self.out_socket.close(0)
+        self.context.term()
+
+
+class Emulated_Usrp():
+    def __init__(self, freq, bw, gain):
+        '''
+        Settings of one emulated usrp block, with the getters/setters Layer1 uses on the uhd source and sink
+        :param freq: float for the center frequency in Hz
+        :param bw: float for the bandwidth in Hz
+        :param gain: float for the normalized gain (0.0-1.0)
+        '''
+        self.freq = freq
+        self.bw = bw
+        self.gain = gain
+
+    def get_center_freq(self):
+        return self.freq
+
+    def get_bandwidth(self):
+        return self.bw
+
+    def get_normalized_gain(self):
+        return self.gain
+
+    def set_normalized_gain(self, gain, chan=0):
+        self.gain = gain
+
+    def get_gain(self):
+        return 0.0
+
+    def get_usrp_info(self):
+        return self
+
+    def vals(self):
+        return ["loopback", "loopback", "loopback"]
+
+
+class Loopback_Radio():
+    def __init__(self, input_port_num="55555", output_port_num="55556", rx_bw=0.5e6, rx_freq=1e9, rx_gain=0.8, tx_bw=0.5e6, tx_freq=1e9, tx_gain=0.8,
+                 address=b'', delay=0.0, loss=0.0, rate=0.0, duplicate=0.0, frame_size=200, seed=None, channel=None, location=None,
+                 medium_host='127.0.0.1', medium_in_port=MEDIUM_IN_PORT, medium_out_port=MEDIUM_OUT_PORT):
+        '''
+        Emulated radio with the interface of TRX_ODFM_USRP (start, stop, wait and the uhd source/sink gains)
+        :param input_port_num: string for the port Layer1 publishes frames to transmit on
+        :param output_port_num: string for the port received frames are published to Layer1 on
+        :param rx_bw: float for the rx bandwidth in Hz, sets the channel noise
+        :param rx_freq: float for the rx frequency in Hz, frames sent on it are heard
+        :param rx_gain: float for the normalized rx gain
+        :param tx_bw: float for the tx bandwidth in Hz (reported only)
+        :param tx_freq: float for the tx frequency in Hz
+        :param tx_gain: float for the normalized tx gain, sent with each frame
+        :param address: bytes or string for the usrp address of the node, its own frames are not heard
+        :param delay: float for the propagation and processing delay in seconds added to every received frame
+        :param loss: float for the probability that a received frame is dropped (0.0-1.0)
+        :param rate: float for the transmit rate in bps, each message takes its air time to send, 0 for no limit
+        :param duplicate: float for the probability that a received frame is delivered twice (0.0-1.0)
+        :param frame_size: int for the byte length of one l2 frame, batched messages are split to lose frames independently
+        :param seed: int for the random seed of the loss and duplication draws, None for a random one
+        :param channel: Channel_Model object for the loss from the node positions and tx gain, None for the fixed loss only
+        :param location: int for the global location index of the node (see global_to_NED), used by the channel
+        :param medium_host: string for the address of the Loopback_Medium
+        :param medium_in_port: int for the port the medium receives frames on
+        :param medium_out_port: int for the port the medium sends frames on
+        '''
+        if isinstance(address, str):
+            address = bytes(address, "utf-8")
+        self.address = address
+        self.delay = delay
+        self.loss = loss
+        self.rate = rate
+        self.duplicate = duplicate
+        self.frame_size = frame_size
+        self.random = Random(seed)
+        self.channel = channel
+        self.position = [0.0, 0.0]
+        if channel is not None and location is not None:
+            self.position = channel.position(location)
+
+        self.uhd_usrp_source_0 = Emulated_Usrp(rx_freq, rx_bw, rx_gain)
+        self.uhd_usrp_sink_0 = Emulated_Usrp(tx_freq, tx_bw, tx_gain)
+        self.tx_topic = freq_topic(tx_freq)
+
+        self.context = zmq.Context()
+        self.layer1_in = self.context.socket(zmq.SUB)      # frames from Layer1 to transmit
+        self.layer1_in.connect("tcp://127.0.0.1:"+str(input_port_num))
+        self.layer1_in.setsockopt(zmq.SUBSCRIBE, b'')
+        self.layer1_out = self.context.socket(zmq.PUB)     # received frames to Layer1
+        self.layer1_out.bind("tcp://127.0.0.1:"+str(output_port_num))
+        self.medium_out = self.context.socket(zmq.PUB)
+        self.medium_out.connect("tcp://"+medium_host+":"+str(medium_in_port))
+        self.medium_in = self.context.socket(zmq.SUB)
+        self.medium_in.connect("tcp://"+medium_host+":"+str(medium_out_port))
+        self.medium_in.setsockopt(zmq.SUBSCRIBE, freq_topic(rx_freq))
+
+        self.pending = deque()      # (delivery time, frame), in arrival order since the delay is fixed
+        self.pending_access = Condition()
+        self.tx_free = 0.0          # time the emulated transmitter finishes the current message
+        self.stopped = False
+        self.threads = []
+
+        # Measurements
+        self.n_sent = 0
+        self.n_heard = 0
+        self.n_lost = 0
+        self.n_duplicated = 0
+        self.n_delivered = 0
+
+    def start(self):
+        '''
+        Method to start the transmit, receive and delivery threads
+        '''
+        stop = lambda : self.stopped
+        self.threads = [Thread(target=target, args=(stop, ), daemon=True) for target in [self.transmit, self.receive, self.deliver]]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        '''
+        Method to stop the threads
+        '''
+        self.stopped = True
+        with self.pending_access:
+            self.pending_access.notify_all()
+
+    def wait(self):
+        '''
+        Method to wait for the threads to stop and close the sockets
+        '''
+        for thread in self.threads:
+            thread.join(1.0)
+        for socket in [self.layer1_in, self.layer1_out, self.medium_out, self.medium_in]:
+            socket.close(0)
+        self.context.term()
+
+    def set_location(self, global_index):
+        '''
+        Method to move the emulated node, sent with each frame so the receivers' channels see the new distance
+        :param global_index: int for the global location index
+        '''
+        if self.channel is not None:
+            self.position = self.channel.position(global_index)
+
+    def set_position(self, position):
+        '''
+        Method to move the emulated node to a position in meters
+        :param position: list of floats for [meters north, meters east]
+        '''
+        self.position = [float(position[0]), float(position[1])]
+
+    def frame_lost(self, tx_gain, tx_position):
+        '''
+        Method to draw the loss of one received frame
+        :param tx_gain: float for the normalized tx gain of the transmitter
+        :param tx_position: list of floats for the transmitter [meters north, meters east]
+        :return: bool, True if the frame is lost
+        '''
+        if self.loss > 0 and self.random.random() < self.loss:
+            return True
+        if self.channel is not None:
+            rx = self.uhd_usrp_source_0
+            return self.channel.frame_lost(tx_position, self.position, tx_gain, rx.freq, rx.bw, self.random)
+        return False
+
+    def transmit(self, stop):
+        '''
+        Method to send the messages from Layer1 on the medium, held for their air time when the rate is limited
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            if self.layer1_in.poll(10) == 0:
+                continue
+            msg = self.layer1_in.recv()
+            if self.rate > 0:
+                now = time()
+                self.tx_free = max(now, self.tx_free) + 8.0*len(msg)/self.rate
+                sleep(max(0.0, self.tx_free - now))
+            self.medium_out.send_multipart([self.tx_topic, self.address, TX_INFO.pack(self.uhd_usrp_sink_0.gain, self.position[0], self.position[1]), msg])
+            self.n_sent += 1
+
+    def receive(self, stop):
+        '''
+        Method to hear the frames on the rx frequency, drawing the loss and duplication of each frame
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            if self.medium_in.poll(10) == 0:
+                continue
+            _, transmitter, tx_info, msg = self.medium_in.recv_multipart()
+            if transmitter == self.address:
+                continue
+            tx_gain, north, east = TX_INFO.unpack(tx_info)
+            deliver_time = time() + self.delay
+
+            frames = []
+            for ii in range(0, len(msg), self.frame_size):
+                self.n_heard += 1
+                if self.frame_lost(tx_gain, [north, east]):
+                    self.n_lost += 1
+                    continue
+                frame = msg[ii:ii+self.frame_size]
+                frames.append(frame)
+                if self.duplicate > 0 and self.random.random() < self.duplicate:
+                    self.n_duplicated += 1
+                    frames.append(frame)
+
+            if frames:
+                with self.pending_access:
+                    for frame in frames:
+                        self.pending.append((deliver_time, frame))
+                    self.pending_access.notify()
+
+    def deliver(self, stop):
+        '''
+        Method to publish the received frames to Layer1 once their delay has passed
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            with self.pending_access:
+                while not self.pending and not stop():
+                    self.pending_access.wait(0.1)
+                if not self.pending:
+                    continue
+                deliver_time, frame = self.pending[0]
+                wait_time = deliver_time - time()
+                if wait_time > 0:
+                    self.pending_access.wait(wait_time)
+                    continue
+                self.pending.popleft()
+            self.layer1_out.send(frame)
+            self.n_delivered += 1
+
+    def stats(self):
+        '''
+        Method to get the emulated radio counters
+        :return: dict of the messages sent and the frames heard, lost, duplicated and delivered
+        '''
+        return {"sent": self.n_sent, "heard": self.n_heard, "lost": self.n_lost, "duplicated": self.n_duplicated, "delivered": self.n_delivered}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--inp', type=int, default=MEDIUM_IN_PORT, help='medium input port')
+    parser.add_argument('--onp', type=int, default=MEDIUM_OUT_PORT, help='medium output port')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to bind')
+    options = parser.parse_args()
+
+    medium = Loopback_Medium(in_port=options.inp, out_port=options.onp, host=options.host)
+    print("Loopback medium on ports", options.inp, options.onp)
+    try:
+        medium.run(lambda : False)
+    except KeyboardInterrupt:
+        print("Forwarded", medium.n_forwarded, "messages")
+        medium.close()
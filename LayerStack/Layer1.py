@@ -4,23 +4,32 @@
 Layer 1 object: Physical layer 
 '''
 
-from LayerStack.L1_protocols.TRX_ODFM_USRP import TRX_ODFM_USRP
 from LayerStack.Network_Layer import Network_Layer
-import signal, time, sys, pmt, zmq, os, struct
+from LayerStack.Ring_Buffer import Ring_Buffer
+import signal, time, sys, zmq, os, struct
+from queue import Empty
 from numpy import byte, frombuffer
 from argparse import ArgumentParser
    
 class Layer1(Network_Layer):
-    def __init__(self, mynode, input_port='55555', output_port='55556', debug=False):
+    def __init__(self, mynode, input_port='55555', output_port='55556', batch_size=1, duplicate=True, frame_size=200, emulator=None, debug=False):
         '''
         Object to send and receive bytes via uarp radios through tcp connections to GNU radio object
         :param mynode: Node_Config object for the current node USRP configuration information
         :param input_port: string for the input tcp port of the GNU radio object
         :param output_port: string for the output port of the GNU radio object 
-        :param debug: bool for debug outputs or not
+        :param batch_size: int for the max number of frames sent in one zmq message / received per poll
+        :param duplicate: bool to transmit every frame twice
+        :param frame_size: int for the byte length of one l2 frame, used to split received messages holding several frames
+        :param emulator: dict of Loopback_Radio settings (delay, loss, rate, duplicate, seed, channel...) to emulate the usrp, None to use the usrp
+        :param debug: bool for debug outputs (prints every frame) or not
         '''
         Network_Layer.__init__(self, "layer_1", debug=debug)
 
+        self.batch_size = max(1, int(batch_size))
+        self.duplicate = duplicate
+        self.frame_size = frame_size
+
         send_context = zmq.Context()
         self.send_socket = send_context.socket(zmq.PUB)
         self.send_socket.bind("tcp://127.0.0.1:"+str(input_port))
@@ -35,7 +44,12 @@ class Layer1(Network_Layer):
         self.n_recv = 0
 
         # USRP Object
-        self.tb = TRX_ODFM_USRP(input_port_num=str(input_port), output_port_num=str(output_port), rx_bw=int(mynode.rx_bw), rx_freq=int(mynode.rx_freq), rx_gain=mynode.rx_gain, tx_bw=int(mynode.tx_bw), tx_freq=int(mynode.tx_freq), tx_gain=mynode.tx_gain)
+        if emulator is not None:    # same zmq ports and gain interface, no gnu radio or usrp needed
+            from LayerStack.L1_protocols.Loopback_Radio import Loopback_Radio
+            self.tb = Loopback_Radio(input_port_num=str(input_port), output_port_num=str(output_port), rx_bw=int(mynode.rx_bw), rx_freq=int(mynode.rx_freq), rx_gain=mynode.rx_gain, tx_bw=int(mynode.tx_bw), tx_freq=int(mynode.tx_freq), tx_gain=mynode.tx_gain, address=mynode.usrp_ip, location=mynode.location_index, frame_size=frame_size, **emulator)
+        else:
+            from LayerStack.L1_protocols.TRX_ODFM_USRP import TRX_ODFM_USRP
+            self.tb = TRX_ODFM_USRP(input_port_num=str(input_port), output_port_num=str(output_port), rx_bw=int(mynode.rx_bw), rx_freq=int(mynode.rx_freq), rx_gain=mynode.rx_gain, tx_bw=int(mynode.tx_bw), tx_freq=int(mynode.tx_freq), tx_gain=mynode.tx_gain)
         def sig_handler(sig=None, frame=None):
             self.tb.stop()
             self.tb.wait()
@@ -89,29 +103,66 @@ class Layer1(Network_Layer):
             print('Invalid Gain', gain)
     
     
+    def set_location(self, global_index):
+        '''
+        Method to move the node on the emulated radio channel, nothing to do with the usrp
+        :param global_index: int for the global location index
+        '''
+        if hasattr(self.tb, 'set_location'):
+            self.tb.set_location(global_index)
+
     def pass_up(self, stop):
         '''
-        Method to pass bytes up to Layer 2
+        Method to pass bytes up to Layer 2, draining up to batch_size messages per poll
         :param stop: function returning true/false to stop the thread
         '''
         while not stop():
             if self.recv_socket.poll(10) != 0:      # check if msg in socket
-                msg = self.recv_socket.recv()
-                received_pkt = frombuffer(msg, dtype=byte, count=-1)
-                self.up_queue.put(received_pkt.tobytes(), True)
-                received_pkt=None
-                print(msg)
+                for ii in range(self.batch_size):
+                    try:
+                        msg = self.recv_socket.recv(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+
+                    if len(msg) > self.frame_size:  # several frames in one message
+                        msg_view = memoryview(msg)
+                        frames = [msg_view[jj:jj+self.frame_size] for jj in range(0, len(msg), self.frame_size)]
+                        if isinstance(self.up_queue, Ring_Buffer):
+                            self.up_queue.put_batch(frames)
+                        else:
+                            for frame in frames:
+                                self.up_queue.put(frame, True)
+                        self.n_recv += len(frames)
+                    else:
+                        self.up_queue.put(msg, True)
+                        self.n_recv += 1
+
+                    if self.debug:
+                        print(msg)
 
 
     def pass_down(self, stop):
         '''
-        Method to pass bytes to GNU radio object
+        Method to pass bytes to GNU radio object, sending up to batch_size queued frames in one message
         :param stop: function returning true/false to stop the thread
         '''
         while not stop():
-            msg = self.prev_down_queue.get(True)    #  get message from previous layer down queue
-            print(msg)
-            self.send_socket.send(msg+msg) # send 2 messages
+            batch = [self.prev_down_queue.get(True)]    #  get message from previous layer down queue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.prev_down_queue.get_nowait())
+                except Empty:
+                    break
+
+            if self.duplicate:
+                msg = b''.join([frame for frame in batch for copy in (0, 1)])  # send 2 of each frame
+            else:
+                msg = b''.join(batch)
+
+            if self.debug:
+                print(msg)
+            self.send_socket.send(msg)
+            self.n_sent += len(batch)
 
 
 if __name__ == '__main__':
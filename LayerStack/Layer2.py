@@ -5,14 +5,22 @@ Layer 2 object: Mac address layer (Datalink)
 '''
 
 from LayerStack.Network_Layer import Network_Layer
+from LayerStack.Headers import L2_HEADER, L2_HEADER_LEN, L2_PKTNO, L4_PKTNO, ADDRESSES, build_l2, ARQ_FRAG_BITS, ARQ_FRAG_MASK, ARQ_SEQ_SPACE
+from LayerStack.Dispatcher import Dispatcher
+from LayerStack.Ack_Tracker import Ack_Tracker
+from LayerStack.Fragmenter import Reassembler
+from LayerStack.Rtt_Estimator import Rtt_Estimator
+from LayerStack.Control_Plane import get_post_ip
 from enum import Enum 
-from threading import  Event, Thread
+from threading import  Event, Condition
+from queue import Empty
 from time import time
 import struct
 
-l2_ack = Event()
 l2_control = Event()
 
+ND_BROADCAST = b'255.255.255.255'   # destination of neighbor discovery probes
+
 class L2_ENUMS(Enum):
     MSG = 1
     ACK = -2
@@ -21,15 +29,21 @@ class L2_ENUMS(Enum):
 
 
 class Layer2(Network_Layer):
-    def __init__(self, mac_ip, send_ack=None, udp_acks=True, num_frames=1, timeout=0.1, n_retrans=9, debug=False):
+    def __init__(self, mac_ip, send_ack=None, udp_acks=True, num_frames=1, timeout=0.1, n_retrans=9, dispatcher=None, arq_window=1, frame_size=200, adaptive_timeout=True, neighbor_table=None, relay=None, debug=False):
         '''
         Layer 2 network layer object
         :param mac_ip: string for the usrp mac address fo the current node
         :param send_ack: method to send udp acks via wifi
         :param udp_acks: bool to use udp acks via wifi
         :param num_frames: int for the number of l2 frames in one l4 packet
-        :param timeout: float for the time in seconds to wait for a l2 packet ack
+        :param timeout: float for the time in seconds to wait for a l2 packet ack, the initial rto when adaptive_timeout
         :param n_retrans: int for the numbre of retranmission before packet tranmssion failure
+        :param dispatcher: Dispatcher object to send the wifi acks on, a private one is created if None
+        :param arq_window: int for the number of unacked frames per destination, 1 for stop-and-wait, >1 for selective repeat
+        :param frame_size: int for the byte length of one l2 frame
+        :param adaptive_timeout: bool to set the ack timeout of each neighbor from its measured rtt
+        :param neighbor_table: Neighbor_Table object to record the probes heard, None to ignore probes
+        :param relay: method (padded l4 destination, frame length) -> next hop usrp or None, to forward the frames of relayed packets as they arrive, None to reassemble every packet (ignored for stop-and-wait with num_frames > 1)
         :param debug: bool for debug outputs or not
         '''  
         Network_Layer.__init__(self, "layer_2", debug=debug)
@@ -41,10 +55,36 @@ class Layer2(Network_Layer):
 
         self.send_ack_wifi = send_ack
         self.udp_acks = udp_acks
-
-        self.mac_pkt_dict = {}
-        self.up_pkt = {}
-        self.unacked_packet = 0
+        if dispatcher is None:
+            dispatcher = Dispatcher(name="layer_2", overflow='inline', debug=debug)
+        self.dispatcher = dispatcher
+
+        self.frame_size = frame_size
+        self.reassembler = Reassembler(num_frames, frame_size - L2_HEADER_LEN, timeout=num_frames*(n_retrans + 1)*timeout)    # frames of one l4 packet per source
+        self.acks = Ack_Tracker()   # stop-and-wait: (final ip byte(s) of the destination, mac pktno [seq | frame index]) -> ack event
+        self.sw_seq = {}            # stop-and-wait: final ip byte(s) of the destination -> seq of the next frame
+        self.adaptive_timeout = adaptive_timeout
+        self.rtt = Rtt_Estimator(timeout, min_rto=0.005, max_rto=max(1.0, timeout))    # final ip byte(s) of the neighbor -> rto
+        self.neighbor_table = neighbor_table
+        self.relay = relay
+        self.relay_state = {}   # source mac -> [padded l4 destination (None: reassembled here), last frame index, last forwarded frame]
+
+        # Selective repeat arq
+        self.arq_window = min(arq_window, ARQ_SEQ_SPACE//2)
+        if num_frames > ARQ_FRAG_MASK:
+            raise ValueError("layer 2 supports at most " + str(ARQ_FRAG_MASK) + " frames per l4 packet")
+        if self.arq_window == 1 and num_frames > 1:     # stop-and-wait drops the rest of a failed l4 packet from the down queue, which needs
+            self.relay = None                           # the frames of a packet queued together, cut-through queues them as they arrive
+        self.arq_lock = Condition()
+        self.arq_tx = {}        # destination mac -> {'base': oldest unacked seq, 'next_seq': int, 'outstanding': {seq: [frame, deadline, n_sent, time first sent]}, 'neighbor': final ip byte(s)}
+        self.arq_rx = {}        # source mac -> {'expected': int, 'buffer': {seq: (frame index, chunk, time received)}}
+        self.post_to_mac = {}   # final ip byte(s) -> destination mac, to match wifi acks to a window
+        self.hole_timeout = (n_retrans + 1)*timeout     # time before the receiver gives up on a missing frame
+
+        # Measurements
+        self.n_retransmits = 0
+        self.n_failed = 0
+        self.n_cut_through = 0
 
         self.l2_size = 0        
 
@@ -61,88 +101,107 @@ class Layer2(Network_Layer):
         else:                   # use wifi to send acks
             self.send_ack_wifi(pktno, dest)
         
-    def recv_ack(self, pktno):
+    def rto(self, neighbor):
+        '''
+        Method to get the ack timeout of a neighbor
+        :param neighbor: bytes for the final ip byte(s) of the neighbor
+        :return: float for the timeout in seconds
+        '''
+        if self.adaptive_timeout:
+            return self.rtt.rto(neighbor)
+        return self.timeout
+
+    def send_probe(self):
+        '''
+        Method to broadcast a neighbor discovery probe over the radio, probes are not acked or retransmitted
+        '''
+        probe = self.neighbor_table.next_probe()
+        frame = bytearray(max(L2_HEADER_LEN + len(probe), self.frame_size))    # full frame, layer 1 splits batched messages every frame_size bytes
+        L2_HEADER.pack_into(frame, 0, L2_ENUMS.NEIGHBOR_DISCOVERY.value, self.mac_ip, ND_BROADCAST)
+        frame[L2_HEADER_LEN:] = probe
+        self.down_queue.put(frame, True)
+
+    def recv_probe(self, mac_packet, mac_source_ip):
+        '''
+        Method to record a received neighbor discovery probe
+        :param mac_packet: bytes-like l2 frame
+        :param mac_source_ip: bytes for the padded usrp address of the transmitter
+        '''
+        if self.neighbor_table is not None:
+            self.neighbor_table.recv_probe(self.unpad(mac_source_ip), memoryview(mac_packet)[L2_HEADER_LEN:])
+
+    def recv_ack(self, pktno, source=None):
         '''
         Method to signal that a packet has been ack'd (needed for usrp and wifi ack messages)
         :param pktno: int for the packet number that has been acked
+        :param source: bytes for the ip (wifi or usrp) of the node that sent the ack
+        '''
+        if self.arq_window > 1:
+            self.arq_recv_ack(pktno, source)
+        elif source is not None:
+            self.acks.ack((get_post_ip(source), pktno))
+        else:   # ack source unknown, release the frames waiting on this pktno
+            for key in self.acks.keys():
+                if key[1] == pktno:
+                    self.acks.ack(key)
+
+    def recv_acks(self, pktnos, source=None):
         '''
-        if pktno == self.unacked_packet:
-            globals()["l2_ack"].set()
+        Method to signal a batch of acked packets
+        :param pktnos: list of int packet numbers that have been acked
+        :param source: bytes for the ip (wifi or usrp) of the node that sent the acks
+        '''
+        for pktno in pktnos:
+            self.recv_ack(pktno, source)
 
     def pass_up(self, stop):
         '''
         Method to read pkt number, check if the destination is correct, and ensure packets are received correctly
         :param stop: function returning true/false to stop the thread
         '''
-        while not stop():
-            mac_packet = self.prev_up_queue.get(True)
-
-            (pktno_mac,) = struct.unpack('h', mac_packet[0:2])	
-            mac_destination_ip =   self.unpad(mac_packet[22:42]) 
-            mac_source_ip =   self.unpad(mac_packet[2:22])
-
-            # if self.debug:
-            #     print(pktno_mac, mac_source_ip, mac_destination_ip, mac_destination_ip == self.mac_ip)
-
-            if not (mac_source_ip in self.mac_pkt_dict.keys()):
-                self.mac_pkt_dict[mac_source_ip] = L2_ENUMS.MSG.value
-                self.up_pkt[mac_source_ip] = b''
-
-            # check if destination correct (meant for this node to read)
-            if mac_destination_ip == self.mac_ip:
-
-                if pktno_mac == L2_ENUMS.MSG.value:
-                    self.mac_pkt_dict[mac_source_ip] = pktno_mac        # update last received pkt number 
-                    a = Thread(target=self.send_ack_wifi, args=(mac_packet[0:2], mac_source_ip,))
-                    a.start()
-                    # self.send_ack(mac_packet[0:2], mac_source_ip)  # send ack
-                    self.up_pkt[mac_source_ip] = mac_packet[42:]
-                    mac_packet = b''
-
-                    if pktno_mac == self.num_frames:    # if last packet in l4 frame
-                        self.up_queue.put(self.up_pkt[mac_source_ip], True)
-                        self.up_pkt[mac_source_ip] = b''
-                        self.mac_pkt_dict[mac_source_ip] = L2_ENUMS.MSG.value
-                        continue
+        if self.arq_window > 1:
+            self.arq_pass_up(stop)
+            return
 
-                    else:
-                        continue
+        while not stop():
+            self.handle_up(self.prev_up_queue.get(True))
 
+    def handle_up(self, mac_packet):
+        '''
+        Method to process one received frame
+        :param mac_packet: bytes-like l2 frame
+        '''
+        if self.arq_window > 1:
+            self.arq_handle_up(mac_packet)
+            return
 
-                elif pktno_mac == (self.mac_pkt_dict[mac_source_ip]+1):  # next sequential message 
-                    self.mac_pkt_dict[mac_source_ip] = pktno_mac        # update last received pkt number 
-                    
-                    a = Thread(target=self.send_ack_wifi, args=(mac_packet[0:2], mac_source_ip,))
-                    a.start()
-                    # self.send_ack(mac_packet[0:2], mac_source_ip)  # send ack
-                    self.up_pkt[mac_source_ip] += mac_packet[42:]
-                    mac_packet = b''
+        pktno_mac, mac_source_ip, mac_destination_ip = L2_HEADER.unpack_from(mac_packet)     # parse header once
+        if pktno_mac == L2_ENUMS.NEIGHBOR_DISCOVERY.value:     # broadcast probe
+            self.recv_probe(mac_packet, mac_source_ip)
+            return
 
-                    if pktno_mac == self.num_frames:    # if last packet in l4 frame
-                        self.up_queue.put(self.up_pkt[mac_source_ip], True)
-                        self.up_pkt[mac_source_ip] = b''
-                        self.mac_pkt_dict[mac_source_ip] = L2_ENUMS.MSG.value
-                        continue
+        # check if destination correct (meant for this node to read)
+        if self.unpad(mac_destination_ip) != self.mac_ip:
+            return
+        mac_source_ip = self.unpad(mac_source_ip)
 
-                    else:
-                        continue
+        if pktno_mac == L2_ENUMS.ACK.value:
+            (mac_ack_pktno,) = L2_PKTNO.unpack_from(mac_packet, L2_HEADER_LEN)
+            self.recv_ack(mac_ack_pktno, mac_source_ip)
 
-                elif pktno_mac == L2_ENUMS.ACK.value:
-                    (mac_ack_pktno,) = struct.unpack('h', mac_packet[42:44])
-                    self.recv_ack(mac_ack_pktno)
-                    continue
+        elif pktno_mac >= 0 and L2_ENUMS.MSG.value <= (pktno_mac & ARQ_FRAG_MASK) <= self.num_frames:
+            self.dispatcher.submit(self.send_ack, mac_packet[0:2], mac_source_ip)     # ack every copy with its seq, the first ack may have been lost
+            self.reassemble(mac_source_ip, pktno_mac & ARQ_FRAG_MASK, memoryview(mac_packet)[L2_HEADER_LEN:])
 
-                else:   # if unexpected packet number
-                    # self.send_ack(struct.pack('h', self.mac_pkt_dict[mac_source_ip]), mac_source_ip)  # send last known pkt num
-                    continue
-            else:
-                pass
-                
     def pass_down(self, stop):
         '''
         Method to pass bytes in to L1 
         :param stop: function returning true/false to stop the thread
         '''
+        if self.arq_window > 1:
+            self.arq_pass_down(stop)
+            return
+
         while not stop():
             down_packet = self.prev_down_queue.get(True)
 
@@ -151,29 +210,286 @@ class Layer2(Network_Layer):
 
             act_rt = 0  # retransmission counter
 
-            (pktno_mac,) = struct.unpack('h', down_packet[0:2]) 
+            if not isinstance(down_packet, bytearray):
+                down_packet = bytearray(down_packet)
+            (frame_index, _, destination) = L2_HEADER.unpack_from(down_packet)
+            neighbor = get_post_ip(self.unpad(destination))    # wifi and usrp ips share the final byte
+
+            # per destination seq, so a late or duplicate ack of an earlier frame does not release this one
+            seq = self.sw_seq.get(neighbor, 0)
+            self.sw_seq[neighbor] = (seq + 1) % ARQ_SEQ_SPACE
+            pktno_mac = (seq << ARQ_FRAG_BITS) | (frame_index & ARQ_FRAG_MASK)
+            L2_PKTNO.pack_into(down_packet, 0, pktno_mac)
+            key = (neighbor, pktno_mac)
 
+            self.acks.expect(key)
+            time_sent = time()
             self.down_queue.put(down_packet, True)
-            self.unacked_packet = pktno_mac
 
             while not stop():
-                globals()["l2_ack"].wait(self.timeout)
-                if globals()["l2_ack"].isSet():     # ack received
-                    globals()["l2_ack"].clear()
+                if self.acks.wait(key, self.rto(neighbor)):     # ack received
+                    if act_rt == 0:     # the rtt of a retransmitted frame is ambiguous (Karn)
+                        self.rtt.sample(neighbor, time() - time_sent)
                     break
 
                 elif act_rt < self.n_retrans:       # check num of retransmissions
                     act_rt += 1
+                    if self.adaptive_timeout:
+                        self.rtt.backoff(neighbor)
                     self.down_queue.put(down_packet, True)
-                    self.unacked_packet = pktno_mac
 
                 else:
+                    self.acks.discard(key)
                     if self.debug:
-                        print("FATAL ERROR: L2 retransmit limit reached for pktno ", self.unacked_packet)
-                    for ii in range(self.num_frames-self.unacked_packet):
+                        print("FATAL ERROR: L2 retransmit limit reached for pktno ", pktno_mac)
+                    for ii in range(self.num_frames-frame_index):
                         self.prev_down_queue.get(True)
                         if self.debug:
                             print("popped packet")
 
                     break
-                        
+            else:
+                self.acks.discard(key)
+
+    def arq_pass_down(self, stop):
+        '''
+        Selective repeat sender: keeps up to arq_window unacked frames per destination, each with its own retransmission timer
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            with self.arq_lock:
+                wait_time = self.arq_retransmit()
+
+            try:
+                down_packet = self.prev_down_queue.get(True, wait_time)
+            except Empty:
+                continue
+
+            if not isinstance(down_packet, bytearray):
+                down_packet = bytearray(down_packet)
+            (frame_index, _, destination) = L2_HEADER.unpack_from(down_packet)
+            destination = self.unpad(destination)
+
+            with self.arq_lock:
+                if not destination in self.arq_tx:
+                    neighbor = get_post_ip(destination)
+                    self.arq_tx[destination] = {'base': 0, 'next_seq': 0, 'outstanding': {}, 'neighbor': neighbor}
+                    self.post_to_mac[neighbor] = destination
+                window = self.arq_tx[destination]
+
+                while (window['next_seq'] - window['base']) % ARQ_SEQ_SPACE >= self.arq_window and not stop():     # window full, wait for the oldest frame
+                    self.arq_lock.wait(self.arq_retransmit())
+
+                seq = window['next_seq']
+                window['next_seq'] = (seq + 1) % ARQ_SEQ_SPACE
+                L2_PKTNO.pack_into(down_packet, 0, (seq << ARQ_FRAG_BITS) | (frame_index & ARQ_FRAG_MASK))
+                now = time()
+                window['outstanding'][seq] = [down_packet, now + self.rto(window['neighbor']), 1, now]
+
+            self.down_queue.put(down_packet, True)
+
+    def arq_retransmit(self):
+        '''
+        Method to resend every outstanding frame whose timer expired, or drop it after n_retrans retransmissions (arq_lock held)
+        :return: float for the time in seconds until the next timer expires
+        '''
+        now = time()
+        next_deadline = now + self.timeout
+        for destination, window in self.arq_tx.items():
+            backed_off = False
+            for seq in list(window['outstanding']):
+                entry = window['outstanding'][seq]
+                if entry[1] <= now:
+                    if entry[2] <= self.n_retrans:
+                        if self.adaptive_timeout and not backed_off:     # frames timing out together back the rto off once
+                            self.rtt.backoff(window['neighbor'])
+                            backed_off = True
+                        entry[1] = now + self.rto(window['neighbor'])
+                        entry[2] += 1
+                        self.n_retransmits += 1
+                        self.down_queue.put(entry[0], True)
+                    else:
+                        if self.debug:
+                            print("FATAL ERROR: L2 retransmit limit reached for seq ", seq, destination)
+                        del window['outstanding'][seq]
+                        self.arq_slide(window)
+                        self.n_failed += 1
+                        self.arq_lock.notify_all()
+                        continue
+                next_deadline = min(next_deadline, entry[1])
+        return max(0.0, next_deadline - now)
+
+    def arq_recv_ack(self, pktno, source):
+        '''
+        Method to release an acked frame from its destination window
+        :param pktno: int for the acked mac pktno field [seq | frame index]
+        :param source: bytes for the ip (wifi or usrp) of the node that sent the ack
+        '''
+        seq = pktno >> ARQ_FRAG_BITS
+        with self.arq_lock:
+            if source is not None:
+                destination = self.post_to_mac.get(get_post_ip(source))
+                windows = [self.arq_tx[destination]] if destination in self.arq_tx else []
+            else:
+                windows = self.arq_tx.values()
+            for window in windows:
+                entry = window['outstanding'].get(seq)
+                if entry is not None and L2_PKTNO.unpack_from(entry[0])[0] == pktno:
+                    if entry[2] == 1:   # the rtt of a retransmitted frame is ambiguous (Karn)
+                        self.rtt.sample(window['neighbor'], time() - entry[3])
+                    del window['outstanding'][seq]
+                    self.arq_slide(window)
+                    self.arq_lock.notify_all()
+                    break
+
+    def arq_slide(self, window):
+        '''
+        Method to move the base of a send window past the frames that are no longer outstanding (arq_lock held)
+        :param window: dict send state of a destination
+        '''
+        while window['base'] != window['next_seq'] and not window['base'] in window['outstanding']:
+            window['base'] = (window['base'] + 1) % ARQ_SEQ_SPACE
+
+    def arq_pass_up(self, stop):
+        '''
+        Selective repeat receiver: acks every frame, buffers out of order frames and delivers them in sequence
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            try:
+                mac_packet = self.prev_up_queue.get(True, self.timeout)
+            except Empty:
+                self.arq_skip_holes()
+                continue
+            self.arq_handle_up(mac_packet)
+
+    def arq_handle_up(self, mac_packet):
+        '''
+        Method to ack, buffer and deliver one received frame
+        :param mac_packet: bytes-like l2 frame
+        '''
+        pktno_mac, mac_source_ip, mac_destination_ip = L2_HEADER.unpack_from(mac_packet)
+        if pktno_mac == L2_ENUMS.NEIGHBOR_DISCOVERY.value:     # broadcast probe
+            self.recv_probe(mac_packet, mac_source_ip)
+            return
+        if self.unpad(mac_destination_ip) != self.mac_ip:
+            return
+        mac_source_ip = self.unpad(mac_source_ip)
+
+        if pktno_mac == L2_ENUMS.ACK.value:
+            (mac_ack_pktno,) = L2_PKTNO.unpack_from(mac_packet, L2_HEADER_LEN)
+            self.recv_ack(mac_ack_pktno, mac_source_ip)
+            return
+        elif pktno_mac < 0:
+            return
+
+        self.dispatcher.submit(self.send_ack, mac_packet[0:2], mac_source_ip)   # ack every copy, the first ack may have been lost
+
+        seq = pktno_mac >> ARQ_FRAG_BITS
+        rx = self.arq_rx.get(mac_source_ip)
+        if rx is None:     # senders start at seq 0, earlier frames of the first window may still be on the way
+            rx = {'expected': 0 if seq < self.arq_window else seq, 'buffer': {}}
+            self.arq_rx[mac_source_ip] = rx
+
+        offset = (seq - rx['expected']) % ARQ_SEQ_SPACE
+        if offset < self.arq_window:        # in the receive window
+            if not seq in rx['buffer']:
+                rx['buffer'][seq] = (pktno_mac & ARQ_FRAG_MASK, memoryview(mac_packet)[L2_HEADER_LEN:], time())
+        elif offset >= ARQ_SEQ_SPACE - self.arq_window:    # already delivered
+            return
+        else:   # sender moved past frames it gave up on, slide the window up to this frame
+            self.arq_advance(mac_source_ip, rx, (seq - self.arq_window + 1) % ARQ_SEQ_SPACE)
+            rx['buffer'][seq] = (pktno_mac & ARQ_FRAG_MASK, memoryview(mac_packet)[L2_HEADER_LEN:], time())
+
+        self.arq_deliver(mac_source_ip, rx)
+        self.arq_skip_holes()
+
+    def arq_deliver(self, source, rx):
+        '''
+        Method to pass the in sequence buffered frames of a source to reassembly
+        :param source: bytes for the source mac
+        :param rx: dict receive state of the source
+        '''
+        while rx['expected'] in rx['buffer']:
+            frame_index, chunk, _ = rx['buffer'].pop(rx['expected'])
+            rx['expected'] = (rx['expected'] + 1) % ARQ_SEQ_SPACE
+            self.reassemble(source, frame_index, chunk)
+
+    def arq_advance(self, source, rx, seq):
+        '''
+        Method to move the expected seq of a source forward, delivering buffered frames and skipping missing ones on the way
+        :param source: bytes for the source mac
+        :param rx: dict receive state of the source
+        :param seq: int for the new expected seq
+        '''
+        while rx['expected'] != seq:
+            if rx['expected'] in rx['buffer']:
+                frame_index, chunk, _ = rx['buffer'].pop(rx['expected'])
+                self.reassemble(source, frame_index, chunk)
+            else:   # the l4 packet with the missing frame is incomplete
+                self.reassembler.drop(source)
+                self.relay_state.pop(source, None)
+            rx['expected'] = (rx['expected'] + 1) % ARQ_SEQ_SPACE
+
+    def arq_skip_holes(self):
+        '''
+        Method to skip missing frames the sender has given up on (buffered frames waiting longer than hole_timeout)
+        and to drop the l4 packets that stayed incomplete past the reassembly timeout
+        '''
+        now = time()
+        self.reassembler.expire(now)
+        for source, rx in self.arq_rx.items():
+            if rx['buffer'] and now - min(entry[2] for entry in rx['buffer'].values()) > self.hole_timeout:
+                self.arq_advance(source, rx, min(rx['buffer'], key=lambda seq: (seq - rx['expected']) % ARQ_SEQ_SPACE))
+                self.arq_deliver(source, rx)
+
+    def reassemble(self, source, frame_index, chunk):
+        '''
+        Method to add a frame to the l4 packet of a source and pass complete packets up
+        :param source: bytes for the source mac
+        :param frame_index: int for the frame index in the l4 packet (1 to num_frames)
+        :param chunk: memoryview of the frame payload
+        '''
+        if self.relay is not None and self.cut_through(source, frame_index, chunk):
+            return
+        up_pkt = self.reassembler.add(source, frame_index, chunk)
+        if up_pkt is not None:
+            self.send_up(up_pkt)
+
+    def cut_through(self, source, frame_index, chunk):
+        '''
+        Method to forward a frame of a relayed packet to its next hop as soon as it arrives, instead of reassembling the l4 packet
+        and fragmenting it again in l4. The l4 destination is read from the first frame of a packet and kept for the following ones
+        :param source: bytes for the source mac
+        :param frame_index: int for the frame index in the l4 packet (1 to num_frames)
+        :param chunk: memoryview of the frame payload
+        :return: bool, True if the frame was forwarded (or was a copy of the last forwarded one), False to reassemble it here
+        '''
+        state = self.relay_state.get(source)
+        if state is not None and state[2] is not None and frame_index == state[1] and memoryview(state[2])[L2_HEADER_LEN:] == chunk:
+            return True     # retransmitted copy, the ack of the last frame was lost
+
+        if frame_index == 1:
+            if len(chunk) < L4_PKTNO.size + ADDRESSES.size:
+                return False
+            (_, destination) = ADDRESSES.unpack_from(chunk, L4_PKTNO.size)
+            state = [destination, 1, None]
+            self.relay_state[source] = state
+        elif state is None or state[0] is None or frame_index != state[1] + 1:     # local packet, or the start of this one was missed
+            if state is not None:
+                state[0] = None
+            return False
+        else:
+            state[1] = frame_index
+
+        next_hop = self.relay(state[0], L2_HEADER_LEN + len(chunk))
+        if next_hop is None:
+            state[0] = None
+            state[2] = None
+            return False
+
+        frame = build_l2(frame_index, self.mac_ip, next_hop, chunk)
+        state[2] = frame
+        self.n_cut_through += 1
+        self.prev_down_queue.put(frame, True)
+        return True
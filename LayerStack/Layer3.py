@@ -5,7 +5,9 @@ Layer 3 object: Routing layer (Network)
 '''
 
 from LayerStack.Network_Layer import Network_Layer
-import struct
+from LayerStack.Headers import ADDRESSES, L2_PKTNO, rewrite_addresses
+from LayerStack.Forwarding_Table import Forwarding_Table
+from LayerStack.Neighbor_Table import MAX_COST
 
 class Layer3(Network_Layer):
     def __init__(self, my_config, debug=False):
@@ -17,6 +19,7 @@ class Layer3(Network_Layer):
         Network_Layer.__init__(self, "layer_3", debug=debug)
 
         self.my_usrp = bytes(my_config.usrp_ip, "utf-8")
+        self.my_pc = self.pad(bytes(my_config.pc_ip, "utf-8"))     # padded, compared with the l4 header field
 
         self.src_pc = bytes(my_config.src.pc_ip, "utf-8")
         self.dest_pc = bytes(my_config.dest.pc_ip, "utf-8")
@@ -24,21 +27,68 @@ class Layer3(Network_Layer):
         self.nh_usrp = bytes(my_config.next_hop.usrp_ip, "utf-8")
         self.ph_usrp = bytes(my_config.prev_hop.usrp_ip, "utf-8")
 
+        self.forwarding_table = Forwarding_Table()      # destination pc -> next hop usrp, for every flow through this node
+        self.forwarding_table.load(my_config)
+        self.n_route_changes = 0
 
         if self.debug:
             print('src', self.src_pc, "dest", self.dest_pc, 'nh', self.nh_usrp, 'ph', self.ph_usrp)
+            print('routes', self.forwarding_table.stats())
 
     def determine_mac(self, pc_ip):
         '''
         Method to determine the mac_address to send to based on the input ip address 
-        [src pv me nh dest]
         :param pc_ip: bytes for the wifi ip address
-        :return: bytes for the usrp ip address
+        :return: bytes for the usrp ip address, None if there is no route
         '''
-        if pc_ip == self.dest_pc:
-            return self.nh_usrp
-        elif pc_ip == self.src_pc:
-            return self.ph_usrp
+        return self.forwarding_table.lookup(self.pad(pc_ip))
+
+    def relay_hop(self, padded_destination, length=0):
+        '''
+        Method for the l2 cut-through path: get the next hop of a frame of a relayed packet and count it on its route
+        :param padded_destination: bytes for the padded destination pc address from the l4 header
+        :param length: int for the frame byte length
+        :return: bytes for the next hop usrp address, None to pass the packet up (this node is the destination or there is no route)
+        '''
+        if padded_destination == self.my_pc or not padded_destination in self.forwarding_table.routes:
+            return None
+        return self.forwarding_table.lookup(padded_destination, length)
+
+    def add_route(self, pc_ip, next_hop_usrp):
+        '''
+        Method to add or replace the route to a destination while running
+        :param pc_ip: bytes or string for the destination wifi ip address
+        :param next_hop_usrp: bytes or string for the usrp ip address of the next hop
+        '''
+        self.forwarding_table.add_route(pc_ip, next_hop_usrp)
+
+    def remove_route(self, pc_ip):
+        '''
+        Method to remove the route to a destination
+        :param pc_ip: bytes or string for the destination wifi ip address
+        '''
+        self.forwarding_table.remove_route(pc_ip)
+
+    def update_routes(self, neighbor_table):
+        '''
+        Method to move each destination to its lowest etx next hop (with hysteresis) and get the costs to advertise
+        :param neighbor_table: Neighbor_Table object of the node
+        :return: dict of destination pc -> cost of the route in use
+        '''
+        for destination, (next_hop, cost) in neighbor_table.best_routes().items():
+            current_hop = self.forwarding_table.next_hop(destination)
+            if next_hop != current_hop and neighbor_table.should_switch(destination, current_hop, cost):
+                self.forwarding_table.add_route(destination, next_hop)
+                self.n_route_changes += 1
+                if self.debug:
+                    print('L3 route', destination, current_hop, '->', next_hop, 'etx', cost)
+
+        costs = {}
+        for destination in self.forwarding_table.destinations():
+            cost = neighbor_table.route_cost(destination, self.forwarding_table.next_hop(destination))
+            if cost < MAX_COST:
+                costs[destination] = cost
+        return costs
 
     def pass_up(self, stop):
         '''
@@ -46,11 +96,17 @@ class Layer3(Network_Layer):
         :param stop: function returning true/false to stop the thread
         '''
         while not stop():
-            l3_packet = self.prev_up_queue.get(True)
-            if self.debug:
-                print('from l2',l3_packet)
-                print()
-            self.up_queue.put(l3_packet, True)
+            self.handle_up(self.prev_up_queue.get(True))
+
+    def handle_up(self, l3_packet):
+        '''
+        Method to process one packet from l2
+        :param l3_packet: bytes-like l2 payload (l4 packet)
+        '''
+        if self.debug:
+            print('from l2',l3_packet)
+            print()
+        self.send_up(l3_packet)
 
 
     def pass_down(self, stop):
@@ -59,11 +115,25 @@ class Layer3(Network_Layer):
         :param stop: function returning true/false to stop the thread
         '''
         while not stop():
-            l3_packet = self.prev_down_queue.get(True)  # chunk : []
+            self.handle_down(self.prev_down_queue.get(True))  # chunk : []
 
-            if self.debug:
-                print('from l4', l3_packet)
+    def handle_down(self, l3_packet):
+        '''
+        Method to route one l2 frame from l4
+        :param l3_packet: bytes-like l2 frame with the pc source and destination in the address fields
+        '''
+        if self.debug:
+            print('from l4', l3_packet)
+
+        if not isinstance(l3_packet, bytearray):
+            l3_packet = bytearray(l3_packet)
 
-            mac_addr = self.determine_mac(self.unpad(l3_packet[22:42])) # determine and replace pc address with mac address then pass to l2
-            self.down_queue.put(l3_packet[0:2]+self.pad(self.my_usrp)+self.pad(mac_addr)+l3_packet[42:], True)
+        (_, pc_destination) = ADDRESSES.unpack_from(l3_packet, L2_PKTNO.size)
+        mac_addr = self.forwarding_table.lookup(pc_destination, len(l3_packet))  # the padded header field is the table key, then replace pc address with mac address and pass to l2
+        if mac_addr is None:
+            if self.debug:
+                print('L3 no route for', self.unpad(pc_destination))
+            return
 
+        rewrite_addresses(l3_packet, self.my_usrp, mac_addr)    # rewrite header in place
+        self.send_down(l3_packet)
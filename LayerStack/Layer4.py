@@ -5,12 +5,16 @@ Layer 4 object: Transport layer
 '''
 
 from LayerStack.Network_Layer import Network_Layer
-from threading import  Event, Lock, Thread
+from LayerStack.Headers import L4_HEADER, L4_HEADER_LEN
+from LayerStack.Fragmenter import Fragmenter
+from LayerStack.Dispatcher import Dispatcher
+from LayerStack.Ack_Tracker import Ack_Tracker, Duplicate_Filter
+from LayerStack.Rtt_Estimator import Rtt_Estimator
+from LayerStack.Congestion_Control import make_controller
+from threading import  Event, Lock
 from time import time
 import struct, csv, os, datetime
 
-l4_down_access = Lock()     
-
 # latency
 # l2_retrans = 4
 # l2_timeout = 0.05
@@ -31,8 +35,10 @@ l4_down_access = Lock()
 # l4_window=2
 # l2_window=1
 
+REORDER_THRESHOLD = 3     # acks for newer packets before a missing l4 ack counts as a loss
+
 class Layer4(Network_Layer):
-    def __init__(self, my_config, send_ack, window=1, num_frames=1, l2_header=42, l2_size=200, timeout=1.0, n_retrans=0, debug=False, l4_header=56, l4_log_base_name="~/Documents/usrp-utils/Logs/l4_acks_",  log=True):
+    def __init__(self, my_config, send_ack, window=1, num_frames=1, l2_header=42, l2_size=200, timeout=1.0, n_retrans=0, debug=False, l4_header=56, l4_log_base_name="~/Documents/usrp-utils/Logs/l4_acks_",  log=True, dispatcher=None, ack_window=65536, adaptive_timeout=True, congestion=None, log_dispatcher=None):
         '''
         Layer 4 Transport layer object
         :param my_config: Node_Config object for the current node
@@ -40,16 +46,22 @@ class Layer4(Network_Layer):
         :param num_frames: int for the number of l2 frames in one l4 packet
         :param l2_header: int for the byte length of the l2 header
         :param l2_size: int for the byte length for one l2 frame
-        :param timeout: int for the l4 ack timeout
+        :param timeout: int for the l4 ack timeout, the initial rto when adaptive_timeout
         :param n_retrans: int for the number of times to retransmit a l4 message
         :param debug: bool for debug outputs or not
         :param l4_header: int for the l4 packet header length
         :param l4_log_base_name: string for the file location and name to save l4 log files
         :param log: bool to log or not
+        :param dispatcher: Dispatcher object to send acks on, a private one is created if None
+        :param ack_window: int for the number of recent pktnos remembered to filter duplicate acks
+        :param adaptive_timeout: bool to set the ack timeout from the measured end to end rtt
+        :param congestion: string for the congestion controller pacing layer 5 ('aimd' or 'delay'), None for a fixed rate
+        :param log_dispatcher: Dispatcher object to write the log rows on (off the ack path), a private one is created if None and logging
         TODO
         '''
         Network_Layer.__init__(self, "layer_4", debug=debug, window=window)
         self.my_pc = bytes(my_config.pc_ip, "utf-8")
+        self.dest_pc = bytes(my_config.dest.pc_ip, "utf-8")     # destination of the packets originated here
 
         # Setup Log File
         self.log = log
@@ -64,27 +76,53 @@ class Layer4(Network_Layer):
             self.writer.writerow(row_list)
   
         self.send_ack_wifi = send_ack
+        if dispatcher is None:
+            dispatcher = Dispatcher(name="layer_4", overflow='inline', debug=debug)
+        self.dispatcher = dispatcher
+        if log_dispatcher is None and self.log:
+            log_dispatcher = Dispatcher(name="layer_4_log", debug=debug)
+        self.log_dispatcher = log_dispatcher
 
-        self.unacked_packets = []
-        self.window_ack_list = []
-        for ii in range(window):
-            self.unacked_packets.append(None)
-            self.window_ack_list.append(False)
+        self.acks = Ack_Tracker()       # pktno -> ack event of the packets sent from this node
+        self.down_access = Lock()       # keeps the frames of one l4 packet together in the down queue
                 
         self.num_frames = num_frames
+        self.l2_size = l2_size
         self.chunk_size = l2_size - l2_header
         self.timeout=timeout
         self.n_retrans = n_retrans
+        self.adaptive_timeout = adaptive_timeout
+        self.rtt = Rtt_Estimator(timeout, min_rto=0.01, max_rto=max(10.0, timeout))     # destination pc -> rto
+        self.retransmitted = set()      # pktnos sent more than once, their rtt is not sampled (Karn)
         
-        self.ack_list = []
+        self.acked = Duplicate_Filter(ack_window)
         
-        self.l4_size = l2_size*num_frames
+        self.fragmenter = Fragmenter(num_frames, self.chunk_size)
+        self.l4_size = self.chunk_size*num_frames       # fills num_frames l2 frames exactly
         self.l4_header = l4_header
 
+        self.congestion = make_controller(congestion, self.l4_size, initial_rtt=timeout)
+        self.next_unacked = None        # oldest originated pktno not acked or declared lost yet
+
         # Measurements
         self.n_recv = 0
         self.n_sent = 0
         self.n_ack = 0  # number of acks recvd
+        self.n_dup_ack = 0  # number of repeated acks
+        self.n_rtt = 0          # acks summed in rtt_sum (n_ack is reset each iteration by UAV_Node)
+        self.rtt_sum = 0.0      # seconds
+        self.latency_sum = 0.0  # seconds from time sent to delivery, over the n_recv packets received here (same clock in the testbed)
+        self.rtt_samples = None # list to keep every rtt in for percentiles (benchmarks), None to keep only the sum
+
+    def rto(self, destination):
+        '''
+        Method to get the ack timeout of a destination
+        :param destination: bytes for the destination pc address
+        :return: float for the timeout in seconds
+        '''
+        if self.adaptive_timeout:
+            return self.rtt.rto(destination)
+        return self.timeout
 
     def send_ack(self, pktno, dest, time_stamp):
         '''
@@ -103,35 +141,82 @@ class Layer4(Network_Layer):
         :param time_sent: float for the packet time sent
         TODO 
         '''
-        if not pktno in self.ack_list:
-            self.ack_list.append(pktno)
+        if self.acked.check(pktno):
             self.n_ack += 1
             ack_time = time()
             rtt = ack_time - time_sent 
+            self.rtt_sum += rtt
+            self.n_rtt += 1
+            if self.rtt_samples is not None:
+                self.rtt_samples.append(rtt)
+            if not pktno in self.retransmitted:
+                self.rtt.sample(self.dest_pc, rtt)
+                if self.congestion is not None:
+                    self.congestion.on_ack(rtt)
+            if self.congestion is not None:
+                self.detect_losses(pktno)
 
             if self.debug:
                 print("L4 ACK:", pktno, rtt)
             
             if self.log == True:
-                
-                self.writer.writerow([pktno, time_sent, ack_time, rtt, 8.0*self.l4_size/rtt])
+                self.log_dispatcher.submit(self.log_row, [pktno, time_sent, ack_time, rtt, 8.0*self.l4_size/rtt])
+        else:
+            self.n_dup_ack += 1
 
-        if pktno in self.unacked_packets:
-            self.window_ack_list[self.unacked_packets.index(pktno)]=True
-            self.unacked_packets[self.unacked_packets.index(pktno)]=None
+        self.acks.ack(pktno)
     
-    def log_pkt(self, l4_packet):
+    def detect_losses(self, pktno):
+        '''
+        Method to declare a packet lost once acks arrived for REORDER_THRESHOLD newer packets (runs on the dispatcher, one thread)
+        :param pktno: int for the newly acked packet number
+        '''
+        if self.next_unacked is None:
+            self.next_unacked = pktno
+        if pktno - self.next_unacked > self.acked.window:     # too far behind to look up, skip ahead
+            self.next_unacked = pktno - self.acked.window
+        while True:
+            while self.next_unacked <= pktno and self.acked.is_seen(self.next_unacked):
+                self.next_unacked += 1
+            if pktno - self.next_unacked < REORDER_THRESHOLD:
+                return
+            self.congestion.on_loss()
+            self.next_unacked += 1
+
+    def stats(self):
         '''
-        Method to log l4 packets in a seperate thread
-        :param pkt: l4 packet to log
+        Method to get the transport counters
+        :return: dict of the packets sent, acked and received here, and the mean rtt and one way latency in seconds
+        '''
+        return {"sent": self.n_sent, "acked": self.n_ack, "dup_acks": self.n_dup_ack, "recv": self.n_recv,
+                "rtt": self.rtt_sum/self.n_rtt if self.n_rtt else None, "latency": self.latency_sum/self.n_recv if self.n_recv else None}
+
+    def recv_acks(self, acks):
+        '''
+        Method to signal a batch of acked packets
+        :param acks: list of (int packet number, float time sent) tuples
+        '''
+        for pktno, time_sent in acks:
+            self.recv_ack(pktno, time_sent)
+
+    def log_pkt(self, pktno, packet_source, packet_destination, time_sent):
+        '''
+        Method to log l4 packets on the log dispatcher
+        :param pktno: int for the l4 packet number
+        :param packet_source: bytes for the packet source pc address
+        :param packet_destination: bytes for the packet destination pc address
+        :param time_sent: float for the packet time sent
+        '''
+        self.log_row([pktno, packet_source, packet_destination, time_sent, time()])
+
+    def log_row(self, row):
+        '''
+        Method to write one row to the l4 log file on the log dispatcher (UAV_Node reopens the file between iterations)
+        :param row: list of values to write
         '''
         try:
             if self.log == True and not self.file.closed:
-                    packet_source = self.unpad(l4_packet[8:28])
-                    packet_destination = self.unpad(l4_packet[28:48])
-                    pktno = struct.unpack('L', l4_packet[0:8])[0]
-                    time_sent = struct.unpack('d', l4_packet[48:56])[0]
-                    self.writer.writerow([pktno, packet_source, packet_destination, time_sent, time()])
+                    self.writer.writerow(row)
         except:
             pass
 
@@ -141,86 +226,91 @@ class Layer4(Network_Layer):
         :param stop: function returning true/false to stop the thread
         '''
         while not stop():
-            l4_packet = self.prev_up_queue.get(True)
-                
-            packet_source = self.unpad(l4_packet[8:28])
-            packet_destination = self.unpad(l4_packet[28:48])
-            
-            if self.debug:
-                print('L4 RCV', struct.unpack('L', l4_packet[0:8]))
+            self.handle_up(self.prev_up_queue.get(True))
 
-            if packet_destination == self.my_pc:    # if this is the destination, then pass payload to the application layer
-                self.up_queue.put(l4_packet[56:], True)
-                a = Thread(target=self.send_ack_wifi, args=(l4_packet[:8], packet_source, l4_packet[48:56],))
-                a.start()
-                l4_packet = b''
+    def handle_up(self, l4_packet):
+        '''
+        Method to deliver or relay one l4 packet
+        :param l4_packet: bytes-like l4 packet
+        '''
+        pktno, packet_source, packet_destination, time_sent = L4_HEADER.unpack_from(l4_packet)  # parse header once
+        packet_source = self.unpad(packet_source)
+        packet_destination = self.unpad(packet_destination)
+        
+        if self.debug:
+            print('L4 RCV', pktno)
 
-            else:   # relay/forward message
-                self.prev_down_queue.put(l4_packet, True)
-                l4_packet = b''
+        if packet_destination == self.my_pc:    # if this is the destination, then pass payload to the application layer
+            self.n_recv += 1
+            self.latency_sum += time() - time_sent
+            l4_view = memoryview(l4_packet)
+            self.send_up(l4_view[L4_HEADER_LEN:])
+            self.dispatcher.submit(self.send_ack_wifi, l4_view[:8], packet_source, l4_view[48:56])
 
-            # log the pkt
-            b = Thread(target=self.log_pkt, args=(l4_packet,))
-            b.start()
+        else:   # relay/forward message
+            self.prev_down_queue.put(l4_packet, True)
+
+        # log the pkt
+        if self.log:
+            self.log_dispatcher.submit(self.log_pkt, pktno, packet_source, packet_destination, time_sent)
 
-    def pass_down(self, stop, window_index=0):
+    def pass_down(self, stop):
         '''
         Method to receive l4 packets, break them into l2 sized packets, and pass them to l3
         :param stop: function returning true/false to stop the thread
-        TODO
         '''
         
         while not stop():
             act_rt=0 # retransmission counter
             l4_packet = self.prev_down_queue.get(True)
-            packet_source = self.unpad(l4_packet[8:28])
+            pktno, source, destination, _ = L4_HEADER.unpack_from(l4_packet)   # padded addresses are copied into each l2 header as is
+            packet_source = self.unpad(source)
+            l4_view = memoryview(l4_packet)
             
             if self.debug:
-                print('L4 Sent', struct.unpack('L', l4_packet[0:8])[0])
-
-            self.unacked_packets[window_index] = struct.unpack('L', l4_packet[0:8])[0]
+                print('L4 Sent', pktno)
 
-            pkt_no_mac = 1  # mac (l2) packet number counter
-            l4_down_access.acquire()
-            # pass l2 packets down to l3
-            while pkt_no_mac <= self.num_frames:
-                chunk = l4_packet[(pkt_no_mac-1)*self.chunk_size : min((pkt_no_mac)*self.chunk_size,len(l4_packet)) ]
-                l2_packet = struct.pack('H', pkt_no_mac & 0xffff ) + l4_packet[8:28] + l4_packet[28:48] + chunk  # packet source not needed, it gets replaced in l3, similarly, in l3 the dest is replaced by the mac address
-                self.down_queue.put(l2_packet, True)    
+            # if l4 packet originated from this node, then wait for ack
+            originated = packet_source == self.my_pc
+            if originated:
+                self.acks.expect(pktno)
+                self.n_sent += 1
 
-                pkt_no_mac +=1
-                l2_packet=b''
-            l4_down_access.release()
+            self.send_frames(l4_view, source, destination)
             
-            # if l4 packet originated from this node, then wait for ack
-            if packet_source == self.my_pc:
+            if originated:
                 while not stop():
-                    if self.window_ack_list[window_index]==True: # ack received
-                        # TODO measurements
-                        break
+                    if act_rt < self.n_retrans:       # check num of retransmissions
+                        if self.acks.wait(pktno, self.rto(self.dest_pc)): # ack received
+                            break
+                        act_rt += 1 
+                        if self.congestion is not None:
+                            self.congestion.on_loss()
+                        # repeated transmission block 
+                        self.retransmitted.add(pktno)
+                        if self.adaptive_timeout:
+                            self.rtt.backoff(self.dest_pc)
+                        self.send_frames(l4_view, source, destination)
 
                     else:
-                        if act_rt < self.n_retrans:       # check num of retransmissions
-                            act_rt += 1 
-                            
-                            pkt_no_mac = 1  # mac (l2) packet number counter
-                            l4_down_access.acquire()
-                            # repeated transmission block 
-                            while pkt_no_mac <= self.num_frames:
-                                chunk = l4_packet[(pkt_no_mac-1)*self.chunk_size : min((pkt_no_mac)*self.chunk_size,len(l4_packet)) ]
-                                l2_packet = struct.pack('h', pkt_no_mac & 0xffff) + l4_packet[8:28] + l4_packet[28:48] + chunk  # packet source not needed, it gets replaced in l3, similarly, in l3 the dest is replaced by the mac address
-                                self.down_queue.put(l2_packet, True)    # TODO check that a full l2 packet is made and pad otherwise
-
-                                pkt_no_mac +=1
-                                l2_packet=b''
-                            l4_down_access.release()
-
-                        else:
-                            if self.debug:
-                                print("FATAL ERROR: L4 retransmit limit reached for pktno ", self.unacked_packets[window_index])
-                            try:
-                                globals()["l4_ack"].set()
-                            except:
-                                pass
+                        if self.n_retrans > 0 and self.acks.wait(pktno, self.rto(self.dest_pc)):
                             break
+                        if self.n_retrans > 0 and self.congestion is not None:
+                            self.congestion.on_loss()
+                        if self.debug:
+                            print("FATAL ERROR: L4 retransmit limit reached for pktno ", pktno)
+                        break
+                self.acks.discard(pktno)
+                self.retransmitted.discard(pktno)
 
+    def send_frames(self, l4_view, source, destination):
+        '''
+        Method to break an l4 packet into l2 frames and pass them to l3
+        :param l4_view: memoryview of the l4 packet
+        :param source: bytes for the padded packet source, it gets replaced in l3
+        :param destination: bytes for the padded packet destination, in l3 it is replaced by the mac address
+        '''
+        frames = self.fragmenter.fragment(l4_view, source, destination)
+        with self.down_access:
+            for frame in frames:
+                self.send_down(frame)
@@ -4,55 +4,115 @@
 Layer 5 object: Sample Application layer
 '''
 
-from time import sleep, time
+from time import time
+from threading import Event
 import random, string, struct
-from math import ceil
 
 from LayerStack.Network_Layer import Network_Layer
+from LayerStack.Headers import L4_HEADER, L4_PKTNO, TIME_SENT
+from LayerStack.Token_Bucket import Token_Bucket
+
+RATE_INTERVAL = 1.0     # seconds between updates of the achieved rate
 
 
 class Layer5(Network_Layer):
-    def __init__(self, my_config, layer4, debug=False):
+    def __init__(self, my_config, layer4, rate=1000000, burst_time=0.01, debug=False):
         '''
         Layer 5 Application layer object
         :param my_config: Node_Config object for the current node
         :param layer4: Layer4 object for the current node
+        :param rate: float for the target transport layer rate in bps, the max rate when layer 4 runs a congestion controller
+        :param burst_time: float for the seconds of packets that can be sent back to back to catch up after a late wakeup
         :param debug: bool for debug outputs or not
         '''
         Network_Layer.__init__(self, "layer_5", debug=debug)
 
         self.my_config = my_config
         self.layer4 = layer4
-        self.transmit = False
-        self.tspt_rate = 1000000			# Initial tansport layer rate in bps
+        self.transmitting = Event()
+        self.tspt_rate = rate			# Initial tansport layer rate in bps
+        self.burst_time = burst_time
+
+        # Measurements
+        self.n_sent = 0
+        self.achieved_rate = 0.0        # bps sent over the last RATE_INTERVAL
+
+    @property
+    def transmit(self):
+        return self.transmitting.is_set()
+
+    @transmit.setter
+    def transmit(self, value):
+        if value:
+            self.transmitting.set()
+        else:
+            self.transmitting.clear()
+
+    def packet_template(self):
+        '''
+        Method to build the l4 packet every sent packet is copied from, only the pktno and time stamp change per packet
+        :return: bytearray for the packet template, int for the offset of the time stamp
+        '''
+        payload = bytes((self.layer4.l4_size - self.layer4.l4_header) * random.choice(string.digits), "utf-8")
+        template = bytearray(L4_HEADER.size) + payload
+        L4_HEADER.pack_into(template, 0, 0, bytes(self.my_config.pc_ip, "utf-8"), bytes(self.my_config.dest.pc_ip, "utf-8"), 0.0)
+        return template, L4_HEADER.size - TIME_SENT.size
 
     def pass_down(self, stop):
         '''
-        Method to pass down packets to the lower layers
+        Method to pass down packets to the lower layers, paced by a token bucket at tspt_rate
         :param stop: function returning true/false to stop the thread
         '''
-        
-        payload = bytes((self.layer4.l4_size - self.layer4.l4_header) * random.choice(string.digits), "utf-8")
+        l4_size = self.layer4.l4_size
         pktno_l4 = 1
         l4_pkts_to_send = 100000
 
-        l4_maximum_rate = self.tspt_rate/8 	    # bps -> [Bps]
-        max_pkt_per_sec = max(1,int(ceil(l4_maximum_rate/self.layer4.l4_size)))
-        print("MPPS:", max_pkt_per_sec)
+        template, time_offset = self.packet_template()
+
+        congestion = self.layer4.congestion
+        rate = self.tspt_rate
+        pkt_rate = rate/(8.0*l4_size)   # bps -> packets per second
+        print("MPPS:", pkt_rate)
+        bucket = Token_Bucket(pkt_rate, pkt_rate*self.burst_time)
+
+        interval_start = time()
+        interval_sent = 0
 
         while not stop():
-            if self.transmit:
-                if pktno_l4 == l4_pkts_to_send:
-                        print("Max number of packets sent")
-                        break
-
-                for counter_packet in range(int(max_pkt_per_sec)):
-                    time_stamp = time()
-                    packet = struct.pack('l', pktno_l4)  + self.pad(bytes(self.my_config.pc_ip, "utf-8")) + self.pad(bytes(self.my_config.dest.pc_ip, "utf-8")) +  struct.pack('d', time_stamp) + payload # 56 bytes added + payload
-                    self.down_queue.put(packet, True)
-                    pktno_l4 += 1
-                    sleep(1.0/max_pkt_per_sec)
+            if not self.transmitting.wait(0.1):
+                interval_start = time()
+                interval_sent = 0
+                self.achieved_rate = 0.0
+                continue
+
+            if pktno_l4 == l4_pkts_to_send:
+                print("Max number of packets sent")
+                break
+
+            target = self.tspt_rate
+            if congestion is not None:      # the l4 congestion window paces below the configured max rate
+                target = min(target, congestion.rate)
+            if rate != target:      # rate changed while running
+                rate = target
+                pkt_rate = rate/(8.0*l4_size)
+                bucket.set_rate(pkt_rate, pkt_rate*self.burst_time)
+
+            if not bucket.wait(1, stop):
+                break
+
+            packet = bytearray(template)
+            L4_PKTNO.pack_into(packet, 0, pktno_l4)
+            TIME_SENT.pack_into(packet, time_offset, time())
+            self.down_queue.put(packet, True)
+            pktno_l4 += 1
+            self.n_sent += 1
 
+            interval_sent += 1
+            now = time()
+            if now - interval_start >= RATE_INTERVAL:
+                self.achieved_rate = 8.0*l4_size*interval_sent/(now - interval_start)
+                interval_start = now
+                interval_sent = 0
 
     def pass_up(self, stop):
         '''
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''
+Layer Queue object: bounded queue between layers with a drop policy and occupancy measurements
+'''
+
+from queue import Queue
+from collections import deque
+from enum import Enum
+from time import perf_counter
+import random
+
+class Drop_Policy(Enum):
+    BLOCK = 'block'     # put waits for space (backpressure)
+    TAIL = 'tail'       # drop the new item when full
+    HEAD = 'head'       # drop the oldest item when full
+    RED = 'red'         # random early detection, drop new items with a probability rising with the depth
+
+
+class Layer_Queue(Queue):
+    def __init__(self, maxsize=1024*1000, policy='block', red_min=0.5, red_max=0.9, name="queue"):
+        '''
+        Queue.Queue with a drop policy, high watermark, drop counters and time in queue stats
+        :param maxsize: int for the max number of items in the queue
+        :param policy: string or Drop_Policy for what to do with puts to a full queue
+        :param red_min: float for the fraction of maxsize where red starts dropping
+        :param red_max: float for the fraction of maxsize where red drops every new item
+        :param name: string for the queue name in the stats
+        '''
+        Queue.__init__(self, maxsize)
+        self.policy = Drop_Policy(policy)
+        self.red_min = red_min*maxsize
+        self.red_max = red_max*maxsize
+        self.name = name
+
+        # Measurements
+        self.max_depth = 0
+        self.n_put = 0
+        self.n_get = 0
+        self.n_dropped = 0
+        self.total_wait = 0.0   # seconds items spent in the queue
+        self.max_wait = 0.0
+
+    def _init(self, maxsize):
+        self.queue = deque()
+
+    def _put(self, item):
+        self.queue.append((perf_counter(), item))
+        self.n_put += 1
+        if len(self.queue) > self.max_depth:
+            self.max_depth = len(self.queue)
+
+    def _get(self):
+        time_put, item = self.queue.popleft()
+        wait = perf_counter() - time_put
+        self.n_get += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        '''
+        Method to add an item, dropping an item instead of waiting if the policy is not block
+        :param item: item to add
+        :param block: bool to wait for space (only used by the block policy)
+        :param timeout: float for the max time to wait for space (only used by the block policy)
+        :return: bool for if the item was added
+        '''
+        if self.policy is Drop_Policy.BLOCK:
+            Queue.put(self, item, block, timeout)
+            return True
+
+        with self.not_full:
+            depth = self._qsize()
+            if self.policy is Drop_Policy.RED and depth >= self.red_min and (depth >= self.red_max or random.random() < (depth - self.red_min)/(self.red_max - self.red_min)):
+                self.n_dropped += 1
+                return False
+
+            if 0 < self.maxsize <= depth:
+                if self.policy is Drop_Policy.HEAD:
+                    self.queue.popleft()
+                    self.unfinished_tasks -= 1
+                    self.n_dropped += 1
+                else:
+                    self.n_dropped += 1
+                    return False
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            return True
+
+    def stats(self):
+        '''
+        Method to get the queue metrics
+        :return: dict of the current depth, high watermark, counters, and mean/max seconds spent in the queue
+        '''
+        with self.mutex:
+            return {"depth": len(self.queue), "max_depth": self.max_depth, "put": self.n_put, "get": self.n_get, "dropped": self.n_dropped,
+                    "mean_wait": self.total_wait/self.n_get if self.n_get else 0.0, "max_wait": self.max_wait}
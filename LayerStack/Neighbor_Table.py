@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+'''
+Neighbor Table object: radio probe delivery ratios, wifi link reports and etx route costs (distance vector)
+'''
+
+from threading import Lock
+from time import time
+import struct
+
+PROBE = struct.Struct('I')      # probe seq, payload of a neighbor discovery frame
+MAX_COST = 32.0                 # etx cost treated as unreachable, bounds counting to infinity
+REPORT_AGE = 3                  # probe intervals before a neighbor report is dropped
+
+class Neighbor_Table():
+    def __init__(self, my_usrp, my_pc, interval=1.0, window=10, hysteresis=0.2):
+        '''
+        Table of the links of a node. Radio links are one way (each hop has its own frequency), so a receiver measures
+        the delivery ratio of the probes it hears and reports it back over wifi, where the acks travel as well
+        etx of a link = 1/(delivery ratio), route cost = sum of the link etx along the path
+        :param my_usrp: bytes for the usrp address of the node
+        :param my_pc: bytes for the pc (wifi) address of the node
+        :param interval: float for the time in seconds between probes
+        :param window: int for the number of probes the delivery ratio is measured over
+        :param hysteresis: float for the relative cost improvement needed to change a route
+        '''
+        self.my_usrp = my_usrp
+        self.my_pc = my_pc
+        self.interval = interval
+        self.window = window
+        self.hysteresis = hysteresis
+        self.lock = Lock()
+
+        self.seq = 0
+        self.heard = {}     # transmitter usrp -> [highest probe seq, bitmask of received seqs (bit 0 = highest), time heard]
+        self.reports = {}   # neighbor usrp -> [neighbor pc, {usrp: delivery ratio}, {pc: cost}, time received]
+
+        # Measurements
+        self.n_probes_sent = 0
+        self.n_probes_recv = 0
+        self.n_reports = 0
+        self.n_bad_reports = 0     # malformed reports, dropped
+
+    def next_probe(self):
+        '''
+        Method to get the payload of the next probe
+        :return: bytes for the probe payload
+        '''
+        self.seq += 1
+        self.n_probes_sent += 1
+        return PROBE.pack(self.seq)
+
+    def recv_probe(self, transmitter, payload, now=None):
+        '''
+        Method to record a probe heard over the radio
+        :param transmitter: bytes for the usrp address of the node that sent the probe
+        :param payload: bytes-like probe payload
+        :param now: float for the current time, read if None
+        '''
+        if now is None:
+            now = time()
+        (seq,) = PROBE.unpack_from(payload)
+        with self.lock:
+            self.n_probes_recv += 1
+            link = self.heard.get(transmitter)
+            if link is None or seq + self.window <= link[0]:     # new neighbor, or it restarted
+                self.heard[transmitter] = [seq, 1, now]
+            elif seq > link[0]:
+                link[1] = ((link[1] << (seq - link[0])) | 1) & ((1 << self.window) - 1)
+                link[0] = seq
+                link[2] = now
+            elif link[0] - seq < self.window:
+                link[1] |= 1 << (link[0] - seq)
+
+    def delivery_ratio(self, transmitter, now=None):
+        '''
+        Method to get the fraction of the last window probes of a transmitter that were heard, missed probes count since the last one
+        :param transmitter: bytes for the usrp address of the transmitter
+        :param now: float for the current time, read if None
+        :return: float for the delivery ratio (0.0-1.0)
+        '''
+        if now is None:
+            now = time()
+        link = self.heard.get(transmitter)
+        if link is None:
+            return 0.0
+        missed = int((now - link[2])/self.interval)       # probes expected since the last one heard
+        if missed >= self.window:
+            return 0.0
+        return bin(link[1] & ((1 << (self.window - missed)) - 1)).count('1')/self.window
+
+    def build_report(self, costs, now=None):
+        '''
+        Method to encode the wifi report of the node: who it hears and its route costs
+        [usrp;pc;usrp=ratio,...;pc=cost,...]
+        :param costs: dict of destination pc -> cost of the routes of the node
+        :param now: float for the current time, read if None
+        :return: bytes for the report
+        '''
+        with self.lock:
+            heard = ','.join(usrp.decode('utf-8') + '=' + str(round(self.delivery_ratio(usrp, now), 3)) for usrp in self.heard)
+        routes = ','.join(pc.decode('utf-8') + '=' + str(round(cost, 3)) for pc, cost in costs.items())
+        return (self.my_usrp.decode('utf-8') + ';' + self.my_pc.decode('utf-8') + ';' + heard + ';' + routes).encode('utf-8')
+
+    def recv_report(self, report, now=None):
+        '''
+        Method to store the wifi report of a neighbor, malformed reports are counted and dropped
+        :param report: bytes for the report (see build_report)
+        :param now: float for the current time, read if None
+        '''
+        if now is None:
+            now = time()
+        try:
+            usrp, pc, heard, routes = report.decode('utf-8').split(';')
+            heard = {bytes(key, 'utf-8'): float(value) for key, value in (entry.split('=') for entry in heard.split(',') if entry)}
+            routes = {bytes(key, 'utf-8'): float(value) for key, value in (entry.split('=') for entry in routes.split(',') if entry)}
+        except (ValueError, UnicodeDecodeError):
+            with self.lock:
+                self.n_bad_reports += 1
+            return
+        usrp = bytes(usrp, 'utf-8')
+        if usrp == self.my_usrp:
+            return
+        with self.lock:
+            self.reports[usrp] = [bytes(pc, 'utf-8'), heard, routes, now]
+            self.n_reports += 1
+
+    def link_etx(self, neighbor, now=None):
+        '''
+        Method to get the expected number of transmissions from this node to a neighbor
+        :param neighbor: bytes for the usrp address of the neighbor
+        :param now: float for the current time, read if None
+        :return: float for the link etx, MAX_COST if the neighbor does not hear this node
+        '''
+        if now is None:
+            now = time()
+        report = self.reports.get(neighbor)
+        if report is None or now - report[3] > REPORT_AGE*self.interval:
+            return MAX_COST
+        ratio = report[1].get(self.my_usrp, 0.0)
+        if ratio <= 1.0/MAX_COST:
+            return MAX_COST
+        return 1.0/ratio
+
+    def route_cost(self, destination, next_hop, now=None):
+        '''
+        Method to get the cost of reaching a destination through a neighbor
+        :param destination: bytes for the destination pc address
+        :param next_hop: bytes for the usrp address of the neighbor
+        :param now: float for the current time, read if None
+        :return: float for the route etx, MAX_COST if unreachable
+        '''
+        report = self.reports.get(next_hop)
+        if report is None:
+            return MAX_COST
+        cost = 0.0 if report[0] == destination else report[2].get(destination, MAX_COST)
+        return min(MAX_COST, self.link_etx(next_hop, now) + cost)
+
+    def best_routes(self, now=None):
+        '''
+        Method to get the cheapest next hop of every destination advertised by a neighbor
+        :param now: float for the current time, read if None
+        :return: dict of destination pc -> (next hop usrp, cost)
+        '''
+        if now is None:
+            now = time()
+        with self.lock:
+            destinations = set()
+            for pc, _, routes, _ in self.reports.values():
+                destinations.add(pc)
+                destinations.update(routes)
+            destinations.discard(self.my_pc)
+
+            best = {}
+            for destination in destinations:
+                for neighbor in self.reports:
+                    cost = self.route_cost(destination, neighbor, now)
+                    if cost < MAX_COST and (not destination in best or cost < best[destination][1]):
+                        best[destination] = (neighbor, cost)
+        return best
+
+    def should_switch(self, destination, current_hop, new_cost, now=None):
+        '''
+        Method to check if a new route is enough cheaper than the current one to switch (hysteresis)
+        :param destination: bytes for the destination pc address
+        :param current_hop: bytes for the usrp address of the current next hop, None if there is no route
+        :param new_cost: float for the cost of the new route
+        :param now: float for the current time, read if None
+        :return: bool to switch
+        '''
+        if current_hop is None:
+            return True
+        current_cost = self.route_cost(destination, current_hop, now)
+        return current_cost >= MAX_COST or new_cost < current_cost*(1.0 - self.hysteresis)
+
+    def stats(self):
+        '''
+        Method to get the neighbor state
+        :return: dict of the heard delivery ratios, the link etx to each reporting neighbor and the probe counters
+        '''
+        now = time()
+        with self.lock:
+            return {"heard": {usrp: round(self.delivery_ratio(usrp, now), 3) for usrp in self.heard},
+                    "etx": {usrp: round(self.link_etx(usrp, now), 3) for usrp in self.reports},
+                    "probes_sent": self.n_probes_sent, "probes_recv": self.n_probes_recv, "reports": self.n_reports, "bad_reports": self.n_bad_reports}
@@ -4,22 +4,90 @@
 Network layer parent class. Defines the basic structure of the stack
 '''
 IP_LEN = 20
+PAD_BYTE = b'\x00'		# struct.pack('x')
+QUEUE_SIZE = 1024*1000
+
+from LayerStack.Layer_Queue import Layer_Queue
+from LayerStack.Ring_Buffer import Ring_Buffer
+
+class Address_Table():
+	def __init__(self, length=IP_LEN):
+		'''
+		Table of known node addresses, padded/unpadded once and then served by lookup
+		:param length: int for the padded address length
+		'''
+		self.length = length
+		self.padded = {}	# ip -> padded ip
+		self.unpadded = {}	# padded ip -> ip
+
+	def register(self, ip):
+		'''
+		Method to add an address to the table
+		:param ip: string or bytes for the ip address
+		'''
+		if isinstance(ip, str):
+			ip = bytes(ip, "utf-8")
+		if not ip:
+			return
+		padded_ip = ip.ljust(self.length, PAD_BYTE)
+		self.padded[ip] = padded_ip
+		self.unpadded[padded_ip] = ip
+
+	def register_nodes(self, node_configs):
+		'''
+		Method to add the pc and usrp addresses of the nodes to the table
+		:param node_configs: list of Node_Config objects
+		'''
+		for config in node_configs:
+			self.register(config.pc_ip)
+			self.register(config.usrp_ip)
+
+	def pad(self, ip, length=IP_LEN):
+		'''
+		Method to pad an IP in bytes to a length
+		:param ip: bytes for the ip address to pad
+		:param length: int for the desired length
+		:return: bytes for the padded ip
+		'''
+		if length == self.length:
+			try:
+				return self.padded[ip]
+			except KeyError:
+				pass
+		return ip.ljust(length, PAD_BYTE)	# unknown address
+
+	def unpad(self, padded_ip):
+		'''
+		Method to unpad an IP in bytes from a length of 20 to its actual values
+		:param padded_ip: bytes of ip address with pad bytes
+		:return: bytes of ip address without pad bytes
+		'''
+		try:
+			return self.unpadded[padded_ip]
+		except KeyError:
+			return padded_ip.rstrip(PAD_BYTE)	# unknown address
+
+address_table = Address_Table()		# shared by all layers of the node
 
-import  struct
-from queue import Queue
 class Network_Layer():
-	def __init__(self, layer_name, window=1, debug=False):
+	def __init__(self, layer_name, window=1, debug=False, queue_size=QUEUE_SIZE, drop_policy='block'):
 		'''
 		Class to define the the basic structure of a network layer
 		:param layer_name: sting for the layer name
 		:param window: int for the number of l2 windows to open 
 		:param debug: bool for debug console outputs 
+		:param queue_size: int for the max number of packets in each of the up and down queues
+		:param drop_policy: string for what a full queue does with a new packet: 'block', 'tail', 'head' or 'red' (see Layer_Queue)
 		'''
 		self.layer_name = layer_name
-		self.up_queue = Queue(1024*1000)
-		self.down_queue = Queue(1024*1000)
+		self.queue_size = queue_size
+		self.drop_policy = drop_policy
+		self.up_queue = Layer_Queue(queue_size, drop_policy, name=layer_name+"_up")
+		self.down_queue = Layer_Queue(queue_size, drop_policy, name=layer_name+"_down")
 		self.window = window
 		self.debug = debug
+		self.up_fused = False		# pass_up input is delivered by direct calls from the lower layer
+		self.down_fused = False		# pass_down input is delivered by direct calls from the upper layer
 
 	def init_layers(self, upper=None, lower=None):
 		'''
@@ -35,8 +103,53 @@ class Network_Layer():
 		if lower:
 			self.prev_up_queue = lower.up_queue
 		else:
-			self.prev_up_queue = Queue(1024*1000)	# needed for l4 layer relay
+			self.prev_up_queue = Layer_Queue(self.queue_size, self.drop_policy, name=self.layer_name+"_relay")	# needed for l4 layer relay
+
 
+	def fuse(self, upper=None, lower=None):
+		'''
+		Method to call the neighbouring layers directly instead of through the queues (the called layer runs on the caller's thread)
+		:param upper: Network_Layer object whose handle_up receives this layer's up packets
+		:param lower: Network_Layer object whose handle_down receives this layer's down packets
+		'''
+		if upper:
+			self.send_up = upper.handle_up
+			upper.up_fused = True
+		if lower:
+			self.send_down = lower.handle_down
+			lower.down_fused = True
+
+	def set_queue_limits(self, queue_size, drop_policy='block'):
+		'''
+		Method to change the capacity and drop policy of the up and down queues (call before init_layers)
+		:param queue_size: int for the max number of packets in each queue
+		:param drop_policy: string for what a full queue does with a new packet
+		'''
+		self.queue_size = queue_size
+		self.drop_policy = drop_policy
+		self.up_queue = Layer_Queue(queue_size, drop_policy, name=self.layer_name+"_up")
+		self.down_queue = Layer_Queue(queue_size, drop_policy, name=self.layer_name+"_down")
+
+	def use_ring_buffers(self, up=True, down=False, capacity=4096, slot_size=200):
+		'''
+		Method to replace the up and/or down queue with a Ring_Buffer (call before init_layers)
+		only for queues with one producer thread and one consumer thread
+		:param up: bool to replace the up queue
+		:param down: bool to replace the down queue
+		:param capacity: int for the number of ring slots
+		:param slot_size: int for the max byte length of a packet in the queue
+		'''
+		if up:
+			self.up_queue = Ring_Buffer(capacity, slot_size, name=self.layer_name+"_up")
+		if down:
+			self.down_queue = Ring_Buffer(capacity, slot_size, name=self.layer_name+"_down")
+
+	def queue_stats(self):
+		'''
+		Method to get the occupancy metrics of the layer queues
+		:return: dict of queue name -> Layer_Queue stats
+		'''
+		return {self.up_queue.name: self.up_queue.stats(), self.down_queue.name: self.down_queue.stats()}
 		
 	def pass_up(self, stop):
 		'''
@@ -49,17 +162,28 @@ class Network_Layer():
 		pass down to be overritten by child class
 		'''
 
-	def pad(self, ip, length=20):
+	def send_up(self, packet):
+		'''
+		Method to hand a packet to the next upper layer, replaced by the upper layer's handle_up when layers are fused
+		:param packet: bytes-like packet
+		'''
+		self.up_queue.put(packet, True)
+
+	def send_down(self, packet):
+		'''
+		Method to hand a packet to the next lower layer, replaced by the lower layer's handle_down when layers are fused
+		:param packet: bytes-like packet
+		'''
+		self.down_queue.put(packet, True)
+
+	def pad(self, ip, length=IP_LEN):
 		'''
 		Method to pad an IP in bytes to a length 
 		:param ip: bytes for the ip address to pad
 		:param length: int for the desired length
 		:return: bytes for the padded ip
 		'''
-		padded_ip = ip
-		for ii in range(length-len(ip)):
-			padded_ip = padded_ip + struct.pack('x')	# add struct pad byte
-		return padded_ip
+		return address_table.pad(ip, length)
 
 	def unpad(self, padded_ip):
 		'''
@@ -67,5 +191,4 @@ class Network_Layer():
 		:param padded_ip: bytes of ip address with pad bytes
 		:return: bytes of ip address without pad bytes
 		'''
-		num = padded_ip.count(struct.pack('x'))	# count the number of pad bytes
-		return padded_ip[:-num]
\ No newline at end of file
+		return address_table.unpad(padded_ip)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+'''
+Radio Process object: runs layer 1 and layer 2 (radio io, arq timers, l2 acks) in a separate process from the upper layers
+'''
+
+from multiprocessing import Process, Queue
+from queue import Empty
+from threading import Thread
+
+from LayerStack.Shm_Ring import Shm_Ring
+from LayerStack.Dispatcher import Dispatcher
+from LayerStack import Control_Plane, Layer1, Layer2
+
+class Radio_Process(Process):
+    def __init__(self, my_config, slot_size, capacity=4096, num_frames=1, adaptive_timeout=True, l1_batch_size=1, l2_window=1, ack_interval=0.0, emulator=None, l1_debug=False, l2_debug=False):
+        '''
+        Process holding Layer1, Layer2 and the l2 ack listener, linked to the parent's Layer3 by two shared memory rings.
+        In the parent the object stands in for Layer1/Layer2: up_queue is the l2 -> l3 ring and the gain setters are forwarded.
+        :param my_config: Node_Config object for the current node
+        :param slot_size: int for the max byte length of an item on the rings (the larger of the l4 packet and l2 frame sizes)
+        :param capacity: int for the number of slots per ring
+        :param num_frames: int for the number of l2 frames in one l4 packet
+        :param adaptive_timeout: bool to set the l2 ack timeout of each neighbor from its measured rtt
+        :param l1_batch_size: int for the max number of frames layer 1 sends/receives per zmq call
+        :param l2_window: int for the l2 selective repeat window per destination, 1 for stop-and-wait
+        :param ack_interval: float for the time in seconds to coalesce l2 acks, 0 to send each ack
+        :param emulator: dict of Loopback_Radio settings to emulate the usrp, None to use the usrp
+        :param l1_debug: bool for layer 1 debug outputs
+        :param l2_debug: bool for layer 2 debug outputs
+        '''
+        Process.__init__(self, name="radio", daemon=True)
+        self.layer_name = "radio"
+        self.window = 0
+        self.my_config = my_config
+        self.num_frames = num_frames
+        self.adaptive_timeout = adaptive_timeout
+        self.l1_batch_size = l1_batch_size
+        self.l2_window = l2_window
+        self.ack_interval = ack_interval
+        self.emulator = emulator
+        self.l1_debug = l1_debug
+        self.l2_debug = l2_debug
+
+        self.down_ring = Shm_Ring(capacity, slot_size)     # l3 -> l2 frames
+        self.up_ring = Shm_Ring(capacity, slot_size)       # l2 -> l3 packets
+        self.up_queue = self.up_ring
+        self.commands = Queue()
+
+    # Parent side
+
+    def set_tx_gain(self, gain):
+        '''
+        Method to adjust the USRP tx gain in the radio process
+        :param gain: float for the new normalized  gain (0.0-1.0)
+        '''
+        self.commands.put(('set_tx_gain', gain))
+
+    def set_rx_gain(self, gain):
+        '''
+        Method to adjust the USRP rx gain in the radio process
+        :param gain: float for the new normalized  gain (0.0-1.0)
+        '''
+        self.commands.put(('set_rx_gain', gain))
+
+    def set_location(self, global_index):
+        '''
+        Method to move the node on the emulated radio channel of the radio process
+        :param global_index: int for the global location index
+        '''
+        self.commands.put(('set_location', global_index))
+
+    def queue_stats(self):
+        '''
+        Method to get the ring metrics seen from the parent
+        :return: dict of ring name -> stats
+        '''
+        return {"radio_down": self.down_ring.stats(), "radio_up": self.up_ring.stats()}
+
+    def close(self, timeout=1.0):
+        '''
+        Method to stop the radio process and free the rings
+        :param timeout: float for the time in seconds to wait for the process before terminating it
+        '''
+        if self.is_alive():
+            self.commands.put(('stop',))
+            self.join(timeout)
+            if self.is_alive():
+                self.terminate()
+        self.down_ring.close()
+        self.up_ring.close()
+
+    # Radio process side
+
+    def run(self):
+        '''
+        Radio process main: builds l1/l2, starts their threads and serves commands until stopped
+        '''
+        stopped = [False]
+        stop = lambda : stopped[0]
+
+        dispatcher = Dispatcher(name="radio", overflow='inline', debug=self.l1_debug or self.l2_debug)
+        control_plane = Control_Plane.Control_Plane(self.my_config.pc_ip, dispatcher=dispatcher, ack_interval=self.ack_interval, listen=('l2',))
+        layer2 = Layer2.Layer2(self.my_config.usrp_ip, send_ack=control_plane.send_l2_ack, dispatcher=dispatcher, num_frames=self.num_frames, arq_window=self.l2_window, adaptive_timeout=self.adaptive_timeout, debug=self.l2_debug)
+        layer1 = Layer1.Layer1(self.my_config, input_port=self.my_config.usrp_in_port, output_port=self.my_config.usrp_out_port, batch_size=self.l1_batch_size, emulator=self.emulator, debug=self.l1_debug)
+
+        layer1.init_layers(upper=layer2, lower=None)
+        layer2.init_layers(upper=None, lower=layer1)
+        layer2.prev_down_queue = self.down_ring
+        layer2.up_queue = self.up_ring
+
+        threads = [Thread(target=control_plane.listen_l2, args=(layer2.recv_ack, stop, layer2.recv_acks, ), daemon=True)]
+        if self.ack_interval > 0:
+            threads.append(Thread(target=control_plane.ack_flush_loop, args=(stop, ), daemon=True))
+        for layer in [layer1, layer2]:
+            threads.append(Thread(target=layer.pass_up, args=(stop, ), daemon=True))
+            threads.append(Thread(target=layer.pass_down, args=(stop, ), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while not stopped[0]:
+            try:
+                command = self.commands.get(True, 0.5)
+            except Empty:
+                continue
+            if command[0] == 'stop':
+                stopped[0] = True
+            elif command[0] == 'set_tx_gain':
+                layer1.set_tx_gain(command[1])
+            elif command[0] == 'set_rx_gain':
+                layer1.set_rx_gain(command[1])
+            elif command[0] == 'set_location':
+                layer1.set_location(command[1])
+
+        for thread in threads:
+            thread.join(0.1)
+        print("Radio dispatcher:", dispatcher.stats())
+        for name, stats in list(layer1.queue_stats().items()) + list(layer2.queue_stats().items()):
+            print(name+":", stats)
+        print("layer_2 rtt:", layer2.rtt.stats())
+        layer1.tb.stop()
+        layer1.tb.wait()
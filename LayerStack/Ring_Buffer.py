@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+'''
+Ring Buffer object: single producer / single consumer queue of preallocated fixed size slots
+'''
+
+from queue import Empty, Full
+from threading import Event
+from time import time, sleep
+
+SPIN = 20     # yields before a waiting side blocks on its event
+
+class Ring_Buffer():
+    def __init__(self, capacity=1024, slot_size=200, name="ring"):
+        '''
+        SPSC ring buffer, a drop in for Layer_Queue on links with exactly one producer thread and one consumer thread.
+        The producer only writes tail and the consumer only writes head, so the fast path takes no lock, an Event is only
+        used to wake a side that found the ring full/empty.
+        :param capacity: int for the number of slots
+        :param slot_size: int for the max byte length of an item
+        :param name: string for the ring name in the stats
+        '''
+        self.capacity = capacity
+        self.maxsize = capacity
+        self.slot_size = slot_size
+        self.name = name
+
+        self.buffer = bytearray(capacity*slot_size)
+        self.view = memoryview(self.buffer)
+        self.lengths = [0]*capacity
+
+        self.head = 0   # next slot to read, only moved by the consumer
+        self.tail = 0   # next slot to write, only moved by the producer
+
+        self.not_empty = Event()
+        self.not_full = Event()
+        self.consumer_waiting = False
+        self.producer_waiting = False
+
+        # Measurements
+        self.max_depth = 0
+        self.n_dropped = 0
+
+    def qsize(self):
+        return self.tail - self.head
+
+    def empty(self):
+        return self.tail == self.head
+
+    def full(self):
+        return self.tail - self.head >= self.capacity
+
+    def has_item(self):
+        return self.tail != self.head
+
+    def has_space(self):
+        return self.tail - self.head < self.capacity
+
+    def wait_for(self, ready, event, side, block, timeout):
+        '''
+        Method to wait until ready() is true
+        :param ready: function returning true once the ring can be used
+        :param event: Event set by the other side
+        :param side: string for the waiting flag to raise ('consumer_waiting' or 'producer_waiting')
+        :param block: bool to wait or not
+        :param timeout: float for the max time in seconds to wait, None to wait forever
+        :return: bool for if ready() became true
+        '''
+        if not block:
+            return ready()
+        for ii in range(SPIN):     # the other side is usually about to move, yield before sleeping on the event
+            sleep(0)
+            if ready():
+                return True
+
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            event.clear()
+            setattr(self, side, True)
+            if ready():     # the other side moved before it could see the flag
+                setattr(self, side, False)
+                return True
+            remaining = None if deadline is None else deadline - time()
+            if remaining is not None and remaining <= 0:
+                setattr(self, side, False)
+                return ready()
+            event.wait(remaining)
+            setattr(self, side, False)
+            if ready():
+                return True
+
+    def put(self, item, block=True, timeout=None):
+        '''
+        Method to copy an item into the next slot
+        :param item: bytes-like item no longer than slot_size
+        :param block: bool to wait for a free slot
+        :param timeout: float for the max time in seconds to wait
+        '''
+        length = len(item)
+        if length > self.slot_size:
+            raise ValueError(self.name + ": item of " + str(length) + " bytes does not fit in a " + str(self.slot_size) + " byte slot")
+        if self.tail - self.head >= self.capacity and not self.wait_for(self.has_space, self.not_full, 'producer_waiting', block, timeout):
+            self.n_dropped += 1
+            raise Full
+
+        index = self.tail % self.capacity
+        start = index*self.slot_size
+        self.view[start:start+length] = item
+        self.lengths[index] = length
+        self.tail += 1      # publish the slot
+
+        depth = self.tail - self.head
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.consumer_waiting:
+            self.not_empty.set()
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def put_batch(self, items, block=True, timeout=None):
+        '''
+        Method to copy several items into the ring
+        :param items: list of bytes-like items
+        :param block: bool to wait for free slots
+        :param timeout: float for the max time in seconds to wait for each slot
+        '''
+        for item in items:
+            self.put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        '''
+        Method to copy the item out of the oldest slot
+        :param block: bool to wait for an item
+        :param timeout: float for the max time in seconds to wait
+        :return: bytearray copy of the item (free to keep and modify after the slot is reused)
+        '''
+        if self.tail == self.head and not self.wait_for(self.has_item, self.not_empty, 'consumer_waiting', block, timeout):
+            raise Empty
+
+        index = self.head % self.capacity
+        start = index*self.slot_size
+        item = bytearray(self.view[start:start+self.lengths[index]])
+        self.head += 1      # release the slot
+
+        if self.producer_waiting:
+            self.not_full.set()
+        return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def get_batch(self, max_items, block=True, timeout=None):
+        '''
+        Method to take up to max_items items, waiting only for the first one
+        :param max_items: int for the max number of items to return
+        :param block: bool to wait for the first item
+        :param timeout: float for the max time in seconds to wait for the first item
+        :return: list of bytearray items
+        '''
+        batch = [self.get(block, timeout)]
+        while len(batch) < max_items and self.tail != self.head:
+            batch.append(self.get(False))
+        return batch
+
+    def stats(self):
+        '''
+        Method to get the ring metrics
+        :return: dict of the current depth, high watermark, and drop counter
+        '''
+        return {"depth": self.qsize(), "max_depth": self.max_depth, "capacity": self.capacity, "dropped": self.n_dropped}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+'''
+Rtt Estimator object: per neighbor smoothed rtt and retransmission timeout (Jacobson/Karn, RFC 6298)
+'''
+
+from threading import Lock
+
+ALPHA = 0.125       # srtt gain
+BETA = 0.25         # rttvar gain
+K = 4               # rttvar weight in the rto
+GRANULARITY = 0.002     # min rttvar term in seconds, covers the thread wakeup jitter
+
+class Rtt_Estimator():
+    def __init__(self, initial_rto=1.0, min_rto=0.005, max_rto=2.0):
+        '''
+        Object to estimate the rto of each neighbor from the rtt of its acks
+        Only frames acked on their first transmission are sampled (Karn), a timeout doubles the rto until the next sample
+        :param initial_rto: float for the rto in seconds before the first sample of a neighbor
+        :param min_rto: float for the lowest rto in seconds
+        :param max_rto: float for the highest rto in seconds, also bounds the timeout backoff
+        '''
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.lock = Lock()
+        self.neighbors = {}     # key -> [srtt, rttvar, rto, backoff multiplier, n samples]
+
+    def clamp(self, rto):
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def sample(self, key, rtt):
+        '''
+        Method to update the estimate of a neighbor with the rtt of a packet that was not retransmitted
+        :param key: hashable neighbor key (ex: final ip byte)
+        :param rtt: float for the measured rtt in seconds
+        '''
+        with self.lock:
+            neighbor = self.neighbors.get(key)
+            if neighbor is None or neighbor[4] == 0:    # first sample
+                srtt = rtt
+                rttvar = rtt/2
+                n_samples = 0
+            else:
+                srtt, rttvar, _, _, n_samples = neighbor
+                rttvar = (1 - BETA)*rttvar + BETA*abs(srtt - rtt)
+                srtt = (1 - ALPHA)*srtt + ALPHA*rtt
+            self.neighbors[key] = [srtt, rttvar, self.clamp(srtt + max(GRANULARITY, K*rttvar)), 1, n_samples + 1]
+
+    def backoff(self, key):
+        '''
+        Method to double the rto of a neighbor after a timeout
+        :param key: hashable neighbor key
+        '''
+        with self.lock:
+            neighbor = self.neighbors.get(key)
+            if neighbor is None:
+                neighbor = [0.0, 0.0, self.clamp(self.initial_rto), 1, 0]
+                self.neighbors[key] = neighbor
+            if neighbor[2]*neighbor[3] < self.max_rto:
+                neighbor[3] *= 2
+
+    def rto(self, key):
+        '''
+        Method to get the current retransmission timeout of a neighbor
+        :param key: hashable neighbor key
+        :return: float for the rto in seconds
+        '''
+        neighbor = self.neighbors.get(key)
+        if neighbor is None:
+            return self.clamp(self.initial_rto)
+        return min(self.max_rto, neighbor[2]*neighbor[3])
+
+    def stats(self):
+        '''
+        Method to get the estimator state of each neighbor
+        :return: dict of key -> dict of srtt, rttvar, rto (seconds) and sample count
+        '''
+        with self.lock:
+            return {key: {"srtt": round(srtt, 6), "rttvar": round(rttvar, 6), "rto": round(min(self.max_rto, rto*backoff), 6), "samples": n_samples}
+                    for key, (srtt, rttvar, rto, backoff, n_samples) in self.neighbors.items()}
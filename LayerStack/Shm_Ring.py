@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+'''
+Shared Memory Ring object: single producer / single consumer ring between two processes
+'''
+
+from multiprocessing import shared_memory
+from queue import Empty, Full
+from time import time, sleep
+import struct
+
+LENGTH = struct.Struct('I')
+HEAD = 0                    # index (uint64) of the consumer position
+TAIL = 8                    # index (uint64) of the producer position, on a separate cache line
+SLOTS_OFFSET = 128
+SPIN = 50                   # yields before a waiting side starts sleeping
+MAX_SLEEP = 0.001           # longest sleep while waiting, bounds the wakeup latency
+
+class Shm_Ring():
+    def __init__(self, capacity=4096, slot_size=200, name=None, create=True):
+        '''
+        SPSC ring of fixed size slots in a multiprocessing.shared_memory block, same interface as Ring_Buffer.
+        The producer only writes tail and the consumer only writes head, a waiting side polls with a bounded sleep.
+        :param capacity: int for the number of slots
+        :param slot_size: int for the max byte length of an item
+        :param name: string for the shared memory block name, None to pick one when creating
+        :param create: bool to create the block (owner) or attach to an existing one
+        '''
+        self.capacity = capacity
+        self.maxsize = capacity
+        self.slot_size = slot_size
+        self.slot_stride = LENGTH.size + slot_size
+        self.owner = create
+
+        size = SLOTS_OFFSET + capacity*self.slot_stride
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.indexes = self.buf[:SLOTS_OFFSET].cast('Q')    # single 8 byte stores, struct.pack_into zero fills first so the other process could read 0
+        if create:
+            self.indexes[HEAD] = 0
+            self.indexes[TAIL] = 0
+
+        # Measurements (local to the process)
+        self.max_depth = 0
+        self.n_dropped = 0
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'slot_size': self.slot_size, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], state['slot_size'], name=state['name'], create=False)
+
+    def head(self):
+        return self.indexes[HEAD]
+
+    def tail(self):
+        return self.indexes[TAIL]
+
+    def qsize(self):
+        return self.tail() - self.head()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return self.qsize() >= self.capacity
+
+    def wait_for(self, ready, block, timeout):
+        '''
+        Method to poll until ready() is true
+        :param ready: function returning true once the ring can be used
+        :param block: bool to wait or not
+        :param timeout: float for the max time in seconds to wait, None to wait forever
+        :return: bool for if ready() became true
+        '''
+        if not block:
+            return ready()
+        deadline = None if timeout is None else time() + timeout
+        delay = 0.0
+        n_polls = 0
+        while not ready():
+            if deadline is not None and time() >= deadline:
+                return False
+            n_polls += 1
+            if n_polls > SPIN:
+                delay = min(MAX_SLEEP, delay*2 + 0.00001)
+            sleep(delay)
+        return True
+
+    def put(self, item, block=True, timeout=None):
+        '''
+        Method to copy an item into the next slot
+        :param item: bytes-like item no longer than slot_size
+        :param block: bool to wait for a free slot
+        :param timeout: float for the max time in seconds to wait
+        '''
+        length = len(item)
+        if length > self.slot_size:
+            raise ValueError(self.name + ": item of " + str(length) + " bytes does not fit in a " + str(self.slot_size) + " byte slot")
+        tail = self.tail()
+        if tail - self.head() >= self.capacity and not self.wait_for(lambda: tail - self.head() < self.capacity, block, timeout):
+            self.n_dropped += 1
+            raise Full
+
+        start = SLOTS_OFFSET + (tail % self.capacity)*self.slot_stride
+        LENGTH.pack_into(self.buf, start, length)
+        self.buf[start+LENGTH.size:start+LENGTH.size+length] = item
+        self.indexes[TAIL] = tail + 1       # publish the slot after its data
+
+        depth = tail + 1 - self.head()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def put_batch(self, items, block=True, timeout=None):
+        '''
+        Method to copy several items into the ring
+        :param items: list of bytes-like items
+        :param block: bool to wait for free slots
+        :param timeout: float for the max time in seconds to wait for each slot
+        '''
+        for item in items:
+            self.put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        '''
+        Method to copy the item out of the oldest slot
+        :param block: bool to wait for an item
+        :param timeout: float for the max time in seconds to wait
+        :return: bytearray copy of the item
+        '''
+        head = self.head()
+        if self.tail() == head and not self.wait_for(lambda: self.tail() != head, block, timeout):
+            raise Empty
+
+        start = SLOTS_OFFSET + (head % self.capacity)*self.slot_stride
+        (length,) = LENGTH.unpack_from(self.buf, start)
+        item = bytearray(self.buf[start+LENGTH.size:start+LENGTH.size+length])
+        self.indexes[HEAD] = head + 1       # release the slot
+        return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def get_batch(self, max_items, block=True, timeout=None):
+        '''
+        Method to take up to max_items items, waiting only for the first one
+        :param max_items: int for the max number of items to return
+        :param block: bool to wait for the first item
+        :param timeout: float for the max time in seconds to wait for the first item
+        :return: list of bytearray items
+        '''
+        batch = [self.get(block, timeout)]
+        while len(batch) < max_items and not self.empty():
+            batch.append(self.get(False))
+        return batch
+
+    def stats(self):
+        '''
+        Method to get the ring metrics
+        :return: dict of the current depth, high watermark, and drop counter
+        '''
+        return {"depth": self.qsize(), "max_depth": self.max_depth, "capacity": self.capacity, "dropped": self.n_dropped}
+
+    def close(self):
+        '''
+        Method to detach from the shared memory block, and free it if this ring created it
+        '''
+        if self.indexes is None:
+            return
+        self.indexes.release()
+        self.indexes = None
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __del__(self):
+        if getattr(self, 'indexes', None) is not None:
+            self.indexes.release()      # lets SharedMemory close its buffer on exit
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+'''
+Token Bucket object: deadline based rate limiter, sleeping is only used to wait for tokens so oversleeping does not lower the rate
+'''
+
+from time import perf_counter, sleep
+
+class Token_Bucket():
+    def __init__(self, rate, burst=1.0):
+        '''
+        Object to pace events to an average rate, allowing bursts of up to burst events
+        :param rate: float for the average number of tokens per second
+        :param burst: float for the max number of tokens that can build up (ex: while the sender was descheduled)
+        '''
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.last = perf_counter()
+
+    def set_rate(self, rate, burst=None):
+        '''
+        Method to change the rate without losing the current tokens
+        :param rate: float for the average number of tokens per second
+        :param burst: float for the max number of tokens, None to keep the current burst
+        '''
+        self.refill()
+        self.rate = float(rate)
+        if burst is not None:
+            self.burst = max(1.0, float(burst))
+            self.tokens = min(self.tokens, self.burst)
+
+    def refill(self):
+        '''
+        Method to add the tokens earned since the last refill
+        '''
+        now = perf_counter()
+        self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+        self.last = now
+
+    def consume(self, n=1):
+        '''
+        Method to take tokens if they are available
+        :param n: float for the number of tokens to take
+        :return: float for the time in seconds until the tokens are available, 0.0 if they were taken
+        '''
+        self.refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens)/self.rate
+
+    def wait(self, n=1, stop=lambda: False, max_wait=0.1):
+        '''
+        Method to block until n tokens are taken
+        :param n: float for the number of tokens to take
+        :param stop: function returning true/false to stop waiting
+        :param max_wait: float for the max time in seconds between checks of stop
+        :return: bool for if the tokens were taken (False if stopped)
+        '''
+        wait_time = self.consume(n)
+        while wait_time > 0.0:
+            if stop():
+                return False
+            sleep(min(wait_time, max_wait))
+            wait_time = self.consume(n)
+        return True
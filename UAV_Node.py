@@ -12,7 +12,13 @@ import tensorflow.compat.v1 as tf
 import csv, os, datetime
 
 # User Libraries
-from LayerStack import Control_Plane, Layer1, Layer2, Layer3, Layer4, Layer5
+from LayerStack import Control_Plane, Async_Control_Plane, Layer1, Layer2, Layer3, Layer4, Layer5
+from LayerStack.Radio_Process import Radio_Process
+from LayerStack.L1_protocols.Channel_Model import Channel_Model
+from LayerStack.L1_protocols.Loopback_Radio import Loopback_Medium, MEDIUM_IN_PORT
+from LayerStack.Neighbor_Table import Neighbor_Table
+from LayerStack.Network_Layer import address_table
+from LayerStack.Dispatcher import Dispatcher
 from Utils.Node_Config import Node_Config
 from Utils.Transforms import global_to_NED
 from BasicArducopter.BasicArdu.BasicArdu import BasicArdu, Frames
@@ -46,7 +52,23 @@ class UAV_Node():
                     global_home=None,
                     is_dji=False,
                     use_timeout=False,
-                    test_timeout=5
+                    test_timeout=5,
+                    l1_batch_size=1,
+                    async_control_plane=False,
+                    ack_interval=0.0,
+                    l2_window=1,
+                    l5_rate=1000000,
+                    queue_size=1024*1000,
+                    drop_policy='block',
+                    ring_buffers=False,
+                    fused=False,
+                    split_radio=False,
+                    num_frames=1,
+                    adaptive_timeout=True,
+                    congestion=None,
+                    neighbor_discovery=False,
+                    cut_through=False,
+                    emulator=None
                     ):
         '''
         Emane Node class for network stack
@@ -65,6 +87,22 @@ class UAV_Node():
         :param log_base_name: string for the directory and base name to save log files
         :param csv_in: bool for if actions should be determined from the csv file or the neural network
         :param model_path: string for the directory for the neural network model
+        :param l1_batch_size: int for the max number of frames layer 1 sends/receives per zmq call
+        :param async_control_plane: bool to serve all control plane sockets from one asyncio event loop thread
+        :param ack_interval: float for the time in seconds to coalesce wifi acks into one message per destination, 0 to send each ack
+        :param l2_window: int for the l2 selective repeat window per destination, 1 for stop-and-wait
+        :param l5_rate: float for the layer 5 traffic generation rate in bps
+        :param queue_size: int for the max number of packets in each inter-layer queue
+        :param drop_policy: string for what a full inter-layer queue does with a new packet: 'block', 'tail', 'head' or 'red'
+        :param ring_buffers: bool to link layers with SPSC ring buffers where a queue has one producer and one consumer thread
+        :param fused: bool to run l2 -> l3 -> l4 up and l4 -> l3 down as direct calls instead of a thread per layer
+        :param split_radio: bool to run layer 1 and layer 2 in a separate process, linked to layer 3 by shared memory rings
+        :param num_frames: int for the number of l2 frames in one l4 packet
+        :param adaptive_timeout: bool to set the l2 and l4 ack timeouts from the measured rtt instead of the fixed defaults
+        :param congestion: string for the l4 congestion controller ('aimd' or 'delay') pacing l5 below l5_rate, None for a fixed rate
+        :param neighbor_discovery: bool to probe the radio links and pick the l3 next hops by etx (needs layer 2 in this process)
+        :param cut_through: bool for relays to forward each l2 frame on arrival instead of reassembling the l4 packet (needs layer 2 in this process, forwarded packets are not in the relay l4 log)
+        :param emulator: dict of Loopback_Radio settings (delay, loss, rate, duplicate, channel) to run layer 1 on an emulated radio, None to use the usrp
         TODO
         '''
         self.log = log
@@ -95,22 +133,65 @@ class UAV_Node():
         self.threads = {}
 
         # Initalize Network Stack
-        self.control_plane = Control_Plane.Control_Plane(my_config.pc_ip)
+        self.dispatcher = Dispatcher(name="acks", overflow='inline', debug=l2_debug or l4_debug)   # ack send/receive callbacks, run inline instead of dropped when full
+        self.log_dispatcher = Dispatcher(name="log", debug=l4_debug)     # l4 csv writes, kept off the ack path so file io does not add to the rtt
+        self.async_control_plane = async_control_plane
+        self.fused = fused
+        self.split_radio = split_radio and use_radio
+        self.emulator = emulator
+        self.neighbor_table = None
+        if neighbor_discovery and use_radio and not self.split_radio:
+            self.neighbor_table = Neighbor_Table(bytes(my_config.usrp_ip, "utf-8"), bytes(my_config.pc_ip, "utf-8"))
+        listen = ('l4', 'cc') if self.split_radio else ('l2', 'l4', 'cc')     # the radio process listens for l2 acks
+        if self.async_control_plane:
+            self.control_plane = Async_Control_Plane.Async_Control_Plane(my_config.pc_ip, dispatcher=self.dispatcher, ack_interval=ack_interval, listen=listen)
+        else:
+            self.control_plane = Control_Plane.Control_Plane(my_config.pc_ip, dispatcher=self.dispatcher, ack_interval=ack_interval, listen=listen)
+        if self.neighbor_table is not None:
+            self.control_plane.neighbor_recv = self.neighbor_table.recv_report
         
         if self.use_radio:
-            self.layer4 = Layer4.Layer4(self.my_config, self.control_plane.send_l4_ack, debug=l4_debug, log=self.log, l4_log_base_name=log_base_name+"l4_")
+            self.layer4 = Layer4.Layer4(self.my_config, self.control_plane.send_l4_ack, num_frames=num_frames, adaptive_timeout=adaptive_timeout, congestion=congestion, debug=l4_debug, log=self.log, l4_log_base_name=log_base_name+"l4_", dispatcher=self.dispatcher, log_dispatcher=self.log_dispatcher)
             self.layer3 = Layer3.Layer3(self.my_config, debug=l3_debug)
-            self.layer2 = Layer2.Layer2(self.my_config.usrp_ip, send_ack=self.control_plane.send_l2_ack, debug=l2_debug)
-            self.layer1 = Layer1.Layer1(self.my_config, debug=l1_debug)
-            self.layer5 = Layer5.Layer5(self.my_config, self.layer4, debug=l5_debug)
+            if self.split_radio:    # stands in for layer 1 and layer 2 (gains, up queue)
+                self.radio = Radio_Process(self.my_config, max(self.layer4.l4_size, self.layer4.l2_size), num_frames=num_frames, adaptive_timeout=adaptive_timeout, l1_batch_size=l1_batch_size, l2_window=l2_window, ack_interval=ack_interval, emulator=emulator, l1_debug=l1_debug, l2_debug=l2_debug)
+                self.layer2 = None
+                self.layer1 = self.radio
+                self.stack_layers = [self.layer3, self.layer4]
+            else:
+                self.layer2 = Layer2.Layer2(self.my_config.usrp_ip, send_ack=self.control_plane.send_l2_ack, dispatcher=self.dispatcher, num_frames=num_frames, arq_window=l2_window, adaptive_timeout=adaptive_timeout, neighbor_table=self.neighbor_table, relay=self.layer3.relay_hop if cut_through else None, debug=l2_debug)
+                self.layer1 = Layer1.Layer1(self.my_config, input_port=self.my_config.usrp_in_port, output_port=self.my_config.usrp_out_port, batch_size=l1_batch_size, emulator=emulator, debug=l1_debug)
+                self.stack_layers = [self.layer1, self.layer2, self.layer3, self.layer4]
+            self.layer5 = Layer5.Layer5(self.my_config, self.layer4, rate=l5_rate, debug=l5_debug)
 
             # Link layers together
-            self.layer1.init_layers(upper=self.layer2, lower=None)
-            self.layer2.init_layers(upper=self.layer3, lower=self.layer1)
-            self.layer3.init_layers(upper=self.layer4, lower=self.layer2)
+            for layer in self.stack_layers + [self.layer5]:
+                layer.set_queue_limits(queue_size, drop_policy)
+            if ring_buffers:    # l5 down (l4 relays) and l2 down (usrp acks) have two producers, l4 down has one per window
+                slot_size = max(self.layer4.l4_size, self.layer4.l2_size)     # l4 packets up, l2 frames down
+                relay_frames = self.layer2 is not None and self.layer2.relay is not None     # l2 receive thread puts cut-through frames on the l3 down queue
+                for layer in self.stack_layers:
+                    single_producer = layer.window == 1 if layer is self.layer4 else (layer is self.layer3 and not relay_frames and not (fused and self.layer4.window > 1))  # fused l3 down runs on every l4 window thread
+                    layer.use_ring_buffers(up=True, down=single_producer, slot_size=slot_size)
+            if self.split_radio:
+                self.layer3.down_queue = self.radio.down_ring
+                self.layer3.init_layers(upper=self.layer4, lower=self.radio)
+            else:
+                self.layer1.init_layers(upper=self.layer2, lower=None)
+                self.layer2.init_layers(upper=self.layer3, lower=self.layer1)
+                self.layer3.init_layers(upper=self.layer4, lower=self.layer2)
             self.layer4.init_layers(upper=self.layer5, lower=self.layer3)  # link l4 to this class object
             self.layer5.init_layers(upper=None, lower=self.layer4)
 
+            # Fused pipeline: the l2 receive thread runs l3 and l4 up, the l4 send threads run l3 down
+            # l2 pass_down keeps its own thread for the arq timers, l1 and l5 stay on the zmq/app queues
+            if self.fused:
+                if not self.split_radio:
+                    self.layer2.fuse(upper=self.layer3)
+                self.layer3.fuse(upper=self.layer4)
+                if not (self.split_radio and self.layer4.window > 1):   # the shared memory ring takes one producer
+                    self.layer4.fuse(lower=self.layer3)
+
         # Drone parameters
         if self.fly_drone and not self.is_dji:
             if self.is_sim==True:
@@ -165,20 +246,46 @@ class UAV_Node():
         print("~ ~ Starting Threads ~ ~", end='\n\n')
 
         # Initialize threads
-        if self.use_radio:
-            self.threads["L2_ACK_RCV"] = Thread(target=self.control_plane.listen_l2, args=(self.layer2.recv_ack, lambda : self.stop_threads, ))
-            self.threads["L2_ACK_RCV"].start()
+        if self.use_radio and self.split_radio:
+            self.radio.start()
+
+        if self.async_control_plane:   # one event loop thread for all control plane sockets
+            if self.use_radio and not self.split_radio:
+                acks = (self.layer2.recv_ack, self.layer4.recv_ack, self.layer2.recv_acks, self.layer4.recv_acks)
+            elif self.use_radio:
+                acks = (None, self.layer4.recv_ack, None, self.layer4.recv_acks)
+            else:
+                acks = (None, None, None, None)
+            self.threads["CONTROL_PLANE"] = Thread(target=self.control_plane.run, args=(acks[0], acks[1], self.handle_state, self.handle_get_state, lambda : self.stop_threads, acks[2], acks[3], ))
+            self.threads["CONTROL_PLANE"].start()
+
+        else:
+            if self.use_radio:
+                if not self.split_radio:
+                    self.threads["L2_ACK_RCV"] = Thread(target=self.control_plane.listen_l2, args=(self.layer2.recv_ack, lambda : self.stop_threads, self.layer2.recv_acks, ))
+                    self.threads["L2_ACK_RCV"].start()
+
+                self.threads["L4_ACK_RCV"] = Thread(target=self.control_plane.listen_l4, args=(self.layer4.recv_ack, lambda : self.stop_threads, self.layer4.recv_acks, ))
+                self.threads["L4_ACK_RCV"].start()
 
-            self.threads["L4_ACK_RCV"] = Thread(target=self.control_plane.listen_l4, args=(self.layer4.recv_ack, lambda : self.stop_threads, ))
-            self.threads["L4_ACK_RCV"].start()
+            if self.control_plane.ack_interval > 0:
+                self.threads["ACK_FLUSH"] = Thread(target=self.control_plane.ack_flush_loop, args=(lambda : self.stop_threads, ))
+                self.threads["ACK_FLUSH"].start()
 
-        self.threads["STATE_RCV"] = Thread(target=self.control_plane.listen_cc, args=(self.handle_state, self.handle_get_state, lambda : self.stop_threads, ))
-        self.threads["STATE_RCV"].start()
+            self.threads["STATE_RCV"] = Thread(target=self.control_plane.listen_cc, args=(self.handle_state, self.handle_get_state, lambda : self.stop_threads, ))
+            self.threads["STATE_RCV"].start()
+
+        if self.neighbor_table is not None:
+            self.threads["NEIGHBOR"] = Thread(target=self.neighbor_discovery, args=(lambda : self.stop_threads, ))
+            self.threads["NEIGHBOR"].start()
 
         if self.use_radio:
-            for layer in [self.layer1, self.layer2, self.layer3, self.layer4]:
-                self.threads[layer.layer_name + "_pass_up"] = Thread(target=layer.pass_up, args=(lambda : self.stop_threads,))
-                self.threads[layer.layer_name + "_pass_up"].start()
+            for layer in self.stack_layers:
+                if not layer.up_fused:      # fused layers run on the thread of the layer calling them
+                    self.threads[layer.layer_name + "_pass_up"] = Thread(target=layer.pass_up, args=(lambda : self.stop_threads,))
+                    self.threads[layer.layer_name + "_pass_up"].start()
+                if layer.down_fused:
+                    continue
                 for jj in range(layer.window):
                     self.threads[layer.layer_name + "_pass_down_"+str(jj)] = Thread(target=layer.pass_down, args=(lambda : self.stop_threads,))
                     self.threads[layer.layer_name + "_pass_down_"+str(jj)].start() 
@@ -198,6 +305,8 @@ class UAV_Node():
         Method to close all of the threads and subprocesses
         '''
         self.stop_threads = True
+        if self.async_control_plane:
+            self.control_plane.close()
         if self.use_radio:
             self.layer4.file.close()    # close l4 logging file
 
@@ -208,9 +317,42 @@ class UAV_Node():
             except Exception as e:
                 print(e)
                 pass
+        print("Dispatcher:", self.dispatcher.stats())
+        print("Log dispatcher:", self.log_dispatcher.stats())
+        if self.use_radio:
+            for layer in self.stack_layers + [self.layer5]:
+                for name, stats in layer.queue_stats().items():
+                    print(name+":", stats)
+            for layer in [self.layer2, self.layer4]:
+                if layer is not None:
+                    print(layer.layer_name, "rtt:", layer.rtt.stats())
+            print("layer_3 routes:", self.layer3.forwarding_table.stats())
+            if self.emulator is not None and not self.split_radio:
+                print("layer_1 emulated radio:", self.layer1.tb.stats())
+            if self.layer2 is not None and self.layer2.relay is not None:
+                print("layer_2 cut through frames:", self.layer2.n_cut_through)
+            if self.neighbor_table is not None:
+                print("neighbors:", self.neighbor_table.stats(), "route changes:", self.layer3.n_route_changes)
+            if self.layer4.congestion is not None:
+                print("layer_4 congestion:", self.layer4.congestion.stats())
+            if self.split_radio:
+                self.radio.close()
+        self.dispatcher.stop()
+        self.log_dispatcher.stop()
         print("\n ~ ~ Threads Closed ~ ~", end='\n\n')
         os._exit(0)
 
+    def neighbor_discovery(self, stop):
+        '''
+        Method to probe the radio links, update the l3 routes and broadcast the link report over wifi every probe interval
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            self.layer2.send_probe()
+            costs = self.layer3.update_routes(self.neighbor_table)
+            self.control_plane.broadcast_neighbors(self.neighbor_table.build_report(costs))
+            sleep(self.neighbor_table.interval)
+
     def handle_state(self, node_index, loc_index, pow_index):
         '''
         Method to handle receiving state info from another node
@@ -480,6 +622,8 @@ class UAV_Node():
 
         # Change Location
         self.action_move(global_to_NED(self.loc_index))  
+        if self.use_radio and self.emulator is not None:
+            self.layer1.set_location(self.loc_index)
 
     def action_move(self, coords):
         '''
@@ -538,6 +682,33 @@ def arguement_parser():
     parser.add_argument('--is_dji', type=str, default='n', help='dji drone? (y/n)')
     parser.add_argument('--global_home', type=str, default='42.47777625687639,-71.19357940183706,174.0', help='Global Home Location')
     
+    parser.add_argument('--l1_batch', type=int, default=1, help='max frames per layer 1 zmq message')
+    parser.add_argument('--async_cp', type=str, default='n', help='asyncio control plane (y/n)')
+    parser.add_argument('--ack_interval', type=float, default=0.0, help='wifi ack coalescing interval (s), 0 to disable')
+    parser.add_argument('--l2_window', type=int, default=1, help='l2 selective repeat window, 1 for stop-and-wait')
+    parser.add_argument('--l5_rate', type=float, default=1000000, help='layer 5 traffic generation rate (bps)')
+    parser.add_argument('--queue_size', type=int, default=1024*1000, help='max packets per inter-layer queue')
+    parser.add_argument('--drop_policy', type=str, default='block', help='full queue policy (block/tail/head/red)')
+    parser.add_argument('--ring', type=str, default='n', help='spsc ring buffers between layers (y/n)')
+    parser.add_argument('--fused', type=str, default='n', help='run l2-l4 as direct calls instead of a thread per layer (y/n)')
+    parser.add_argument('--split_radio', type=str, default='n', help='run l1/l2 in a separate process (y/n)')
+    parser.add_argument('--num_frames', type=int, default=1, help='l2 frames per l4 packet')
+    parser.add_argument('--adaptive_timeout', type=str, default='y', help='rtt based l2/l4 ack timeouts (y/n)')
+    parser.add_argument('--congestion', type=str, default='none', help='l4 congestion controller (none/aimd/delay)')
+    parser.add_argument('--nd', type=str, default='n', help='neighbor discovery and etx routing (y/n)')
+    parser.add_argument('--shared_relays', type=str, default='n', help='both relays get the routes of both flows, rly1 forwards both (y/n)')
+    parser.add_argument('--cut_through', type=str, default='n', help='relays forward l2 frames without l4 reassembly, not logged at l4 (y/n)')
+    parser.add_argument('--emulate', type=str, default='n', help='emulated radio on a loopback medium instead of the usrp (y/n), one node per host (wifi ports), testbed.py runs all nodes on one host')
+    parser.add_argument('--emu_medium_host', type=str, default='127.0.0.1', help='address of the host running the emulated medium')
+    parser.add_argument('--emu_medium_port', type=int, default=MEDIUM_IN_PORT, help='emulated medium port, frames are sent to this port and received from the next one')
+    parser.add_argument('--emu_start_medium', type=str, default='n', help='run the emulated medium in this node for the other nodes to connect to (y/n)')
+    parser.add_argument('--l1_port', type=int, default=55555, help='zmq port from layer 1 to the radio, the radio answers on the next one')
+    parser.add_argument('--emu_delay', type=float, default=0.0, help='emulated radio delay (s)')
+    parser.add_argument('--emu_loss', type=float, default=0.0, help='emulated radio frame loss probability')
+    parser.add_argument('--emu_rate', type=float, default=0.0, help='emulated radio tx rate (bps), 0 for no limit')
+    parser.add_argument('--emu_dup', type=float, default=0.0, help='emulated radio frame duplication probability')
+    parser.add_argument('--emu_channel', type=str, default='n', help='emulated radio loss from the drone locations and tx gain (y/n)')
+
     parser.add_argument('--l1', type=str, default='n', help='layer 1 debug (y/n)')
     parser.add_argument('--l2', type=str, default='n', help='layer 2 debug (y/n)')
     parser.add_argument('--l3', type=str, default='n', help='layer 3 debug (y/n)')
@@ -578,6 +749,15 @@ def main():
     rly2.configure_hops( src=src2, dest=dest2, next_hop=dest2, prev_hop=src2)
     src2.configure_hops( src=src2, dest=dest2, next_hop=rly2,  prev_hop=None)
 
+    # Both relays get the routes of both flows, route 2 is sent through rly1
+    if options.shared_relays == 'y' or options.shared_relays == 'Y':
+        rly1.relay_flow(src=src2, dest=dest2)
+        rly2.relay_flow(src=src1, dest=dest1)
+        src2.add_route(dest2, rly1)
+        dest2.add_route(src2, rly1)
+
+    # Pad/unpad the known node addresses once for all layers
+    address_table.register_nodes([dest1, rly1, src1, dest2, rly2, src2])
     
     if int(options.index) == 0:
         my_config = dest1
@@ -596,6 +776,18 @@ def main():
         exit(0)
     fly_drone = (options.fly_drone=='y' or options.fly_drone=='Y')
     is_dji = (options.is_dji=='y' or options.is_dji=='Y')
+    my_config.usrp_in_port = str(options.l1_port)
+    my_config.usrp_out_port = str(options.l1_port + 1)
+    emulator = None
+    medium = None
+    if options.emulate=='y' or options.emulate=='Y':
+        emulator = {"delay": float(options.emu_delay), "loss": float(options.emu_loss), "rate": float(options.emu_rate), "duplicate": float(options.emu_dup),
+                    "medium_host": str(options.emu_medium_host), "medium_in_port": options.emu_medium_port, "medium_out_port": options.emu_medium_port + 1}
+        if options.emu_channel=='y' or options.emu_channel=='Y':
+            emulator["channel"] = Channel_Model()
+        if options.emu_start_medium=='y' or options.emu_start_medium=='Y':
+            medium = Loopback_Medium(in_port=options.emu_medium_port, out_port=options.emu_medium_port + 1, host='0.0.0.0')   # reachable from the other nodes
+            medium.start()
     
     uav_node = UAV_Node(my_config, node_index=int(options.index), 
                                 l1_debug=(options.l1=='y' or options.l1 == 'Y'), 
@@ -615,7 +807,23 @@ def main():
                                 test_timeout=float(options.test_timeout),
                                 log=(options.log=='y' or options.log=='y'),
                                 log_base_name="~/Documents/usrp-utils/Logs/"+options.file_name,
-                                num_nodes=int(options.num)
+                                num_nodes=int(options.num),
+                                l1_batch_size=int(options.l1_batch),
+                                async_control_plane=(options.async_cp=='y' or options.async_cp=='Y'),
+                                ack_interval=float(options.ack_interval),
+                                l2_window=int(options.l2_window),
+                                l5_rate=float(options.l5_rate),
+                                queue_size=int(options.queue_size),
+                                drop_policy=str(options.drop_policy),
+                                ring_buffers=(options.ring=='y' or options.ring=='Y'),
+                                fused=(options.fused=='y' or options.fused=='Y'),
+                                split_radio=(options.split_radio=='y' or options.split_radio=='Y'),
+                                num_frames=int(options.num_frames),
+                                adaptive_timeout=(options.adaptive_timeout=='y' or options.adaptive_timeout=='Y'),
+                                congestion=str(options.congestion),
+                                neighbor_discovery=(options.nd=='y' or options.nd=='Y'),
+                                cut_through=(options.cut_through=='y' or options.cut_through=='Y'),
+                                emulator=emulator
                                 )
     try:
         uav_node.run()
@@ -37,6 +37,7 @@ class Node_Config():
 		self.tx_gain = tx_gain
 		self.serial = serial
 		self.location_index = location_index
+		self.routes = []	# (destination Node_Config, next hop Node_Config) pairs for layer 3
 
 	def configure_hops(self, src, dest, next_hop, prev_hop):
 		'''
@@ -59,6 +60,29 @@ class Node_Config():
 		else:
 			self.prev_hop = prev_hop
 
+		if next_hop != None:
+			self.add_route(dest, next_hop)
+		if prev_hop != None:
+			self.add_route(src, prev_hop)
+
+	def add_route(self, dest, next_hop):
+		'''
+		Method to add a route to the layer 3 forwarding table of the node, a node can relay any number of flows
+		:param dest: Node_Config Object of the destination
+		:param next_hop: Node_Config Object of the next hop towards the destination
+		'''
+		self.routes = [route for route in self.routes if route[0].pc_ip != dest.pc_ip]
+		self.routes.append((dest, next_hop))
+
+	def relay_flow(self, src, dest):
+		'''
+		Method to add the routes of one more flow through this node, for a relay one hop from both ends of the flow
+		:param src: Node_Config Object of the source of the flow
+		:param dest: Node_Config Object of the destination of the flow
+		'''
+		self.add_route(dest, dest)
+		self.add_route(src, src)
+
 	def get_tranceiver_args(self):
 		'''
 		Method to return string of usrp tranceiver args
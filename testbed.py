@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+'''
+Program to run the six nodes (src/rly/dest of both routes) in one process with no hardware
+Each node gets its own loopback wifi address (127.0.0.x, Linux routes all of 127/8 to lo) for the control plane, its own
+zmq ports to an emulated radio on a shared Loopback_Medium, and is driven through the iterations of a FromCsv scenario
+(positions and tx power per node). Reports the throughput and latency of each node per iteration.
+'''
+
+# global libraries
+
+from argparse import ArgumentParser
+from threading import Thread
+from time import time, sleep
+import csv, json, os, subprocess
+
+# local libraries
+
+from LayerStack import Control_Plane, Layer1, Layer2, Layer3, Layer4, Layer5
+from LayerStack.L1_protocols.Loopback_Radio import Loopback_Medium
+from LayerStack.L1_protocols.Channel_Model import Channel_Model
+from LayerStack.Network_Layer import address_table
+from LayerStack.Dispatcher import Dispatcher
+from Utils.Node_Config import Node_Config
+
+LOOPBACK_PRE = '127.0.0.'
+ZMQ_BASE_PORT = 56000       # node ii uses ZMQ_BASE_PORT + 10*ii and the next port for its radio
+
+def make_configs(freq1=2.0e9, freq2=2.1e9, freq3=2.6e9, tx_gain=0.8, rx_gain=0.95, shared_relays=False):
+    '''
+    Method to build the node configs of the two routes as in UAV_Node, with loopback wifi addresses and per node zmq ports
+    :param freq1: float for the src -> rly frequency in Hz
+    :param freq2: float for the rly -> dest frequency in Hz
+    :param freq3: float for the dest -> src frequency in Hz
+    :param tx_gain: float for the initial normalized tx gain
+    :param rx_gain: float for the normalized rx gain
+    :param shared_relays: bool for both relays to get the routes of both flows, with route 2 sent through rly1 (rly2 stays a standby)
+    :return: list of Node_Config objects in node index order [dest1, rly1, src1, dest2, rly2, src2]
+    '''
+    nodes = [('dest1', 'rx', 104, freq3, freq2, 10), ('rly1', 'rly', 109, freq2, freq1, 24), ('src1', 'tx', 106, freq1, freq3, 0),
+             ('dest2', 'rx', 107, freq3, freq2, 120), ('rly2', 'rly', 108, freq2, freq1, 70), ('src2', 'tx', 110, freq1, freq3, 55)]
+    configs = []
+    for ii, (my_id, role, post, tx_freq, rx_freq, location_index) in enumerate(nodes):
+        ports = [str(ZMQ_BASE_PORT + 10*ii), str(ZMQ_BASE_PORT + 10*ii + 1)]
+        configs.append(Node_Config(pc_ip=LOOPBACK_PRE+str(post), usrp_ip='192.170.10.'+str(post), my_id=my_id, role=role, usrp_ports=ports,
+                                   tx_freq=tx_freq, rx_freq=rx_freq, tx_gain=tx_gain, rx_gain=rx_gain, location_index=location_index))
+    dest1, rly1, src1, dest2, rly2, src2 = configs
+
+    # Configure hops for route 1
+    dest1.configure_hops(src=src1, dest=dest1, next_hop=None,  prev_hop=rly1)
+    rly1.configure_hops( src=src1, dest=dest1, next_hop=dest1, prev_hop=src1)
+    src1.configure_hops( src=src1, dest=dest1, next_hop=rly1,  prev_hop=None)
+
+    # Configure hops for route 2
+    dest2.configure_hops(src=src2, dest=dest2, next_hop=None,  prev_hop=rly2)
+    rly2.configure_hops( src=src2, dest=dest2, next_hop=dest2, prev_hop=src2)
+    src2.configure_hops( src=src2, dest=dest2, next_hop=rly2,  prev_hop=None)
+
+    if shared_relays:   # every relay can forward either flow, rly1 carries both
+        rly1.relay_flow(src=src2, dest=dest2)
+        rly2.relay_flow(src=src1, dest=dest1)
+        src2.add_route(dest2, rly1)
+        dest2.add_route(src2, rly1)
+
+    address_table.register_nodes(configs)
+    return configs
+
+
+class Testbed_Node():
+    def __init__(self, my_config, node_index, broadcast_ips, emulator, num_nodes=6, l5_rate=1000000, num_frames=1, l2_window=1, congestion=None, cut_through=False, ack_interval=0.0, l1_duplicate=True):
+        '''
+        Layer stack of one node wired as in UAV_Node (queues between layers, no drone or neural network)
+        :param my_config: Node_Config object of the node
+        :param node_index: int for the node index number
+        :param broadcast_ips: list of strings for the wifi addresses of all nodes, state broadcasts are sent to each
+        :param emulator: dict of Loopback_Radio settings
+        :param num_nodes: int for the number of nodes to get states from
+        :param l5_rate: float for the layer 5 traffic generation rate in bps
+        :param num_frames: int for the number of l2 frames in one l4 packet
+        :param l2_window: int for the l2 selective repeat window per destination, 1 for stop-and-wait
+        :param congestion: string for the l4 congestion controller ('aimd' or 'delay'), None for a fixed rate
+        :param cut_through: bool for relays to forward each l2 frame on arrival
+        :param ack_interval: float for the time in seconds to coalesce wifi acks, 0 to send each ack
+        :param l1_duplicate: bool for layer 1 to transmit every frame twice, as on the usrp
+        '''
+        self.my_config = my_config
+        self.node_index = node_index
+        self.num_nodes = num_nodes
+        self.state_buf = [None]*(2*num_nodes)
+        self.threads = {}
+
+        self.dispatcher = Dispatcher(name=my_config.id, overflow='inline')
+        self.control_plane = Control_Plane.Control_Plane(my_config.pc_ip, wifi_ip_pre=bytes(LOOPBACK_PRE, "utf-8"), dispatcher=self.dispatcher, ack_interval=ack_interval, bind_ip=my_config.pc_ip, broadcast_ips=broadcast_ips)
+
+        self.layer4 = Layer4.Layer4(my_config, self.control_plane.send_l4_ack, num_frames=num_frames, congestion=congestion, log=False, dispatcher=self.dispatcher)
+        self.layer3 = Layer3.Layer3(my_config)
+        self.layer2 = Layer2.Layer2(my_config.usrp_ip, send_ack=self.control_plane.send_l2_ack, dispatcher=self.dispatcher, num_frames=num_frames, arq_window=l2_window, relay=self.layer3.relay_hop if cut_through else None)
+        self.layer1 = Layer1.Layer1(my_config, input_port=my_config.usrp_in_port, output_port=my_config.usrp_out_port, duplicate=l1_duplicate, emulator=dict(emulator, seed=emulator.get("seed", 0) + node_index))
+        self.layer5 = Layer5.Layer5(my_config, self.layer4, rate=l5_rate)
+        self.stack_layers = [self.layer1, self.layer2, self.layer3, self.layer4]
+
+        # Link layers together
+        self.layer1.init_layers(upper=self.layer2, lower=None)
+        self.layer2.init_layers(upper=self.layer3, lower=self.layer1)
+        self.layer3.init_layers(upper=self.layer4, lower=self.layer2)
+        self.layer4.init_layers(upper=self.layer5, lower=self.layer3)
+        self.layer5.init_layers(upper=None, lower=self.layer4)
+
+    def start(self, stop):
+        '''
+        Method to start the control plane listeners and the layer threads
+        :param stop: function returning true/false to stop the threads
+        '''
+        self.threads["L2_ACK_RCV"] = Thread(target=self.control_plane.listen_l2, args=(self.layer2.recv_ack, stop, self.layer2.recv_acks, ), daemon=True)
+        self.threads["L4_ACK_RCV"] = Thread(target=self.control_plane.listen_l4, args=(self.layer4.recv_ack, stop, self.layer4.recv_acks, ), daemon=True)
+        self.threads["STATE_RCV"] = Thread(target=self.control_plane.listen_cc, args=(self.handle_state, self.handle_get_state, stop, ), daemon=True)
+        if self.control_plane.ack_interval > 0:
+            self.threads["ACK_FLUSH"] = Thread(target=self.control_plane.ack_flush_loop, args=(stop, ), daemon=True)
+        for layer in self.stack_layers:
+            self.threads[layer.layer_name + "_pass_up"] = Thread(target=layer.pass_up, args=(stop, ), daemon=True)
+            for jj in range(layer.window):
+                self.threads[layer.layer_name + "_pass_down_"+str(jj)] = Thread(target=layer.pass_down, args=(stop, ), daemon=True)
+        if self.my_config.role == 'tx':
+            self.threads[self.layer5.layer_name + "_pass_down"] = Thread(target=self.layer5.pass_down, args=(stop, ), daemon=True)
+        elif self.my_config.role == 'rx':
+            self.threads[self.layer5.layer_name + "_pass_up"] = Thread(target=self.layer5.pass_up, args=(stop, ), daemon=True)
+        for thread in self.threads.values():
+            thread.start()
+
+    def close(self):
+        '''
+        Method to stop the emulated radio of the node
+        '''
+        self.layer1.tb.stop()
+        self.layer1.tb.wait()
+        self.dispatcher.stop()
+
+    def handle_state(self, node_index, loc_index, pow_index):
+        '''
+        Method to handle receiving state info from another node
+        :param node_index: int for the node index number
+        :param loc_index: int for the location index number
+        :param pow_index: int for the tx power index number
+        '''
+        self.state_buf[int(node_index)] = int(loc_index)
+        self.state_buf[int(node_index) + self.num_nodes] = int(pow_index)
+
+    def handle_get_state(self):
+        '''
+        Method to handle receiving "I need a state message" message, the testbed broadcasts every state each iteration
+        '''
+        return None
+
+    def set_state(self, position, tx_power):
+        '''
+        Method to move the node and set its tx power for the next iteration, as UAV_Node does from the csv
+        :param position: list of floats for [meters north, meters east]
+        :param tx_power: float for the csv tx power (gain = tx power/90)
+        '''
+        self.layer1.tb.set_position(position)
+        self.layer1.set_tx_gain(float(tx_power)/90)
+
+    def counters(self):
+        '''
+        Method to get the raw counters the iteration results are computed from
+        :return: dict of counter name -> value
+        '''
+        return {"sent": self.layer4.n_sent, "acked": self.layer4.n_rtt, "rtt_sum": self.layer4.rtt_sum, "recv": self.layer4.n_recv,
+                "latency_sum": self.layer4.latency_sum, "l2_cut_through": self.layer2.n_cut_through, "radio_lost": self.layer1.tb.n_lost}
+
+
+def git_commit():
+    '''
+    Method to get the commit the testbed and benchmarks run on, to tag their results
+    :return: string for the short commit hash (+ "-dirty" with local changes), None outside of a git checkout
+    '''
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], stderr=subprocess.DEVNULL).strip()
+        return commit + "-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_scenario(csv_path, configs):
+    '''
+    Method to read the per node iterations of a FromCsv scenario
+    :param csv_path: string for the directory and base name of the csv files (performance_data_<node id>.csv)
+    :param configs: list of Node_Config objects
+    :return: list of iterations, each a list of (position, tx power, run time) per node
+    '''
+    rows = []
+    for config in configs:
+        with open(os.path.expanduser(csv_path+config.id+'.csv'), 'r', newline='') as state_csv:
+            rows.append([([float(row['Loc_y']), float(row['Loc_x'])], float(row['TxPower']), float(row['runTime'])) for row in csv.DictReader(state_csv)])
+    return [list(iteration) for iteration in zip(*rows)]
+
+
+def iteration_results(nodes, before, after, run_time, payload_bits):
+    '''
+    Method to compute the per node results of one iteration from the counters taken before and after it
+    :param nodes: list of Testbed_Node objects
+    :param before: list of counter dicts at the start of the iteration
+    :param after: list of counter dicts at the end of the iteration
+    :param run_time: float for the transmit time of the iteration in seconds
+    :param payload_bits: int for the l5 payload bits of one l4 packet
+    :return: dict of node id -> results
+    '''
+    results = {}
+    for node, start, end in zip(nodes, before, after):
+        delta = {key: end[key] - start[key] for key in end}
+        result = {"role": node.my_config.role}
+        if node.my_config.role == 'tx':
+            result.update({"sent": delta["sent"], "acked": delta["acked"], "throughput": payload_bits*delta["acked"]/run_time,
+                           "rtt": delta["rtt_sum"]/delta["acked"] if delta["acked"] else None})
+        elif node.my_config.role == 'rx':
+            result.update({"recv": delta["recv"],      # counts the copies of the l1 frame duplication
+                           "latency": delta["latency_sum"]/delta["recv"] if delta["recv"] else None})
+        else:
+            result.update({"cut_through_frames": delta["l2_cut_through"]})
+        result["radio_lost"] = delta["radio_lost"]
+        results[node.my_config.id] = result
+    return results
+
+
+def print_results(iteration_num, results):
+    '''
+    Method to print the results of one iteration, one line per node
+    :param iteration_num: int for the iteration number
+    :param results: dict of node id -> results
+    '''
+    print('\n~~ Iteration', iteration_num, ' ~~')
+    for node_id, result in results.items():
+        line = [node_id.ljust(6)]
+        for key, value in result.items():
+            if key == 'role':
+                continue
+            if key in ('rtt', 'latency'):
+                value = None if value is None else str(round(1e3*value, 2))+'ms'
+            elif key == 'throughput':
+                value = str(round(value/1e3, 1))+'kbps'
+            line.append(key+'='+str(value))
+        print(' '.join(line))
+
+
+def run_experiment(options):
+    '''
+    Method to build the six nodes, run the scenario iterations and collect the results
+    :param options: parsed arguments (see arguments_parser)
+    :return: dict of the settings and the per iteration results
+    '''
+    configs = make_configs(freq1=options.f1, freq2=options.f2, freq3=options.f3, shared_relays=(options.shared_relays == 'y' or options.shared_relays == 'Y'))
+    emulator = {"delay": options.delay, "loss": options.loss, "rate": options.rate, "duplicate": options.dup, "seed": options.seed}
+    if options.channel == 'y' or options.channel == 'Y':
+        emulator["channel"] = Channel_Model()
+
+    medium = Loopback_Medium()
+    medium.start()
+    broadcast_ips = [config.pc_ip for config in configs]
+    nodes = [Testbed_Node(config, ii, broadcast_ips, emulator, num_nodes=len(configs), l5_rate=options.l5_rate, num_frames=options.num_frames,
+                          l2_window=options.l2_window, congestion=None if options.congestion == 'none' else options.congestion,
+                          cut_through=(options.cut_through == 'y' or options.cut_through == 'Y'), ack_interval=options.ack_interval,
+                          l1_duplicate=(options.l1_dup == 'y' or options.l1_dup == 'Y'))
+             for ii, config in enumerate(configs)]
+    payload_bits = 8*(nodes[0].layer4.l4_size - nodes[0].layer4.l4_header)
+
+    stop_threads = [False]
+    stop = lambda : stop_threads[0]
+    for node in nodes:
+        node.start(stop)
+    sleep(options.settle)     # zmq subscriptions propagate to the medium
+
+    scenario = read_scenario(options.csv_path, configs)
+    if options.iterations > 0:
+        scenario = scenario[:options.iterations]
+
+    experiment = {"commit": git_commit(), "settings": vars(options), "iterations": []}
+    try:
+        for iteration_num, states in enumerate(scenario):
+            for node, (position, tx_power, _) in zip(nodes, states):
+                node.set_state(position, tx_power)
+                node.state_buf = [None]*(2*len(nodes))
+
+            # Broadcast State
+            for node, (_, tx_power, _) in zip(nodes, states):
+                node.control_plane.broadcast_state(str(node.node_index) + ',0,' + str(int(tx_power)))
+            state_timeout = time() + 1.0
+            while time() < state_timeout and any(None in node.state_buf for node in nodes):
+                sleep(0.01)
+            states_complete = not any(None in node.state_buf for node in nodes)
+
+            # Run throughput test
+            run_time = options.run_time if options.run_time > 0 else max(state[2] for state in states)
+            before = [node.counters() for node in nodes]
+            for node in nodes:
+                if node.my_config.role == 'tx':
+                    node.layer5.transmit = True
+            sleep(run_time)
+            for node in nodes:
+                node.layer5.transmit = False
+            sleep(options.drain)     # acks of the packets in flight
+            after = [node.counters() for node in nodes]
+
+            results = iteration_results(nodes, before, after, run_time, payload_bits)
+            print_results(iteration_num, results)
+            experiment["iterations"].append({"iteration": iteration_num, "run_time": run_time, "states_complete": states_complete, "nodes": results})
+    finally:
+        stop_threads[0] = True
+        for node in nodes:
+            node.close()
+        medium.close()
+
+    return experiment
+
+
+def arguments_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--csv_path', type=str, default='FromCsv/performance_data_', help='dir path and base name of the scenario csvs')
+    parser.add_argument('--iterations', type=int, default=0, help='number of scenario iterations to run, 0 for all')
+    parser.add_argument('--run_time', type=float, default=0.0, help='transmit time per iteration (s), 0 for the csv runTime')
+    parser.add_argument('--drain', type=float, default=0.5, help='time after each iteration for the packets in flight (s)')
+    parser.add_argument('--settle', type=float, default=1.0, help='time before the first iteration (s)')
+    parser.add_argument('--f1', type=float, default=2.0e9, help='freq 1')
+    parser.add_argument('--f2', type=float, default=2.1e9, help='freq 2')
+    parser.add_argument('--f3', type=float, default=2.6e9, help='freq 3')
+    parser.add_argument('--l5_rate', type=float, default=100000, help='layer 5 traffic rate per source (bps)')
+    parser.add_argument('--num_frames', type=int, default=1, help='number of l2 frames per l4 packet')
+    parser.add_argument('--l2_window', type=int, default=1, help='l2 selective repeat window, 1 for stop-and-wait')
+    parser.add_argument('--congestion', type=str, default='none', help='l4 congestion controller (none/aimd/delay)')
+    parser.add_argument('--shared_relays', type=str, default='n', help='both relays get the routes of both flows, rly1 forwards both (y/n)')
+    parser.add_argument('--cut_through', type=str, default='n', help='relays forward l2 frames without l4 reassembly (y/n)')
+    parser.add_argument('--l1_dup', type=str, default='y', help='layer 1 transmits every frame twice (y/n)')
+    parser.add_argument('--ack_interval', type=float, default=0.0, help='wifi ack coalescing interval (s), 0 for none')
+    parser.add_argument('--channel', type=str, default='y', help='loss from the node positions and tx power (y/n)')
+    parser.add_argument('--delay', type=float, default=0.001, help='emulated radio delay (s)')
+    parser.add_argument('--loss', type=float, default=0.0, help='emulated radio frame loss probability')
+    parser.add_argument('--rate', type=float, default=0.0, help='emulated radio tx rate (bps), 0 for no limit')
+    parser.add_argument('--dup', type=float, default=0.0, help='emulated radio frame duplication probability')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the emulated radios')
+    parser.add_argument('--json', type=str, default='', help='file to save the results to')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    options = arguments_parser()
+
+    experiment = run_experiment(options)
+    if options.json:
+        with open(os.path.expanduser(options.json), 'w') as json_file:
+            json.dump(experiment, json_file, indent=1)
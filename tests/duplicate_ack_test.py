@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+'''
+Per ack cost of the l4 duplicate ack check: growing list 'in' vs the windowed Duplicate_Filter
+'''
+
+from time import perf_counter
+from random import randint
+
+from LayerStack.Ack_Tracker import Duplicate_Filter
+
+def list_check(acks):
+    ack_list = []
+    n_dup = 0
+    for pktno in acks:
+        if not pktno in ack_list:
+            ack_list.append(pktno)
+        else:
+            n_dup += 1
+    return n_dup
+
+def filter_check(acks):
+    acked = Duplicate_Filter()
+    n_dup = 0
+    for pktno in acks:
+        if not acked.check(pktno):
+            n_dup += 1
+    return n_dup
+
+if __name__ == '__main__':
+    n = 20000
+    acks = []
+    for pktno in range(1, n+1):
+        acks.append(pktno)
+        if randint(0, 9) == 0:      # ~10% repeated acks, a few packets late
+            acks.append(max(1, pktno - randint(0, 16)))
+
+    tstart = perf_counter()
+    n_list = list_check(acks)
+    t_list = (perf_counter()-tstart)/len(acks)
+
+    tstart = perf_counter()
+    n_filter = filter_check(acks)
+    t_filter = (perf_counter()-tstart)/len(acks)
+
+    assert n_list == n_filter
+    print("duplicates:", n_filter, "of", len(acks))
+    print("list 'in':", round(t_list*1e9), "ns/ack")
+    print("filter:", round(t_filter*1e9), "ns/ack")
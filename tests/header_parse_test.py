@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+'''
+Per packet cost of the l4 -> l3 -> l2 header handling: slicing/concatenation vs precompiled struct views
+'''
+
+import struct
+from time import perf_counter
+
+from LayerStack.Headers import L2_HEADER, L2_HEADER_LEN, L4_HEADER, build_l2, rewrite_addresses, ADDRESSES
+
+def pad(ip, length=20):
+    padded_ip = ip
+    for ii in range(length-len(ip)):
+        padded_ip = padded_ip + struct.pack('x')
+    return padded_ip
+
+def unpad(padded_ip):
+    num = padded_ip.count(struct.pack('x'))
+    return padded_ip[:-num]
+
+src_pc = b'192.168.10.106'
+dest_pc = b'192.168.10.104'
+my_usrp = b'192.170.10.106'
+nh_usrp = b'192.170.10.109'
+chunk_size = 158
+
+l4_packet = struct.pack('l', 1) + pad(src_pc) + pad(dest_pc) + struct.pack('d', 0.0) + 144*b'1'
+
+def sliced():
+    '''
+    header handling as done with bytes slicing
+    '''
+    # l4 pass_down
+    unpad(l4_packet[8:28])
+    struct.unpack('L', l4_packet[0:8])
+    chunk = l4_packet[0:chunk_size]
+    l2_packet = struct.pack('H', 1) + l4_packet[8:28] + l4_packet[28:48] + chunk
+    # l3 pass_down
+    unpad(l2_packet[22:42])
+    l3_packet = l2_packet[0:2] + pad(my_usrp) + pad(nh_usrp) + l2_packet[42:]
+    # l2 pass_up
+    struct.unpack('h', l3_packet[0:2])
+    unpad(l3_packet[22:42])
+    unpad(l3_packet[2:22])
+    up = l3_packet[42:]
+    # l4 pass_up
+    unpad(up[8:28])
+    unpad(up[28:48])
+    return up[56:]
+
+def viewed():
+    '''
+    header handling with precompiled structs over memoryviews
+    '''
+    # l4 pass_down
+    pktno, source, destination, _ = L4_HEADER.unpack_from(l4_packet)
+    source.rstrip(b'\x00')
+    frame = build_l2(1, source, destination, memoryview(l4_packet)[0:chunk_size])
+    # l3 pass_down
+    ADDRESSES.unpack_from(frame, 2)[1].rstrip(b'\x00')
+    rewrite_addresses(frame, my_usrp, nh_usrp)
+    # l2 pass_up
+    pktno_mac, mac_source, mac_destination = L2_HEADER.unpack_from(frame)
+    mac_source.rstrip(b'\x00')
+    mac_destination.rstrip(b'\x00')
+    up = memoryview(frame)[L2_HEADER_LEN:]
+    # l4 pass_up
+    pktno, source, destination, _ = L4_HEADER.unpack_from(up)
+    source.rstrip(b'\x00')
+    destination.rstrip(b'\x00')
+    return up[56:]
+
+def time_per_packet(fn, n):
+    tstart = perf_counter()
+    for ii in range(n):
+        fn()
+    return (perf_counter()-tstart)/n
+
+if __name__ == '__main__':
+    n = 100000
+    assert bytes(sliced()) == bytes(viewed())
+    t_sliced = time_per_packet(sliced, n)
+    t_viewed = time_per_packet(viewed, n)
+    print("sliced:", round(t_sliced*1e9), "ns/pkt")
+    print("viewed:", round(t_viewed*1e9), "ns/pkt")
+    print("speedup:", round(t_sliced/t_viewed, 2))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+'''
+Micro benchmarks of the per frame operations of each layer (run on every frame at every hop): ns/op and allocations/op
+Saves the results as json and flags the operations that got slower than a previous run (exit status 1 on a regression)
+Run from the repo root: python3 tests/micro_benchmark_test.py --json Logs/micro_<commit>.json [--compare Logs/micro_<old commit>.json]
+'''
+
+import json, os, sys, timeit, tracemalloc
+from argparse import ArgumentParser
+from statistics import median
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))     # repo root, for testbed and LayerStack
+
+from testbed import make_configs, git_commit
+from LayerStack import Control_Plane, Layer2, Layer3, Layer4, Layer5
+from LayerStack.Headers import L4_HEADER, L4_PKTNO, TIME_SENT, build_l2
+
+def operations():
+    '''
+    Method to build the layers of a src -> rly route and the operations to time on them
+    :return: list of (string operation name, function running one operation)
+    '''
+    dest, rly, src = make_configs()[:3]
+    src_pc, dest_pc = bytes(src.pc_ip, "utf-8"), bytes(dest.pc_ip, "utf-8")
+    rly_usrp, other_usrp = bytes(rly.usrp_ip, "utf-8"), b'192.170.10.200'
+
+    layer4 = Layer4.Layer4(src, None, log=False)
+    layer3 = Layer3.Layer3(src)
+    layer2 = Layer2.Layer2(src.usrp_ip)
+    layer5 = Layer5.Layer5(src, layer4)
+
+    padded_dest = layer3.pad(dest_pc)
+    padded_unknown = layer3.pad(b'10.0.0.1')
+
+    # l4 fragmentation into a list instead of the l3 queue
+    frames = []
+    layer4.send_down = frames.append
+    template, time_offset = layer5.packet_template()
+    l4_view = memoryview(template)
+    (_, source, destination, _) = L4_HEADER.unpack_from(template)
+    def fragment():
+        layer4.send_frames(l4_view, source, destination)
+        frames.clear()
+
+    # l5 packet construction as in Layer5.pass_down
+    def build_packet():
+        packet = bytearray(template)
+        L4_PKTNO.pack_into(packet, 0, 1)
+        TIME_SENT.pack_into(packet, time_offset, time())
+        return packet
+
+    # l2 header parsing of a frame heard from the relay for another node (dropped after the destination check)
+    overheard = build_l2(1, layer2.pad(rly_usrp), layer2.pad(other_usrp), memoryview(template)[:layer4.chunk_size])
+
+    return [("Network_Layer.pad", lambda : layer3.pad(dest_pc)),
+            ("Network_Layer.pad unknown", lambda : layer3.pad(b'10.0.0.1')),
+            ("Network_Layer.unpad", lambda : layer3.unpad(padded_dest)),
+            ("Network_Layer.unpad unknown", lambda : layer3.unpad(padded_unknown)),
+            ("Layer3.determine_mac", lambda : layer3.determine_mac(dest_pc)),
+            ("Layer2.handle_up header", lambda : layer2.handle_up(overheard)),
+            ("Layer4.send_frames", fragment),
+            ("Layer5 packet", build_packet),
+            ("Control_Plane.get_post_ip", lambda : Control_Plane.get_post_ip(rly_usrp))]
+
+def time_operation(operation, repeat=5, min_time=0.2):
+    '''
+    Method to time one operation, timeit style: calibrate the loop count then keep the best and median of the repeats
+    :param operation: function running one operation
+    :param repeat: int for the number of timed loops
+    :param min_time: float for the min seconds of one timed loop
+    :return: dict of the best and median ns/op and the loop count
+    '''
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    number = max(number, int(number*min_time/0.2))
+    times = [loop_time/number for loop_time in timer.repeat(repeat=repeat, number=number)]
+    return {"ns_per_op": 1e9*min(times), "median_ns_per_op": 1e9*median(times), "loops": number}
+
+def count_allocations(operation, n=1000):
+    '''
+    Method to measure the memory an operation allocates (tracemalloc is on only here, it slows every allocation down)
+    :param operation: function running one operation
+    :param n: int for the number of operations measured
+    :return: dict of the mean peak bytes allocated in one operation and the bytes still held after it
+    '''
+    operation()     # first call caches (address table, struct formats) are not per op
+    tracemalloc.start()
+    peak_sum = 0
+    start, _ = tracemalloc.get_traced_memory()
+    for ii in range(n):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_sum += peak - before
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"alloc_bytes_per_op": peak_sum/n, "retained_bytes_per_op": (end - start)/n}
+
+def compare(results, baseline, threshold):
+    '''
+    Method to print the change of each operation from a previous run
+    :param results: dict of the benchmark results
+    :param baseline: dict of the results of a previous run
+    :param threshold: float for the relative ns/op increase counted as a regression
+    :return: list of the names of the regressed operations
+    '''
+    print("\n~~ Change from", baseline.get("commit"), "~~")
+    regressions = []
+    for name, result in results["operations"].items():
+        old = baseline["operations"].get(name)
+        if old is None:
+            continue
+        change = (result["ns_per_op"] - old["ns_per_op"])/old["ns_per_op"]
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print(name.ljust(30), str(round(old["ns_per_op"])).rjust(7), "->", str(round(result["ns_per_op"])).rjust(7), "ns/op",
+              ("+" if change >= 0 else "") + str(round(100*change, 1)) + "%", flag)
+    return regressions
+
+def arguments_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed loops per operation')
+    parser.add_argument('--min_time', type=float, default=0.2, help='min time of one timed loop (s)')
+    parser.add_argument('--alloc_ops', type=int, default=1000, help='number of operations traced for the allocations')
+    parser.add_argument('--filter', type=str, default='', help='only run the operations with this in their name')
+    parser.add_argument('--json', type=str, default='', help='file to save the results to')
+    parser.add_argument('--compare', type=str, default='', help='results file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative ns/op increase reported as a regression')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    options = arguments_parser()
+
+    results = {"commit": git_commit(), "python": sys.version.split()[0], "operations": {}}
+    print("operation".ljust(30), "ns/op".rjust(7), "median".rjust(7), "alloc B/op".rjust(11), "retained B/op".rjust(14))
+    for name, operation in operations():
+        if options.filter not in name:
+            continue
+        result = time_operation(operation, options.repeat, options.min_time)
+        result.update(count_allocations(operation, options.alloc_ops))
+        results["operations"][name] = result
+        print(name.ljust(30), str(round(result["ns_per_op"])).rjust(7), str(round(result["median_ns_per_op"])).rjust(7),
+              str(round(result["alloc_bytes_per_op"], 1)).rjust(11), str(round(result["retained_bytes_per_op"], 1)).rjust(14))
+
+    regressions = []
+    if options.compare:
+        with open(os.path.expanduser(options.compare), 'r') as json_file:
+            regressions = compare(results, json.load(json_file), options.threshold)
+    if options.json:
+        with open(os.path.expanduser(options.json), 'w') as json_file:
+            json.dump(results, json_file, indent=1)
+    if regressions:
+        sys.exit(1)
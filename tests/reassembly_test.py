@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+'''
+Per packet cost of rebuilding l4 packets from l2 frames: the previous in order bytearray append vs the preallocated Reassembler
+'''
+
+from time import perf_counter
+from random import shuffle
+
+from LayerStack.Headers import L2_HEADER_LEN
+from LayerStack.Fragmenter import Fragmenter, Reassembler
+
+chunk_size = 158
+source = b'192.168.10.101'
+destination = b'192.168.10.106'
+
+class Append_Rebuild():
+    def __init__(self, num_frames):
+        self.num_frames = num_frames
+        self.mac_pkt_dict = {}
+        self.up_pkt = {}
+
+    def add(self, source, frame_index, chunk):
+        if frame_index == 1:
+            self.up_pkt[source] = bytearray(chunk)
+        elif frame_index == self.mac_pkt_dict.get(source, 1) + 1 and self.up_pkt.get(source):
+            self.up_pkt[source] += chunk
+        else:   # out of order frame, the packet is lost
+            self.up_pkt[source] = b''
+            self.mac_pkt_dict[source] = 1
+            return None
+        self.mac_pkt_dict[source] = frame_index
+        if frame_index == self.num_frames:
+            up_pkt = self.up_pkt[source]
+            self.up_pkt[source] = b''
+            self.mac_pkt_dict[source] = 1
+            return up_pkt
+
+if __name__ == '__main__':
+    n = 2000
+    for num_frames in [1, 4, 15, 127]:
+        l4_packet = bytes(range(256))*(num_frames*chunk_size//256 + 1)
+        l4_packet = l4_packet[:num_frames*chunk_size]
+        fragmenter = Fragmenter(num_frames, chunk_size)
+        frames = fragmenter.fragment(memoryview(l4_packet), source, destination)
+
+        append = Append_Rebuild(num_frames)
+        tstart = perf_counter()
+        for ii in range(n):
+            for frame in frames:
+                up_pkt = append.add(source, frame[0], memoryview(frame)[L2_HEADER_LEN:])
+        t_append = (perf_counter()-tstart)/n
+        assert bytes(up_pkt) == l4_packet
+
+        reassembler = Reassembler(num_frames, chunk_size)
+        tstart = perf_counter()
+        for ii in range(n):
+            for frame in frames:
+                up_pkt = reassembler.add(source, frame[0], memoryview(frame)[L2_HEADER_LEN:])
+        t_reassemble = (perf_counter()-tstart)/n
+        assert bytes(up_pkt) == l4_packet
+
+        shuffled = list(frames)     # out of order arrival
+        shuffle(shuffled)
+        for frame in shuffled:
+            up_pkt = reassembler.add(source, frame[0], memoryview(frame)[L2_HEADER_LEN:])
+        assert bytes(up_pkt) == l4_packet
+
+        print(num_frames, "frames: append", round(t_append*1e6, 2), "us/pkt, reassembler", round(t_reassemble*1e6, 2), "us/pkt")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+'''
+Per frame cost of handing 200 byte frames from one thread to another: queue.Queue/Layer_Queue vs the SPSC Ring_Buffer
+'''
+
+from threading import Thread
+from queue import Queue
+from time import perf_counter
+
+from LayerStack.Ring_Buffer import Ring_Buffer
+from LayerStack.Layer_Queue import Layer_Queue
+
+def time_per_frame(link, n, frame, batch=1):
+    def produce():
+        if batch > 1:
+            for ii in range(n//batch):
+                link.put_batch([frame]*batch)
+        else:
+            for ii in range(n):
+                link.put(frame, True)
+
+    producer = Thread(target=produce)
+    tstart = perf_counter()
+    producer.start()
+    if batch > 1:
+        received = 0
+        while received < n:
+            received += len(link.get_batch(batch))
+    else:
+        for ii in range(n):
+            link.get(True)
+    producer.join()
+    return (perf_counter()-tstart)/n
+
+if __name__ == '__main__':
+    n = 200000
+    frame = bytes(200)
+    t_queue = time_per_frame(Queue(1024), n, frame)
+    t_layer_queue = time_per_frame(Layer_Queue(1024), n, frame)
+    t_ring = time_per_frame(Ring_Buffer(1024, 200), n, frame)
+    t_ring_batch = time_per_frame(Ring_Buffer(1024, 200), n, frame, batch=32)
+    print("queue.Queue:", round(t_queue*1e9), "ns/frame")
+    print("Layer_Queue:", round(t_layer_queue*1e9), "ns/frame")
+    print("ring:", round(t_ring*1e9), "ns/frame")
+    print("ring, batches of 32:", round(t_ring_batch*1e9), "ns/frame")
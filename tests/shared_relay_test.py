@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+'''
+Check of the shared relay routes of testbed.make_configs: each relay forwards the frames of both flows to their destination,
+through layer 3 (reassembled at the relay) and through the l2 cut-through path
+Run from the repo root: python3 tests/shared_relay_test.py
+'''
+
+import os, sys
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))     # repo root, for testbed and LayerStack
+
+from testbed import make_configs
+from LayerStack import Layer2, Layer3
+from LayerStack.Headers import L2_HEADER, L4_HEADER, build_l2
+
+def forwarded_by_layer3(relay, src, dest):
+    '''
+    Method to route an l4 frame of the src -> dest flow on the relay
+    :return: tuple of (bytes l2 source, bytes l2 destination) of the forwarded frame
+    '''
+    layer3 = Layer3.Layer3(relay)
+    frames = []
+    layer3.send_down = frames.append
+    chunk = L4_HEADER.pack(1, bytes(src.pc_ip, "utf-8"), bytes(dest.pc_ip, "utf-8"), 0.0)
+    layer3.handle_down(build_l2(1, bytes(src.pc_ip, "utf-8"), bytes(dest.pc_ip, "utf-8"), chunk))
+    assert len(frames) == 1, relay.id + " has no route to " + dest.id
+    (_, source, destination) = L2_HEADER.unpack_from(frames[0])
+    return layer3.unpad(source), layer3.unpad(destination)
+
+def forwarded_by_cut_through(relay, src, dest):
+    '''
+    Method to pass an l2 frame of the src -> dest flow, sent by the src to the relay, through the relay cut-through path
+    :return: tuple of (bytes l2 source, bytes l2 destination) of the forwarded frame
+    '''
+    layer3 = Layer3.Layer3(relay)
+    layer2 = Layer2.Layer2(relay.usrp_ip, send_ack=lambda pktno, dest : None, relay=layer3.relay_hop)
+    layer2.prev_down_queue = Queue()
+    chunk = L4_HEADER.pack(1, bytes(src.pc_ip, "utf-8"), bytes(dest.pc_ip, "utf-8"), 0.0)
+    layer2.handle_up(build_l2(1, bytes(src.usrp_ip, "utf-8"), bytes(relay.usrp_ip, "utf-8"), chunk))
+    assert layer2.n_cut_through == 1, relay.id + " did not forward the frame for " + dest.id
+    (_, source, destination) = L2_HEADER.unpack_from(layer2.prev_down_queue.get_nowait())
+    return layer2.unpad(source), layer2.unpad(destination)
+
+if __name__ == '__main__':
+    dest1, rly1, src1, dest2, rly2, src2 = make_configs(shared_relays=True)
+
+    for relay in [rly1, rly2]:
+        for src, dest in [(src1, dest1), (src2, dest2)]:
+            expected = (bytes(relay.usrp_ip, "utf-8"), bytes(dest.usrp_ip, "utf-8"))
+            assert forwarded_by_layer3(relay, src, dest) == expected, relay.id + " l3 next hop for " + dest.id
+            assert forwarded_by_cut_through(relay, src, dest) == expected, relay.id + " cut-through next hop for " + dest.id
+            print(relay.id, "forwards", src.id, "->", dest.id)
+
+    # both flows are sent through rly1
+    for src, dest in [(src1, dest1), (src2, dest2)]:
+        assert forwarded_by_layer3(src, src, dest)[1] == bytes(rly1.usrp_ip, "utf-8"), src.id + " next hop is not rly1"
+    print("src1 and src2 send through rly1")
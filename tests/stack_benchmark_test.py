@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+'''
+End to end benchmark of the layer stack: l5 -> l1 at the sources, through the relays to l5 at the destinations, over the emulated radio
+Reports packets/s, goodput, rtt percentiles, cpu time per layer, queue depths and allocations, and saves them as json to compare commits
+Run from the repo root: python3 tests/stack_benchmark_test.py --json Logs/bench_<commit>.json [--compare Logs/bench_<old commit>.json]
+'''
+
+import gc, json, os, sys
+from argparse import ArgumentParser
+from threading import Thread
+from time import sleep, process_time, clock_gettime, pthread_getcpuclockid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))     # repo root, for testbed and LayerStack
+
+from testbed import make_configs, git_commit, Testbed_Node
+from LayerStack.L1_protocols.Loopback_Radio import Loopback_Medium
+from LayerStack.L1_protocols.Channel_Model import Channel_Model
+
+COMPARED = [("packets_per_s", 1, ""), ("goodput_bps", 1, ""), ("rtt_p50", 1e3, "ms"), ("rtt_p99", 1e3, "ms"), ("cpu_us_per_packet", 1, "")]     # total, print scale, unit
+
+def percentile(samples, q):
+    '''
+    Method to get a percentile of a list of samples (nearest rank)
+    :param samples: list of floats
+    :param q: float for the percentile (0.0-1.0)
+    :return: float for the sample at the percentile, None if there are no samples
+    '''
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q*len(ordered)))]
+
+def thread_groups(node):
+    '''
+    Method to get the threads of a node with the stack part they run
+    :param node: Testbed_Node object
+    :return: list of (string group name, Thread) tuples
+    '''
+    groups = []
+    for name, thread in node.threads.items():
+        groups.append((name.split("_pass_")[0] if "_pass_" in name else "control_plane", thread))
+    groups += [("radio", thread) for thread in node.layer1.tb.threads]
+    groups += [("dispatcher", thread) for thread in node.dispatcher.workers]
+    return groups
+
+def cpu_times(nodes):
+    '''
+    Method to read the cpu time of every stack thread
+    :param nodes: list of Testbed_Node objects
+    :return: dict of node id -> dict of group name -> seconds
+    '''
+    times = {}
+    for node in nodes:
+        node_times = times.setdefault(node.my_config.id, {})
+        for group, thread in thread_groups(node):
+            if thread.ident is None or not thread.is_alive():
+                continue
+            node_times[group] = node_times.get(group, 0.0) + clock_gettime(pthread_getcpuclockid(thread.ident))
+    return times
+
+def allocation_counters():
+    '''
+    Method to read the interpreter allocation counters
+    :return: dict of the allocated memory blocks and the gc collections per generation
+    '''
+    return {"blocks": sys.getallocatedblocks(), "collections": [generation["collections"] for generation in gc.get_stats()]}
+
+class Queue_Sampler():
+    def __init__(self, nodes, interval=0.01):
+        '''
+        Object to sample the depth of every layer queue while the benchmark runs
+        :param nodes: list of Testbed_Node objects
+        :param interval: float for the time between samples in seconds
+        '''
+        self.queues = [(node.my_config.id, queue) for node in nodes for layer in node.stack_layers + [node.layer5] for queue in (layer.up_queue, layer.down_queue)]
+        self.interval = interval
+        self.depth_sum = [0]*len(self.queues)
+        self.depth_max = [0]*len(self.queues)
+        self.n_samples = 0
+
+    def run(self, stop):
+        '''
+        Method to sample the queue depths until stopped
+        :param stop: function returning true/false to stop the thread
+        '''
+        while not stop():
+            for ii, (_, queue) in enumerate(self.queues):
+                depth = queue.qsize()
+                self.depth_sum[ii] += depth
+                if depth > self.depth_max[ii]:
+                    self.depth_max[ii] = depth
+            self.n_samples += 1
+            sleep(self.interval)
+
+    def results(self):
+        '''
+        Method to get the sampled depths
+        :return: dict of node id -> dict of queue name -> mean and max sampled depth and the drops of the queue
+        '''
+        results = {}
+        for ii, (node_id, queue) in enumerate(self.queues):
+            results.setdefault(node_id, {})[queue.name] = {"mean_depth": self.depth_sum[ii]/self.n_samples if self.n_samples else 0.0,
+                                                           "max_depth": self.depth_max[ii], "dropped": queue.stats().get("dropped", 0)}
+        return results
+
+def run_benchmark(options):
+    '''
+    Method to run the stack for the warm up and the measured duration and collect the results
+    :param options: parsed arguments (see arguments_parser)
+    :return: dict of the settings and results
+    '''
+    configs = make_configs()
+    emulator = {"delay": options.delay, "loss": options.loss, "rate": options.rate, "duplicate": options.dup, "seed": options.seed}
+    if options.channel == 'y' or options.channel == 'Y':
+        emulator["channel"] = Channel_Model()
+
+    medium = Loopback_Medium()
+    medium.start()
+    broadcast_ips = [config.pc_ip for config in configs]
+    nodes = [Testbed_Node(config, ii, broadcast_ips, emulator, num_nodes=len(configs), l5_rate=options.l5_rate, num_frames=options.num_frames,
+                          l2_window=options.l2_window, congestion=None if options.congestion == 'none' else options.congestion,
+                          cut_through=(options.cut_through == 'y' or options.cut_through == 'Y'), l1_duplicate=(options.l1_dup == 'y' or options.l1_dup == 'Y'))
+             for ii, config in enumerate(configs)]
+    sources = [node for node in nodes if node.my_config.role == 'tx'][:options.routes]
+    payload_bits = 8*(nodes[0].layer4.l4_size - nodes[0].layer4.l4_header)
+
+    stop_threads = [False]
+    stop = lambda : stop_threads[0]
+    for node in nodes:
+        node.start(stop)
+    sleep(options.settle)     # zmq subscriptions propagate to the medium
+
+    try:
+        for node in sources:
+            node.layer5.transmit = True
+        sleep(options.warmup)
+
+        # Measured run
+        sampler = Queue_Sampler(nodes, options.sample_interval)
+        stop_sampler = [False]
+        sampler_thread = Thread(target=sampler.run, args=(lambda : stop_sampler[0], ), daemon=True)
+        before = [node.counters() for node in nodes]
+        for node in sources:
+            node.layer4.rtt_samples = []
+        cpu_before = cpu_times(nodes)
+        process_before = process_time()
+        alloc_before = allocation_counters()
+        sampler_thread.start()
+
+        sleep(options.duration)
+        for node in sources:
+            node.layer5.transmit = False
+        sleep(options.drain)     # acks of the packets in flight
+
+        stop_sampler[0] = True
+        sampler_thread.join()
+        alloc_after = allocation_counters()
+        process_after = process_time()
+        cpu_after = cpu_times(nodes)
+        after = [node.counters() for node in nodes]
+    finally:
+        stop_threads[0] = True
+        for node in nodes:
+            node.close()
+        medium.close()
+
+    # Results
+    routes = {}
+    acked_total = 0
+    rtts = []
+    for node in sources:
+        start, end = before[node.node_index], after[node.node_index]
+        acked = end["acked"] - start["acked"]
+        acked_total += acked
+        rtts += node.layer4.rtt_samples
+        routes[node.my_config.id] = {"sent": end["sent"] - start["sent"], "acked": acked, "packets_per_s": acked/options.duration,
+                                     "goodput_bps": payload_bits*acked/options.duration, "rtt_mean": sum(node.layer4.rtt_samples)/acked if acked else None,
+                                     "rtt_p50": percentile(node.layer4.rtt_samples, 0.5), "rtt_p99": percentile(node.layer4.rtt_samples, 0.99)}
+
+    cpu = {node_id: {group: seconds - cpu_before.get(node_id, {}).get(group, 0.0) for group, seconds in groups.items()} for node_id, groups in cpu_after.items()}
+    cpu_layers = {}
+    for groups in cpu.values():
+        for group, seconds in groups.items():
+            cpu_layers[group] = cpu_layers.get(group, 0.0) + seconds
+    process_cpu = process_after - process_before
+
+    totals = {"acked": acked_total, "packets_per_s": acked_total/options.duration, "goodput_bps": payload_bits*acked_total/options.duration,
+              "rtt_p50": percentile(rtts, 0.5), "rtt_p99": percentile(rtts, 0.99), "cpu_s": process_cpu,
+              "cpu_us_per_packet": 1e6*process_cpu/acked_total if acked_total else None}
+    allocations = {"net_blocks": alloc_after["blocks"] - alloc_before["blocks"],
+                   "gc_collections": [end - start for start, end in zip(alloc_before["collections"], alloc_after["collections"])],
+                   "gc_threshold": gc.get_threshold()[0]}     # a gen 0 collection runs every threshold net container allocations
+    allocations["gc_collections_per_packet"] = allocations["gc_collections"][0]/acked_total if acked_total else None
+
+    return {"commit": git_commit(), "python": sys.version.split()[0], "settings": vars(options), "totals": totals, "routes": routes,
+            "cpu_per_layer_us_per_packet": {group: 1e6*seconds/acked_total if acked_total else None for group, seconds in sorted(cpu_layers.items())},
+            "cpu": cpu, "queues": sampler.results(), "allocations": allocations,
+            "radio": {node.my_config.id: node.layer1.tb.stats() for node in nodes}}
+
+def print_results(results, baseline=None):
+    '''
+    Method to print the benchmark summary, and the change from a previous run
+    :param results: dict of the benchmark results
+    :param baseline: dict of the results of a previous run, None to skip the comparison
+    '''
+    print("\n~~ Stack benchmark", results["commit"], "~~")
+    for key, value in results["totals"].items():
+        print(key.ljust(20), value if value is None or not key.startswith("rtt") else str(round(1e3*value, 2)) + "ms")
+    print("cpu per layer (us/packet):")
+    for group, value in results["cpu_per_layer_us_per_packet"].items():
+        print("   ", group.ljust(16), None if value is None else round(value, 1))
+    print("max queue depths:", {node_id + "/" + name: queue["max_depth"] for node_id, queues in results["queues"].items() for name, queue in queues.items() if queue["max_depth"] > 0})
+    print("allocations:", results["allocations"])
+
+    if baseline is not None:
+        print("\n~~ Change from", baseline.get("commit"), "~~")
+        for key, scale, unit in COMPARED:
+            old, new = baseline["totals"].get(key), results["totals"].get(key)
+            if old is None or new is None:
+                continue
+            change = 100.0*(new - old)/old if old else 0.0
+            print(key.ljust(20), round(old*scale, 3), "->", round(new*scale, 3), unit, "(" + ("+" if change >= 0 else "") + str(round(change, 1)) + "%)")
+
+def arguments_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--duration', type=float, default=10.0, help='measured transmit time (s)')
+    parser.add_argument('--warmup', type=float, default=2.0, help='transmit time before measuring (s)')
+    parser.add_argument('--drain', type=float, default=0.5, help='time after the measured run for the packets in flight (s)')
+    parser.add_argument('--settle', type=float, default=1.0, help='time before transmitting (s)')
+    parser.add_argument('--sample_interval', type=float, default=0.01, help='time between queue depth samples (s)')
+    parser.add_argument('--routes', type=int, default=2, help='number of routes transmitting (1 or 2)')
+    parser.add_argument('--l5_rate', type=float, default=300e3, help='layer 5 offered load per source (bps), above the stack capacity the rtt is the l3 queueing')
+    parser.add_argument('--num_frames', type=int, default=1, help='number of l2 frames per l4 packet')
+    parser.add_argument('--l2_window', type=int, default=1, help='l2 selective repeat window, 1 for stop-and-wait')
+    parser.add_argument('--congestion', type=str, default='none', help='l4 congestion controller (none/aimd/delay)')
+    parser.add_argument('--cut_through', type=str, default='n', help='relays forward l2 frames without l4 reassembly (y/n)')
+    parser.add_argument('--l1_dup', type=str, default='y', help='layer 1 transmits every frame twice (y/n)')
+    parser.add_argument('--channel', type=str, default='n', help='loss from the node positions and tx power (y/n)')
+    parser.add_argument('--delay', type=float, default=0.001, help='emulated radio delay (s)')
+    parser.add_argument('--loss', type=float, default=0.0, help='emulated radio frame loss probability')
+    parser.add_argument('--rate', type=float, default=0.0, help='emulated radio tx rate (bps), 0 for no limit')
+    parser.add_argument('--dup', type=float, default=0.0, help='emulated radio frame duplication probability')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the emulated radios')
+    parser.add_argument('--json', type=str, default='', help='file to save the results to')
+    parser.add_argument('--compare', type=str, default='', help='results file of a previous run to compare with')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    options = arguments_parser()
+
+    results = run_benchmark(options)
+    baseline = None
+    if options.compare:
+        with open(os.path.expanduser(options.compare), 'r') as json_file:
+            baseline = json.load(json_file)
+    print_results(results, baseline)
+    if options.json:
+        with open(os.path.expanduser(options.json), 'w') as json_file:
+            json.dump(results, json_file, indent=1)